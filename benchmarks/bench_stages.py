@@ -0,0 +1,508 @@
+"""各处理阶段的微基准测试
+
+使用固定的合成数据分别测量各热点阶段的耗时：
+    - decode:              on_message 中的十六进制解码
+    - update_plot:         周期数据累积
+    - detect_pulses:       每个周期（或一批256个周期）的脉冲提取
+    - classify:            1/48个传感器的放电类型识别（由相位分布计算指纹参数并识别）
+    - alarm_add_cycle:     每个周期评估默认报警规则（无越限和持续越限两种情况，含每64个周期一次的变化点检测）
+    - changepoint:         一批64个周期的变化点检测（特征计算和CUSUM更新）
+    - noise_floor:         每个周期的噪声底更新和去除噪声底
+    - trend_add_cycle:     每个周期加入长期趋势聚合（每50个周期为一秒，含每秒一次的特征计算）
+    - correlate:           4/48个传感器1秒（50个周期，每个传感器每周期5个脉冲）的脉冲关联
+    - draw_prpd/draw_prps: 50/200/800个累积周期、mV和dBm单位下的绘图（含Agg渲染）
+    - save_cycle_data:     1/256条周期数据写入并等待写入线程提交（sync），包括插入和特征计算
+    - save_cycle_data_block: 启用压缩时256个周期（一个数据块）的写入并等待提交
+    - get_cycle_data_by_time: 按时间范围查询周期数据
+    - cyclelog_append/cyclelog_read_range: 内存映射周期日志的写入和按时间范围读取
+    - history_update_chart:   HistoricalChartsDialog.update_chart（解析文本数据并绘图）
+
+Qt使用offscreen平台无界面运行，图形由Agg光栅化。
+结果可以保存为JSON，用于不同版本之间的比较。
+
+用法示例:
+    python benchmarks/bench_stages.py --output stages.json
+    python benchmarks/bench_stages.py --filter draw_ --compare stages.json
+    python benchmarks/bench_stages.py --module gis_pd_mqtt_gui_v12 --output v12.json
+"""
+import os
+import sys
+import gc
+import json
+import time
+import queue
+import sqlite3
+import argparse
+import datetime
+import platform
+import tempfile
+import importlib
+import itertools
+
+# 无界面运行
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from PySide6.QtWidgets import QApplication
+
+from pd_synth import make_frame_pool, make_cycle_matrix, with_sequence
+
+# 已注册的基准测试: [(名称, 参数字典, setup函数)]
+BENCHMARKS = []
+
+
+def benchmark(name, **params):
+    """注册基准测试
+
+    被装饰的函数接收上下文和参数，完成准备工作后返回被测的无参函数。
+    params中的每个参数为取值列表，按笛卡尔积展开。
+    """
+    def decorator(setup):
+        keys = list(params.keys())
+        for values in itertools.product(*(params[k] for k in keys)):
+            BENCHMARKS.append((name, dict(zip(keys, values)), setup))
+        return setup
+    return decorator
+
+
+class DiscardQueue(queue.Queue):
+    """丢弃所有消息的队列，使decode测试不受队列状态影响"""
+    def put_nowait(self, item):
+        pass
+
+
+class FakeMessage:
+    """模拟paho的MQTTMessage"""
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+class Context:
+    """基准测试上下文，缓存被测模块、Qt应用和主窗口"""
+    def __init__(self, module, work_dir):
+        self.module = module
+        self.work_dir = work_dir
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self._window = None
+        self.case = 0  # 测试用例序号，用于生成独立的数据库文件名
+        self.resources = []  # 当前测试用例打开的数据库管理器和周期日志，用例结束时关闭
+
+    def track(self, resource):
+        """登记需要在测试用例结束时关闭的对象"""
+        self.resources.append(resource)
+        return resource
+
+    def new_db_manager(self, name, **kwargs):
+        """为当前测试用例创建使用独立数据库文件的数据库管理器"""
+        path = os.path.join(self.work_dir, f"{self.case}_{name}")
+        return self.track(self.module.DatabaseManager(path, **kwargs))
+
+    def teardown(self):
+        """关闭当前测试用例打开的对象（等待写入线程结束）"""
+        while self.resources:
+            resource = self.resources.pop()
+            close = getattr(resource, "close", None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    print(f"关闭 {type(resource).__name__} 错误: {e}", flush=True)
+        self.case += 1
+
+    def close(self):
+        self.teardown()
+        if self._window is not None:
+            self._window.close()
+            self._window = None
+
+    def window(self):
+        """创建（或复用）主窗口，数据库重定向到临时目录，并停止所有定时器
+
+        不论保存的存储设置（分区存储、周期日志）如何，都使用临时目录中的单文件数据库。
+        """
+        if self._window is None:
+            module = self.module
+            original = getattr(module, "DatabaseManager", None)
+            original_create = getattr(module.MainWindow, "create_db_manager", None)
+            if original is not None:
+                db_path = os.path.join(self.work_dir, "window.db")
+                module.DatabaseManager = lambda *args, **kwargs: original(db_path)
+                if original_create is not None:
+                    module.MainWindow.create_db_manager = lambda window: original(db_path)
+            try:
+                self._window = module.MainWindow()
+            finally:
+                if original is not None:
+                    module.DatabaseManager = original
+                if original_create is not None:
+                    module.MainWindow.create_db_manager = original_create
+            # 停止定时器，避免后台重绘干扰计时
+            for attr in ("timer", "plot_timer", "image_save_timer"):
+                timer = getattr(self._window, attr, None)
+                if timer is not None:
+                    timer.stop()
+            self._window.mqtt_client.queue_timer.stop()
+            self._window.save_to_db = False
+        return self._window
+
+    def set_unit(self, window, unit):
+        use_dbm = (unit == "dBm")
+        if window.use_dbm != use_dbm:
+            window.toggle_unit()
+
+
+def cycle_lists(count):
+    return [row.tolist() for row in make_cycle_matrix(count)]
+
+
+@benchmark("decode")
+def bench_decode(ctx):
+    client = ctx.module.MQTTClient()
+    client.queue_timer.stop()
+    client.message_queue = DiscardQueue()
+    frames = make_frame_pool(1, frames_per_sensor=16)["pub1"]
+    # 帧池循环使用，帧序号保持连续，避免被识别为重复帧而跳过解码
+    messages = (FakeMessage("pub1", with_sequence(frame, seq)) for seq, frame in enumerate(itertools.cycle(frames)))
+    return lambda: client.on_message(None, None, next(messages))
+
+
+@benchmark("update_plot", cycles=[50, 200, 800])
+def bench_update_plot(ctx, cycles):
+    window = ctx.window()
+    window.max_cycles = cycles
+    data = cycle_lists(cycles)
+    # 预先填满累积缓冲区，测量稳定状态下的开销
+    for cycle in data:
+        window.update_plot(cycle)
+    source = itertools.cycle(data)
+    return lambda: window.update_plot(next(source))
+
+
+@benchmark("detect_pulses", batch=[1, 256])
+def bench_detect_pulses(ctx, batch):
+    from gis_pd_pulses import PulseExtractor
+    extractor = PulseExtractor()
+    values = make_cycle_matrix(batch)
+    return lambda: extractor.add_cycles("pub1", values)
+
+
+@benchmark("classify", sensors=[1, 48])
+def bench_classify(ctx, sensors):
+    from gis_pd_pulses import PulseExtractor
+    from gis_pd_fingerprint import compute_fingerprint
+    from gis_pd_classifier import PDClassifier
+    extractor = PulseExtractor()
+    values = make_cycle_matrix(1000)
+    for index in range(sensors):
+        extractor.add_cycles(f"pub{index}", values)
+    snapshots = extractor.snapshots()
+    classifier = PDClassifier.default()
+
+    def run():
+        fingerprints = {topic: compute_fingerprint(*snapshot) for topic, snapshot in snapshots.items()}
+        classifier.classify(fingerprints)
+    return run
+
+
+@benchmark("alarm_add_cycle", state=["quiet", "active"])
+def bench_alarm_add_cycle(ctx, state):
+    from gis_pd_alarms import AlarmEngine, DEFAULT_RULES
+    engine = AlarmEngine(DEFAULT_RULES, lambda event: None)
+    values = make_cycle_matrix(1)[0]
+    # 合成数据的峰值超过默认阈值，无越限时限制在阈值以下；与界面收到的数据相同，使用float列表
+    data = (values if state == "active" else np.minimum(values, 1.0)).tolist()
+    return lambda: engine.add_cycle("pub1", data)
+
+
+@benchmark("changepoint")
+def bench_changepoint(ctx):
+    from gis_pd_changepoint import CusumDetector, cycle_change_features
+    detector = CusumDetector(warmup=64)
+    cycles = [values.tolist() for values in make_cycle_matrix(64)]
+    times = 1.7e9 + np.arange(len(cycles)) * 0.02
+    detector.update(cycle_change_features(cycles), times)
+    return lambda: detector.update(cycle_change_features(cycles), times)
+
+
+@benchmark("noise_floor", op=["update", "denoise"])
+def bench_noise_floor(ctx, op):
+    from gis_pd_noise import NoiseFloor
+    floor = NoiseFloor()
+    data = make_cycle_matrix(64)
+    for values in data:
+        floor.update(values)
+    counter = itertools.count()
+    if op == "update":
+        return lambda: floor.update(data[next(counter) % len(data)])
+    return lambda: floor.denoise(data[next(counter) % len(data)])
+
+
+@benchmark("trend_add_cycle")
+def bench_trend_add_cycle(ctx):
+    from gis_pd_trend import TrendAggregator
+    aggregator = TrendAggregator()
+    data = [values.tolist() for values in make_cycle_matrix(64)]
+    counter = itertools.count()
+
+    def run():
+        i = next(counter)
+        aggregator.add_cycle("pub1", data[i % len(data)], 1.7e9 + i * 0.02)
+        if i % 50 == 0:
+            aggregator.take_rows(1.7e9 + i * 0.02)
+    return run
+
+
+@benchmark("correlate", sensors=[4, 48])
+def bench_correlate(ctx, sensors):
+    from gis_pd_correlation import CorrelationEngine
+    engine = CorrelationEngine()
+    for sensor in range(sensors):
+        engine.sensor(f"pub{sensor}")
+    rng = np.random.default_rng(0)
+    count = sensors * 50 * 5
+    batch = {
+        "key": np.repeat(np.arange(50), sensors * 5),
+        "sensor": np.tile(np.repeat(np.arange(sensors), 5), 50),
+        "phase": rng.uniform(0, 360, count),
+        "amplitude": rng.uniform(1.0, 3.0, count),
+    }
+    return lambda: engine.correlate(batch)
+
+
+@benchmark("draw_prpd", cycles=[50, 200, 800], unit=["mV", "dBm"])
+def bench_draw_prpd(ctx, cycles, unit):
+    window = ctx.window()
+    window.max_cycles = cycles
+    ctx.set_unit(window, unit)
+    data = cycle_lists(cycles)
+
+    def run():
+        window.draw_prpd(data)
+        window.canvas.draw()
+    return run
+
+
+@benchmark("draw_prps", cycles=[50, 200, 800], unit=["mV", "dBm"])
+def bench_draw_prps(ctx, cycles, unit):
+    window = ctx.window()
+    window.max_cycles = cycles
+    ctx.set_unit(window, unit)
+    data = cycle_lists(cycles)
+    if window.canvas.axes_3d is None:
+        raise RuntimeError("PRPS三维图未启用")
+
+    def run():
+        window.draw_prps(data)
+        window.canvas.draw()
+    return run
+
+
+def save_cycles_and_sync(db, batch):
+    """每次写入batch个周期后等待写入完成
+
+    save_cycle_data只把写操作放入写入线程的队列，不等待写入完成时只能测到入队的耗时。
+    """
+    data = cycle_lists(16)
+    counter = itertools.count()
+    sync = getattr(db, "sync", None)  # 旧版本的DatabaseManager同步写入，没有sync
+
+    def run():
+        for _ in range(batch):
+            i = next(counter)
+            db.save_cycle_data(i, data[i % len(data)])
+        if sync is not None:
+            sync()
+    return run
+
+
+@benchmark("save_cycle_data", batch=[1, 256])
+def bench_save_cycle_data(ctx, batch):
+    return save_cycles_and_sync(ctx.new_db_manager("save_cycle_data.db"), batch)
+
+
+@benchmark("save_cycle_data_block", codec=["zlib", "lzma"], batch=[256])
+def bench_save_cycle_data_block(ctx, codec, batch):
+    return save_cycles_and_sync(ctx.new_db_manager(f"save_cycle_data_{codec}.db", codec=codec), batch)
+
+
+@benchmark("get_cycle_data_by_time", rows=[10000], window_rows=[100, 1000])
+def bench_get_cycle_data_by_time(ctx, rows, window_rows):
+    db = ctx.new_db_manager(f"query_{rows}.db")
+    data = [','.join(map(str, cycle)) for cycle in cycle_lists(64)]
+    base = datetime.datetime(2025, 1, 1)
+    # 每20ms一个周期（50Hz）
+    records = [((base + datetime.timedelta(milliseconds=20 * i)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+                i, data[i % len(data)]) for i in range(rows)]
+    # 使用独立连接批量写入测试数据（写连接属于数据库管理器）
+    conn = sqlite3.connect(db.db_path)
+    conn.executemany("INSERT INTO cycle_data (timestamp, cycle_number, data) VALUES (?, ?, ?)", records)
+    conn.commit()
+    conn.close()
+    start = records[rows // 2][0]
+    end = records[rows // 2 + window_rows - 1][0]
+    return lambda: db.get_cycle_data_by_time(start, end)
+
+
+@benchmark("cyclelog_append", batch=[1, 256])
+def bench_cyclelog_append(ctx, batch):
+    from gis_pd_cyclelog import CycleLogManager, mv_to_codes
+    log = ctx.track(CycleLogManager(os.path.join(ctx.work_dir, f"{ctx.case}_cyclelog_append_{batch}")))
+    if batch == 1:
+        # 与界面中的调用方式相同：每个周期一次save_cycle_data
+        data = cycle_lists(16)
+        counter = itertools.count()
+
+        def run():
+            i = next(counter)
+            log.save_cycle_data(i, data[i % len(data)], topic="pub1")
+        return run
+
+    codes = mv_to_codes(make_cycle_matrix(batch))
+    clock = itertools.count()
+
+    def run():
+        start = next(clock) * batch * 0.02
+        log.append_codes(0, codes, 1.7e9 + start + np.arange(batch) * 0.02)
+    return run
+
+
+@benchmark("cyclelog_read_range", rows=[100000], window_rows=[100, 1000])
+def bench_cyclelog_read_range(ctx, rows, window_rows):
+    from gis_pd_cyclelog import CycleLogManager, mv_to_codes
+    log = ctx.track(CycleLogManager(os.path.join(ctx.work_dir, f"cyclelog_read_{rows}")))
+    if log.get_cycle_count() < rows:
+        codes = mv_to_codes(make_cycle_matrix(64))
+        for i in range(0, rows, len(codes)):
+            log.append_codes(0, codes, 1.7e9 + (i + np.arange(len(codes))) * 0.02)
+    start = 1.7e9 + rows // 2 * 0.02
+    end = start + (window_rows - 1) * 0.02
+    # 读取视图并计算每个周期的最大值，数据直接来自内存映射
+    return lambda: [view["samples"].max(axis=1) for _, view in log.read_range(start, end)]
+
+
+@benchmark("history_update_chart", cycles=[50, 200, 800])
+def bench_history_update_chart(ctx, cycles):
+    base = datetime.datetime(2025, 1, 1)
+    rows = [(i, (base + datetime.timedelta(milliseconds=20 * i)).strftime("%Y-%m-%d %H:%M:%S.%f"),
+             i, ','.join(map(str, cycle))) for i, cycle in enumerate(cycle_lists(cycles))]
+    dialog = ctx.module.HistoricalChartsDialog(rows)
+    dialog.range_spin.setValue(cycles)
+    return dialog.update_chart
+
+
+def measure(func, repeat, min_time):
+    """先校准每次采样的调用次数，再重复采样，返回每次调用的耗时(秒)列表"""
+    func()  # 预热
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time or number >= 1 << 16:
+            break
+        number *= 2 if elapsed <= 0 else max(2, min(10, int(min_time / elapsed) + 1))
+    samples = []
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            for _ in range(number):
+                func()
+            samples.append((time.perf_counter() - start) / number)
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return samples, number
+
+
+def bench_key(name, params):
+    if not params:
+        return name
+    return f"{name}[{','.join(f'{k}={v}' for k, v in params.items())}]"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GIS局部放电监测 各处理阶段微基准测试")
+    parser.add_argument("--module", default="gis_pd_mqtt_gui", help="被测试的程序模块")
+    parser.add_argument("--filter", default="", help="只运行名称包含该字符串的测试")
+    parser.add_argument("--repeat", type=int, default=5, help="每个测试的采样次数")
+    parser.add_argument("--min-time", type=float, default=0.2, help="每次采样的最短时长(秒)")
+    parser.add_argument("--output", help="将结果保存为JSON文件")
+    parser.add_argument("--compare", help="与之前保存的JSON结果进行比较")
+    parser.add_argument("--threshold", type=float, default=1.10,
+                        help="比较时判定为变慢的耗时比例")
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.module)
+    baseline = {}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f).get("benchmarks", {})
+
+    results = {}
+    regressions = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        ctx = Context(module, work_dir)
+        for name, params, setup in BENCHMARKS:
+            key = bench_key(name, params)
+            if args.filter and args.filter not in key:
+                continue
+            try:
+                func = setup(ctx, **params)
+                samples, number = measure(func, args.repeat, args.min_time)
+            except Exception as e:
+                print(f"{key:<55} 错误: {e}", flush=True)
+                results[key] = {"error": str(e)}
+                continue
+            finally:
+                ctx.teardown()
+            samples_ms = np.asarray(samples) * 1000.0
+            results[key] = {
+                "name": name,
+                "params": params,
+                "number": number,
+                "repeat": args.repeat,
+                "min_ms": round(float(samples_ms.min()), 4),
+                "median_ms": round(float(np.median(samples_ms)), 4),
+                "mean_ms": round(float(samples_ms.mean()), 4),
+                "stddev_ms": round(float(samples_ms.std()), 4),
+            }
+            line = f"{key:<55} 中位数 {results[key]['median_ms']:>10.3f} ms   最小 {results[key]['min_ms']:>10.3f} ms"
+            old = baseline.get(key, {})
+            if old.get("median_ms"):
+                ratio = results[key]["median_ms"] / old["median_ms"]
+                line += f"   对比基准 {ratio:>5.2f}x"
+                if ratio > args.threshold:
+                    line += " 变慢"
+                    regressions.append(key)
+            print(line, flush=True)
+        ctx.close()
+
+    if args.output:
+        report = {
+            "benchmark": "stages",
+            "module": args.module,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "benchmarks": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+    if regressions:
+        print(f"共有 {len(regressions)} 项测试变慢超过 {(args.threshold - 1) * 100:.0f}%")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,291 @@
+"""端到端吞吐量基准测试
+
+在进程内模拟paho客户端：发送线程按设定速率合成线上格式的数据帧，
+直接调用MQTTClient.on_message（与paho网络线程的调用方式相同），
+完整经过 解码 → 消息队列 → update_plot → 定时重绘 → 数据库 流程。
+无需Broker和传感器硬件。
+
+统计指标：
+    - 发送/处理帧率 (帧/秒)
+    - 端到端延迟百分位 (从调用on_message到update_plot完成)
+    - 丢帧率 (消息队列已满被丢弃的帧)
+    - CPU占用率和常驻内存(RSS)
+
+用法示例:
+    python benchmarks/bench_throughput.py --sensors 1,4,16 --cycles 50,200 --duration 10
+    python benchmarks/bench_throughput.py --module gis_pd_mqtt_gui_v10 --output v10.json
+    python benchmarks/bench_throughput.py --compare v10.json
+"""
+import os
+import sys
+import time
+import json
+import queue
+import argparse
+import datetime
+import platform
+import tempfile
+import threading
+import importlib
+
+# 无界面运行
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import numpy as np
+from PySide6.QtWidgets import QApplication
+from PySide6.QtCore import QEventLoop, QTimer
+
+from pd_synth import make_frame_pool, with_sequence
+
+
+class TimedQueue(queue.Queue):
+    """记录每条消息发送时刻的消息队列，用于计算端到端延迟"""
+    def __init__(self, maxsize=0):
+        super().__init__(maxsize)
+        self.send_time = 0.0  # 由发送线程在调用on_message前设置
+        self.last_send_time = None  # 最近一次取出的消息的发送时刻
+        self.put_count = 0
+
+    def _put(self, item):
+        self.put_count += 1
+        super()._put((self.send_time, item))
+
+    def _get(self):
+        send_time, item = super()._get()
+        self.last_send_time = send_time
+        return item
+
+
+class FakeMessage:
+    """模拟paho的MQTTMessage"""
+    def __init__(self, topic, payload):
+        self.topic = topic
+        self.payload = payload
+
+
+def read_rss_bytes():
+    """读取当前进程的常驻内存(字节)"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS返回字节，Linux返回KB
+        return rss if sys.platform == "darwin" else rss * 1024
+    except ImportError:
+        return 0
+
+
+def producer(handler, message_queue, frame_pool, rate, duration, stop_event, stats):
+    """发送线程：按绝对时间表以rate帧/秒（所有传感器合计）调用on_message"""
+    topics = list(frame_pool.keys())
+    interval = 1.0 / rate
+    start = time.perf_counter()
+    sent = 0
+    while not stop_event.is_set():
+        deadline = start + sent * interval
+        if deadline - start >= duration:
+            break
+        remaining = deadline - time.perf_counter()
+        if remaining > 0:
+            time.sleep(remaining)
+        topic = topics[sent % len(topics)]
+        frames = frame_pool[topic]
+        index = sent // len(topics)
+        payload = with_sequence(frames[index % len(frames)], index)  # 帧池循环使用时帧序号保持连续
+        message_queue.send_time = time.perf_counter()
+        handler(None, None, FakeMessage(topic, payload))
+        sent += 1
+    stats["sent"] = sent
+    stats["send_elapsed"] = time.perf_counter() - start
+
+
+def run_case(module, app, sensors, rate, cycles, duration, save_db, db_dir):
+    """运行一组参数的测试，返回结果字典"""
+    # 将数据库重定向到临时目录，避免写入程序目录下的数据库
+    # （不论保存的存储设置如何，都使用单文件数据库）
+    original_db_manager = getattr(module, "DatabaseManager", None)
+    original_create = getattr(module.MainWindow, "create_db_manager", None)
+    if original_db_manager is not None:
+        db_path = os.path.join(db_dir, f"bench_{sensors}_{cycles}_{int(save_db)}.db")
+        module.DatabaseManager = lambda *args, **kwargs: original_db_manager(db_path)
+        if original_create is not None:
+            module.MainWindow.create_db_manager = lambda window: original_db_manager(db_path)
+    try:
+        window = module.MainWindow()
+    finally:
+        if original_db_manager is not None:
+            module.DatabaseManager = original_db_manager
+        if original_create is not None:
+            module.MainWindow.create_db_manager = original_create
+
+    # 设置累积周期数和数据库保存
+    if hasattr(window, "cycles_spin"):
+        window.cycles_spin.setValue(cycles)
+    window.max_cycles = cycles
+    if hasattr(window, "save_to_db"):
+        window.save_to_db = save_db
+
+    client = window.mqtt_client
+    timed_queue = TimedQueue(maxsize=client.message_queue.maxsize)
+    client.message_queue = timed_queue
+
+    latencies = []
+
+    def on_delivered(*args):
+        # 在update_plot之后被调用（同一信号，后连接的槽后执行）
+        if timed_queue.last_send_time is not None:
+            latencies.append(time.perf_counter() - timed_queue.last_send_time)
+
+    client.message_received.connect(on_delivered)
+
+    frame_pool = make_frame_pool(sensors)
+    stop_event = threading.Event()
+    stats = {}
+    send_thread = threading.Thread(
+        target=producer,
+        args=(client.on_message, timed_queue, frame_pool, rate * sensors, duration, stop_event, stats),
+        daemon=True,
+    )
+
+    rss_before = read_rss_bytes()
+    cpu_before = time.process_time()
+    wall_before = time.perf_counter()
+    send_thread.start()
+
+    # 运行Qt事件循环，让队列定时器、重绘定时器和状态定时器正常工作
+    loop = QEventLoop()
+    QTimer.singleShot(int(duration * 1000), loop.quit)
+    loop.exec()
+    stop_event.set()
+    send_thread.join()
+    # 排空剩余的队列消息
+    drain_deadline = time.perf_counter() + 2.0
+    while timed_queue.qsize() > 0 and time.perf_counter() < drain_deadline:
+        app.processEvents()
+        time.sleep(0.005)
+
+    wall = time.perf_counter() - wall_before
+    cpu = time.process_time() - cpu_before
+    rss_after = read_rss_bytes()
+
+    sent = stats.get("sent", 0)
+    delivered = len(latencies)
+    dropped = sent - timed_queue.put_count
+    lat_ms = np.asarray(latencies) * 1000.0 if latencies else np.zeros(1)
+
+    result = {
+        "sensors": sensors,
+        "rate_per_sensor": rate,
+        "cycles": cycles,
+        "save_db": save_db,
+        "duration_s": round(wall, 3),
+        "sent": sent,
+        "delivered": delivered,
+        "dropped": dropped,
+        "drop_rate": round(dropped / sent, 4) if sent else 0.0,
+        "send_fps": round(sent / stats.get("send_elapsed", wall), 1),
+        "delivered_fps": round(delivered / wall, 1),
+        "latency_ms_p50": round(float(np.percentile(lat_ms, 50)), 2),
+        "latency_ms_p95": round(float(np.percentile(lat_ms, 95)), 2),
+        "latency_ms_p99": round(float(np.percentile(lat_ms, 99)), 2),
+        "latency_ms_max": round(float(np.max(lat_ms)), 2),
+        "cpu_percent": round(100.0 * cpu / wall, 1),
+        "rss_mb": round(rss_after / 1048576, 1),
+        "rss_delta_mb": round((rss_after - rss_before) / 1048576, 1),
+    }
+
+    # 清理窗口和连接
+    client.message_received.disconnect(on_delivered)
+    window.close()
+    window.deleteLater()
+    app.processEvents()
+    return result
+
+
+def print_table(results, baseline=None):
+    """以表格形式输出结果，如果给出基准结果则同时输出变化量"""
+    columns = ["sensors", "cycles", "save_db", "send_fps", "delivered_fps", "drop_rate",
+               "latency_ms_p50", "latency_ms_p95", "latency_ms_p99", "cpu_percent", "rss_mb"]
+    print(" ".join(f"{c:>14}" for c in columns))
+    baseline_map = {}
+    if baseline:
+        for item in baseline.get("results", []):
+            baseline_map[(item["sensors"], item["cycles"], item["save_db"])] = item
+    for item in results:
+        print(" ".join(f"{str(item[c]):>14}" for c in columns))
+        old = baseline_map.get((item["sensors"], item["cycles"], item["save_db"]))
+        if old:
+            deltas = []
+            for c in columns[3:]:
+                if old.get(c):
+                    deltas.append(f"{(item[c] - old[c]) / abs(old[c]) * 100:+13.1f}%")
+                else:
+                    deltas.append(f"{'-':>14}")
+            print(" ".join(f"{'':>14}" for _ in columns[:3]) + " " + " ".join(deltas))
+
+
+def parse_int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="GIS局部放电监测 端到端吞吐量基准测试")
+    parser.add_argument("--module", default="gis_pd_mqtt_gui",
+                        help="被测试的程序模块，例如 gis_pd_mqtt_gui_v10")
+    parser.add_argument("--sensors", default="1,4,16", help="传感器数量列表，逗号分隔")
+    parser.add_argument("--rate", type=float, default=25.0, help="每个传感器的发送速率(帧/秒)")
+    parser.add_argument("--cycles", default="50,200", help="PRPD累积周期数列表，逗号分隔")
+    parser.add_argument("--duration", type=float, default=10.0, help="每组测试的时长(秒)")
+    parser.add_argument("--save-db", action="store_true", help="同时测试保存数据到数据库")
+    parser.add_argument("--output", help="将结果保存为JSON文件")
+    parser.add_argument("--compare", help="与之前保存的JSON结果进行比较")
+    args = parser.parse_args()
+
+    module = importlib.import_module(args.module)
+    app = QApplication.instance() or QApplication(sys.argv)
+
+    db_options = [False, True] if args.save_db else [False]
+    results = []
+    with tempfile.TemporaryDirectory() as db_dir:
+        for sensors in parse_int_list(args.sensors):
+            for cycles in parse_int_list(args.cycles):
+                for save_db in db_options:
+                    print(f"运行: 模块={args.module} 传感器={sensors} 累积周期={cycles} 保存数据库={save_db}",
+                          flush=True)
+                    results.append(run_case(module, app, sensors, args.rate, cycles,
+                                            args.duration, save_db, db_dir))
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.output:
+        report = {
+            "benchmark": "throughput",
+            "module": args.module,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "processor": platform.processor(),
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存到: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""合成局部放电数据帧，用于基准测试
+
+帧格式与传感器实际发送的数据一致（大端uint16）:
+    4个帧头字 + 360个采样点 + 1个帧尾字
+其中帧头依次为0xA5 + 传感器编号、帧序号、同步相位（固件未填写时的固定值0x0405）和增益码，
+帧尾固定为0xAABB。帧池循环使用时用with_sequence重新写入连续的帧序号，避免被识别为重复帧。
+采样值为ADC码值，on_message中按 码值 * 3.3 / 4096 转换为毫伏。
+"""
+import numpy as np
+
+SAMPLES_PER_CYCLE = 360
+FRAME_TRAILER = 0xAABB
+NOISE_FLOOR_CODE = 0x06C8  # 实测噪声基底约为1.40
+NOISE_SIGMA_CODE = 12
+
+
+def make_cycle_codes(rng, pulse_count=6, noise_floor=NOISE_FLOOR_CODE, noise_sigma=NOISE_SIGMA_CODE):
+    """生成一个周期的ADC码值：高斯噪声基底 + 若干稀疏脉冲（集中在正负半周峰值附近）"""
+    codes = rng.normal(noise_floor, noise_sigma, SAMPLES_PER_CYCLE)
+    if pulse_count > 0:
+        centers = rng.choice([90, 270], size=pulse_count)
+        phases = (centers + rng.normal(0, 20, pulse_count)).astype(int) % SAMPLES_PER_CYCLE
+        codes[phases] += rng.uniform(200, 1500, pulse_count)
+    return np.clip(codes, 0, 0xFFFF).astype(np.uint16)
+
+
+def make_frame(sensor_id, seq, codes, gain=0x01C2):
+    """将一个周期的ADC码值打包为线上格式的帧（bytes），seq为帧序号（按uint16循环）"""
+    header = [0xA500 | (sensor_id & 0xFF), seq & 0xFFFF, 0x0405, gain]
+    words = np.concatenate([np.asarray(header, dtype=np.uint16),
+                            np.asarray(codes, dtype=np.uint16),
+                            np.asarray([FRAME_TRAILER], dtype=np.uint16)])
+    return words.astype('>u2').tobytes()
+
+
+def with_sequence(frame, seq):
+    """返回帧序号改为seq的帧（其余内容不变）"""
+    return frame[:2] + (seq & 0xFFFF).to_bytes(2, "big") + frame[4:]
+
+
+def make_frame_pool(sensor_count, frames_per_sensor=64, seed=0):
+    """为每个传感器预先生成固定的帧池，避免在发送循环中消耗CPU
+
+    Returns:
+        {topic: [frame_bytes, ...]}
+    """
+    rng = np.random.default_rng(seed)
+    pool = {}
+    for sensor in range(sensor_count):
+        topic = f"pub{sensor + 1}"
+        pool[topic] = [make_frame(sensor + 1, seq, make_cycle_codes(rng))
+                       for seq in range(frames_per_sensor)]
+    return pool
+
+
+def make_cycle_matrix(cycle_count, seed=0):
+    """生成cycle_count个周期的毫伏数据（与on_message解码结果一致，保留两位小数）"""
+    rng = np.random.default_rng(seed)
+    codes = np.stack([make_cycle_codes(rng) for _ in range(cycle_count)])
+    return np.round(codes * 3.3 / 4096, 2)
@@ -0,0 +1,360 @@
+"""报警规则
+
+AlarmEngine在界面主线程中对每个解码后的周期在线评估报警规则，每个传感器（MQTT主题）有独立的状态。
+规则保存为dict（设置中以JSON保存），字段:
+    name      规则名称
+    kind      规则类型，见RULE_KINDS
+    threshold 触发阈值
+    clear     解除阈值（滞回），报警在低于解除阈值后才解除，避免在阈值附近反复触发和解除
+    count     次数
+    window    窗口
+    unit      峰值阈值的单位("mV"或"dBm")
+    actions   触发时执行的动作，见ALARM_ACTIONS
+    enabled   是否启用
+
+各类型规则的参数含义:
+    peak          最近window个周期中至少count个周期的峰值 > threshold时触发，
+                  超过clear的周期数少于count时解除
+    pulse_rate    最近window秒的脉冲率(个/秒)达到基线的threshold倍、且窗口内脉冲数不少于count时触发，
+                  降到基线的clear倍以下时解除；基线为脉冲率的慢速指数滑动平均，报警期间不更新
+    class_change  放电类型识别结果连续count次为同一个新类别（置信度不低于threshold）时产生事件
+    silent        超过threshold秒没有收到数据时触发，收到数据时解除
+    change        周期峰值、脉冲数或能量相对基线的持续变化（CUSUM，见gis_pd_changepoint）时产生事件:
+                  threshold为检测阈值h(σ)，clear为每周期扣除的偏移量k(σ)，count为建立基线的周期数，
+                  window为基线EWMA的等效周期数；事件时间为估计的变化开始时间
+
+所有峰值规则编译为阈值数组，每个周期只计算一次峰值，然后用一次数组比较得到全部规则的结果；
+每条规则的窗口计数用环形数组增量维护（加入新周期、减去移出窗口的周期），每个周期的开销与
+周期长度和窗口长度无关；峰值低于所有阈值且窗口内没有越限周期时只比较一次峰值。
+变化点规则的周期先暂存，每CHANGE_BATCH个周期或每次tick一次计算特征矩阵和CUSUM累积量，
+各规则的状态为每个特征几个数值。
+脉冲率和无数据规则由tick每秒检查一次，不增加每个周期的开销。
+
+触发、解除和状态变化时生成报警事件（dict）交给sink:
+    topic, rule(规则名称), kind, state("raised"/"cleared"/"event"), time, value, message, actions
+"""
+import time
+import datetime
+from collections import deque
+
+import numpy as np
+
+from gis_pd_metrics import metrics  # Prometheus指标
+from gis_pd_storage import TIMESTAMP_FORMAT
+from gis_pd_classifier import PD_CLASSES, NO_DISCHARGE
+from gis_pd_changepoint import CusumDetector, cycle_change_features, CHANGE_FEATURE_NAMES, CHANGE_FEATURE_UNITS
+
+# 规则类型 -> 显示名称
+RULE_KINDS = {
+    "peak": "峰值越限",
+    "pulse_rate": "脉冲率上升",
+    "class_change": "放电类型变化",
+    "silent": "传感器无数据",
+    "change": "活动突变",
+}
+# 动作 -> 显示名称
+ALARM_ACTIONS = {
+    "status": "状态栏",
+    "mqtt": "MQTT转发",
+    "db": "数据库记录",
+    "snapshot": "图像快照",
+}
+ALARM_STATES = {"raised": "触发", "cleared": "解除", "event": "事件"}
+BASELINE_SECONDS = 600.0  # 脉冲率基线的时间常数(秒)
+BASELINE_WARMUP = 30  # 脉冲率基线至少经过的tick次数，之前不触发脉冲率报警
+MIN_BASELINE_RATE = 0.1  # 脉冲率基线的下限(个/秒)，避免基线为0时任何脉冲都触发
+CHANGE_BATCH = 64  # 变化点规则每批处理的周期数
+
+DEFAULT_RULES = [
+    {"name": "峰值越限", "kind": "peak", "threshold": 2.0, "clear": 1.8, "count": 5, "window": 10,
+     "unit": "mV", "actions": ["status", "db"], "enabled": True},
+    {"name": "脉冲率上升", "kind": "pulse_rate", "threshold": 3.0, "clear": 1.5, "count": 50, "window": 10,
+     "unit": "mV", "actions": ["status", "db"], "enabled": True},
+    {"name": "放电类型变化", "kind": "class_change", "threshold": 0.6, "clear": 0.0, "count": 3, "window": 0,
+     "unit": "mV", "actions": ["status", "db"], "enabled": True},
+    {"name": "传感器无数据", "kind": "silent", "threshold": 30.0, "clear": 0.0, "count": 0, "window": 0,
+     "unit": "mV", "actions": ["status", "db"], "enabled": True},
+    {"name": "活动突变", "kind": "change", "threshold": 10.0, "clear": 1.0, "count": 250, "window": 3000,
+     "unit": "mV", "actions": ["status", "db"], "enabled": True},
+]
+
+
+def dbm_to_mv(value):
+    """dBm转毫伏（与界面的单位换算相同）"""
+    return (value + 81.818) / 54.545
+
+
+def class_name(label):
+    return NO_DISCHARGE if label is None else PD_CLASSES.get(label, label)
+
+
+def merge_default_rules(rules, known_kinds=None):
+    """加入保存规则时还没有的规则类型的默认规则（程序升级后新增的规则类型，例如活动突变）
+
+    Args:
+        rules: 保存的规则列表
+        known_kinds: 保存规则时程序已有的规则类型，用户删除的这些类型的规则不会重新加入；
+                     None（旧版本保存的设置）时为rules中出现的类型
+    """
+    known = set(known_kinds) if known_kinds is not None else {rule.get("kind") for rule in rules}
+    return list(rules) + [dict(rule) for rule in DEFAULT_RULES if rule["kind"] not in known]
+
+
+def normalize_rule(rule):
+    """补全规则中缺少的字段"""
+    result = {"name": "", "kind": "peak", "threshold": 0.0, "clear": 0.0, "count": 1, "window": 1,
+              "unit": "mV", "actions": ["status"], "enabled": True}
+    result.update(rule)
+    result["actions"] = [action for action in result["actions"] if action in ALARM_ACTIONS]
+    return result
+
+
+class SensorAlarmState:
+    """单个传感器的报警状态"""
+    def __init__(self, peak_rules, history_length):
+        columns = 2 * peak_rules  # 前一半为触发阈值，后一半为解除阈值
+        self.ring = np.zeros((history_length, columns), dtype=np.int32)  # 最近周期的越限结果
+        self.position = 0
+        self.quiet = history_length  # 连续未越限的周期数，不小于history_length时环形数组全为0
+        self.counts = np.zeros(columns, dtype=np.int32)  # 各规则窗口内的越限周期数
+        self.peak_active = np.zeros(peak_rules, dtype=bool)
+        self.last_seen = time.time()
+        self.silent_active = set()  # 正在报警的无数据规则
+        self.pulse_history = {}  # 脉冲率规则 -> deque[(时间, 累计脉冲数)]
+        self.baseline = {}  # 脉冲率规则 -> (基线(个/秒), tick次数)
+        self.rate_active = set()
+        self.stable_class = {}  # 类别变化规则 -> 当前类别
+        self.candidate = {}  # 类别变化规则 -> (候选类别, 连续次数)
+        self.change = {}  # 变化点规则 -> CusumDetector
+        self.change_pending = []  # 等待变化点检测的周期 [(时间, 数据)]
+
+
+class AlarmEngine:
+    """报警规则引擎，在调用线程（界面主线程）中使用"""
+    def __init__(self, rules, sink):
+        """
+        Args:
+            rules: 规则列表（dict，见模块说明）
+            sink: 处理报警事件的函数，参数为事件dict
+        """
+        self.sink = sink
+        self.sensors = {}  # 主题 -> SensorAlarmState
+        self.event_count = 0
+        self.set_rules(rules)
+
+    def set_rules(self, rules):
+        """更新规则并编译峰值规则的阈值数组（所有传感器的状态重新开始）"""
+        self.rules = [normalize_rule(rule) for rule in rules]
+        enabled = [rule for rule in self.rules if rule["enabled"]]
+        self.peak_rules = [rule for rule in enabled if rule["kind"] == "peak"]
+        self.rate_rules = [rule for rule in enabled if rule["kind"] == "pulse_rate"]
+        self.class_rules = [rule for rule in enabled if rule["kind"] == "class_change"]
+        self.silent_rules = [rule for rule in enabled if rule["kind"] == "silent"]
+        self.change_rules = [rule for rule in enabled if rule["kind"] == "change"]
+
+        def to_mv(rule, value):
+            return dbm_to_mv(value) if rule["unit"] == "dBm" else value
+
+        raise_levels = [to_mv(rule, rule["threshold"]) for rule in self.peak_rules]
+        clear_levels = [to_mv(rule, min(rule["clear"], rule["threshold"])) for rule in self.peak_rules]
+        self.levels = np.array(raise_levels + clear_levels, dtype=np.float64)
+        self.needed = np.array([max(int(rule["count"]), 1) for rule in self.peak_rules], dtype=np.int32)
+        windows = np.array([max(int(rule["window"]), int(rule["count"]), 1) for rule in self.peak_rules],
+                           dtype=np.int64)
+        self.windows = np.concatenate([windows, windows])
+        self.history_length = int(self.windows.max()) + 1 if len(self.windows) else 1
+        self.columns = np.arange(len(self.levels))
+        self.lowest_level = self.levels.min() if len(self.levels) else 0.0
+        self.sensors.clear()
+
+    def emit(self, topic, rule, state, value, message, when=None):
+        """生成报警事件并交给sink（when为事件的Unix时间，None为当前时间）"""
+        moment = datetime.datetime.now() if when is None else datetime.datetime.fromtimestamp(when)
+        event = {
+            "topic": topic,
+            "rule": rule["name"],
+            "kind": rule["kind"],
+            "state": state,
+            "time": moment.strftime(TIMESTAMP_FORMAT),
+            "value": float(value),
+            "message": message,
+            "actions": list(rule["actions"]),
+        }
+        self.event_count += 1
+        metrics.inc("gis_pd_alarm_events_total", {"topic": topic, "rule": rule["name"], "state": state})
+        try:
+            self.sink(event)
+        except Exception as e:
+            print(f"处理报警事件错误: {str(e)}")
+        return event
+
+    def sensor(self, topic):
+        state = self.sensors.get(topic)
+        if state is None:
+            state = self.sensors[topic] = SensorAlarmState(len(self.peak_rules), self.history_length)
+        return state
+
+    def add_cycle(self, topic, data):
+        """评估一个周期（mV数据），返回本周期产生的报警事件数"""
+        topic = topic or ""
+        state = self.sensor(topic)
+        state.last_seen = time.time()
+        emitted = 0
+        if state.silent_active:
+            for rule in self.silent_rules:
+                if rule["name"] in state.silent_active:
+                    state.silent_active.discard(rule["name"])
+                    self.emit(topic, rule, "cleared", 0.0, f"{topic} 恢复接收数据")
+                    emitted += 1
+        if not len(data):
+            return emitted
+        if self.change_rules:
+            state.change_pending.append((state.last_seen, data))
+            if len(state.change_pending) >= CHANGE_BATCH:
+                emitted += self.check_change(topic, state)
+        if not self.peak_rules:
+            return emitted
+
+        peak = max(data)
+        if peak <= self.lowest_level:
+            # 未超过任何阈值：环形数组已全为0时（也没有正在报警的规则）跳过数组运算
+            if state.quiet >= self.history_length:
+                return emitted
+            state.quiet += 1
+        else:
+            state.quiet = 0
+        hits = (peak > self.levels).astype(np.int32)
+        # 窗口计数：加入本周期，减去刚移出各规则窗口的周期
+        leaving = state.ring[(state.position - self.windows) % self.history_length, self.columns]
+        state.counts += hits - leaving
+        state.ring[state.position] = hits
+        state.position = (state.position + 1) % self.history_length
+
+        rules = len(self.peak_rules)
+        raised = ~state.peak_active & (state.counts[:rules] >= self.needed)
+        cleared = state.peak_active & (state.counts[rules:] < self.needed)
+        if raised.any() or cleared.any():
+            for index in np.flatnonzero(raised | cleared):
+                rule = self.peak_rules[index]
+                if raised[index]:
+                    message = (f"{topic} 峰值 {peak:.2f}mV，最近{self.windows[index]}个周期中"
+                               f"{state.counts[index]}个超过{rule['threshold']}{rule['unit']}")
+                    self.emit(topic, rule, "raised", peak, message)
+                else:
+                    self.emit(topic, rule, "cleared", peak, f"{topic} 峰值恢复正常")
+            state.peak_active ^= raised | cleared
+            emitted += int((raised | cleared).sum())
+        return emitted
+
+    def check_change(self, topic, state):
+        """对暂存的周期更新变化点规则的CUSUM状态，检测到变化时产生事件（时间为估计的变化开始时间）"""
+        times, cycles = zip(*state.change_pending)
+        state.change_pending = []
+        features = cycle_change_features(cycles)
+        emitted = 0
+        for rule in self.change_rules:
+            detector = state.change.get(rule["name"])
+            if detector is None:
+                detector = state.change[rule["name"]] = CusumDetector(
+                    rule["clear"], rule["threshold"], int(rule["window"]), int(rule["count"]))
+            for feature, direction, baseline, value, start, detected in detector.update(features, times) or []:
+                unit = CHANGE_FEATURE_UNITS[feature]
+                message = (f"{topic} {CHANGE_FEATURE_NAMES[feature]}{'上升' if direction > 0 else '下降'}: "
+                           f"基线 {baseline:.2f}{unit}，当前 {value:.2f}{unit}，检测延迟 {detected - start:.2f}秒")
+                self.emit(topic, rule, "event", value, message, when=start)
+                emitted += 1
+        return emitted
+
+    def tick(self, pulse_totals=None, now=None):
+        """每秒调用一次：检查无数据和脉冲率规则
+
+        Args:
+            pulse_totals: {主题: 累计脉冲数}（PulseExtractor中各传感器缓冲区的累计写入数）
+        """
+        now = time.time() if now is None else now
+        for topic, state in self.sensors.items():
+            if state.change_pending:
+                self.check_change(topic, state)
+            silent_seconds = now - state.last_seen
+            for rule in self.silent_rules:
+                if rule["name"] not in state.silent_active and silent_seconds > rule["threshold"]:
+                    state.silent_active.add(rule["name"])
+                    self.emit(topic, rule, "raised", silent_seconds, f"{topic} 已{silent_seconds:.0f}秒没有数据")
+            if pulse_totals and topic in pulse_totals:
+                self.check_pulse_rate(topic, state, pulse_totals[topic], now)
+
+    def check_pulse_rate(self, topic, state, total, now):
+        for rule in self.rate_rules:
+            name = rule["name"]
+            history = state.pulse_history.setdefault(name, deque())
+            if history and total < history[-1][1]:
+                history.clear()  # 清空数据后累计脉冲数从0开始
+            history.append((now, total))
+            while len(history) > 2 and now - history[1][0] >= rule["window"]:
+                history.popleft()
+            if len(history) < 2:
+                continue
+            (first_time, first_total), (last_time, _) = history[-2], history[-1]
+            step_rate = (total - first_total) / max(last_time - first_time, 1e-3)
+            window_pulses = total - history[0][1]
+            rate = window_pulses / max(now - history[0][0], 1e-3)
+            baseline, ticks = state.baseline.get(name, (step_rate, 0))
+            active = name in state.rate_active
+            reference = max(baseline, MIN_BASELINE_RATE)
+
+            if not active and ticks >= BASELINE_WARMUP and window_pulses >= rule["count"] \
+                    and rate >= rule["threshold"] * reference:
+                state.rate_active.add(name)
+                self.emit(topic, rule, "raised", rate,
+                          f"{topic} 脉冲率 {rate:.1f}个/秒，为基线{reference:.1f}个/秒的{rate / reference:.1f}倍")
+                active = True
+            elif active and rate < rule["clear"] * reference:
+                state.rate_active.discard(name)
+                self.emit(topic, rule, "cleared", rate, f"{topic} 脉冲率恢复到 {rate:.1f}个/秒")
+                active = False
+            if not active:
+                # 报警期间不更新基线，避免持续放电被当作新的基线
+                alpha = min((last_time - first_time) / BASELINE_SECONDS, 1.0)
+                baseline += alpha * (step_rate - baseline)
+            state.baseline[name] = (baseline, ticks + 1)
+
+    def update_classification(self, results):
+        """放电类型识别结果 {主题: (类别, 置信度)}"""
+        for topic, (label, confidence) in results.items():
+            state = self.sensor(topic)
+            for rule in self.class_rules:
+                name = rule["name"]
+                if name not in state.stable_class:
+                    state.stable_class[name] = label  # 第一次识别的结果作为初始状态
+                    continue
+                if label == state.stable_class[name] or (label is not None and confidence < rule["threshold"]):
+                    state.candidate.pop(name, None)
+                    continue
+                candidate, repeats = state.candidate.get(name, (label, 0))
+                repeats = repeats + 1 if candidate == label else 1
+                if repeats >= max(int(rule["count"]), 1):
+                    previous = state.stable_class[name]
+                    state.stable_class[name] = label
+                    state.candidate.pop(name, None)
+                    self.emit(topic, rule, "event", confidence,
+                              f"{topic} 放电类型 {class_name(previous)} -> {class_name(label)}")
+                else:
+                    state.candidate[name] = (label, repeats)
+
+    def active_alarms(self):
+        """正在报警的(主题, 规则名称)列表"""
+        active = []
+        for topic, state in self.sensors.items():
+            active += [(topic, self.peak_rules[index]["name"]) for index in np.flatnonzero(state.peak_active)]
+            active += [(topic, name) for name in sorted(state.rate_active | state.silent_active)]
+        return active
+
+    def status_text(self):
+        """状态栏显示的报警状态"""
+        active = self.active_alarms()
+        if not active:
+            return "报警: 无"
+        text = ", ".join(f"{topic}:{name}" for topic, name in active[:3])
+        if len(active) > 3:
+            text += f" 等{len(active)}项"
+        return f"报警: {text}"
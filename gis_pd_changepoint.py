@@ -0,0 +1,155 @@
+"""放电活动变化点检测（CUSUM）
+
+绝对幅值报警要等放电发展到超过固定阈值才触发；CusumDetector检测每个周期特征相对传感器自身基线的
+持续变化，可以在幅值仍然较低时发现新出现的放电活动（以及放电活动的消失）。
+每个周期计算三个特征（CHANGE_FEATURES）:
+    peak         周期峰值(mV)
+    pulse_count  脉冲数（与cycle_summary中的判定方法相同）
+    energy       周期能量 Σx² (mV²)
+每个特征的状态只有几个数值（与周期长度和历史长度无关），所有特征用一个数组同时更新:
+    1. 基线: 均值μ和平方均值按指数加权移动平均(EWMA)更新，开始时α取max(α, 1/n)（与gis_pd_noise相同）；
+       基线建立后，更新前把特征截断到μ±CLIP_SIGMA·σ，个别放电脉冲不会拉偏基线
+    2. 标准化偏差 z = (x - μ) / σ，截断到±Z_CLIP，单个异常周期对累积量的贡献有限
+    3. 双侧CUSUM: S+ = max(0, S+ + z - k)，S- = max(0, S- - z - k)，超过h时检测到上升/下降，
+       变化开始时间估计为累积量最后一次离开0的时间
+检测到变化后该特征的基线重新建立（前warmup个周期不检测），新的放电水平成为新的基线。
+k越大、h越大越不灵敏；k=1、h=10时正态噪声的平均误报间隔约为10⁹个周期，
+幅值偏移2σ的持续变化约11个周期即可检测到。
+"""
+import numpy as np
+
+from gis_pd_storage import compute_cycle_features
+
+CHANGE_FEATURES = ("peak", "pulse_count", "energy")
+CHANGE_FEATURE_NAMES = {"peak": "峰值", "pulse_count": "脉冲数", "energy": "能量"}
+CHANGE_FEATURE_UNITS = {"peak": "mV", "pulse_count": "个", "energy": "mV²"}
+CUSUM_DRIFT = 1.0  # k: 每个周期扣除的偏移量(σ)
+CUSUM_THRESHOLD = 10.0  # h: 检测阈值(σ)
+BASELINE_CYCLES = 3000  # 基线EWMA的等效周期数（50Hz时约1分钟）
+WARMUP_CYCLES = 250  # 建立基线的周期数，之前不检测
+CLIP_SIGMA = 3.0  # 更新基线前截断超过μ±CLIP_SIGMA·σ的特征值
+Z_CLIP = 4.0  # 标准化偏差的截断值
+MIN_SIGMA = np.array([0.01, 0.5, 0.1])  # 各特征标准差的下限，避免基线没有波动时任何变化都被检测
+
+
+def cycle_change_features(cycles):
+    """一批周期（mV数据）的特征矩阵(周期数, 特征数)，列顺序与CHANGE_FEATURES相同
+
+    长度不同的周期截断到最短的长度（同一传感器的周期长度通常相同）。
+    """
+    samples = min(len(data) for data in cycles)
+    values = np.array([data[:samples] for data in cycles], dtype=np.float64)
+    peak, _, rms, pulse_count, _ = compute_cycle_features(values)
+    return np.column_stack([peak, pulse_count, rms ** 2 * samples])
+
+
+def cusum(steps, initial):
+    """CUSUM累积量 S_t = max(0, S_(t-1) + y_t) 的向量化计算
+
+    Args:
+        steps: 形状(周期数, 特征数)的增量y
+        initial: 各特征的初始累积量
+    Returns:
+        与steps形状相同的累积量，S_t = max(S_0 + C_t, C_t - min(C_1..C_t))，C为y的累加和
+    """
+    total = np.cumsum(steps, axis=0)
+    return np.maximum(initial + total, total - np.minimum.accumulate(total, axis=0))
+
+
+class CusumDetector:
+    """单个传感器各特征的基线和CUSUM累积量
+
+    周期按批更新（一批的特征矩阵一次计算）；批内基线不变，基线时间常数远大于一批的长度，影响可以忽略。
+    """
+    def __init__(self, drift=CUSUM_DRIFT, threshold=CUSUM_THRESHOLD, baseline_cycles=BASELINE_CYCLES,
+                 warmup=WARMUP_CYCLES):
+        """
+        Args:
+            drift: k，每个周期扣除的偏移量(σ)，越大对小的变化越不灵敏
+            threshold: h，检测阈值(σ)，越大误报越少、检测越慢
+            baseline_cycles: 基线EWMA的等效周期数
+            warmup: 建立基线的周期数
+        """
+        self.drift = drift
+        self.threshold = threshold
+        self.alpha = 1.0 / max(baseline_cycles, 1)
+        self.warmup = max(warmup, 1)
+        self.reset()
+
+    def reset(self):
+        columns = len(CHANGE_FEATURES)
+        self.cycles = np.zeros(columns, dtype=np.int64)  # 基线已更新的周期数
+        self.mean = np.zeros(columns)
+        self.mean_sq = np.zeros(columns)
+        self.upper = np.zeros(columns)  # S+
+        self.lower = np.zeros(columns)  # S-
+        self.upper_start = np.zeros(columns)  # S+最后一次离开0的时间
+        self.lower_start = np.zeros(columns)
+
+    def sigma(self):
+        return np.maximum(np.sqrt(np.maximum(self.mean_sq - self.mean ** 2, 0.0)), MIN_SIGMA)
+
+    def update(self, features, times):
+        """加入一批周期
+
+        Args:
+            features: cycle_change_features的结果
+            times: 各周期的Unix时间
+        Returns:
+            没有检测到变化时返回None，否则返回
+            [(特征名称, 方向(1上升/-1下降), 基线均值, 当前值, 变化开始时间, 检测时间)]
+        """
+        times = np.asarray(times, dtype=np.float64)
+        changes = []
+        while len(features):
+            row = self.scan(features, times, changes)
+            if row is None:
+                break
+            features = features[row + 1:]
+            times = times[row + 1:]
+        return changes or None
+
+    def scan(self, features, times, changes):
+        """更新累积量和基线，到第一个检测到变化的周期为止，返回该周期的行号（没有检测到时为None）"""
+        mean = self.mean
+        sigma = self.sigma()
+        ready = self.cycles >= self.warmup
+        z = np.where(ready, np.clip((features - mean) / sigma, -Z_CLIP, Z_CLIP), 0.0)
+        upper = cusum(z - self.drift, self.upper)
+        lower = cusum(-z - self.drift, self.lower)
+        crossed = (upper > self.threshold) | (lower > self.threshold)
+        hits = crossed.any(axis=1)
+        row = int(hits.argmax()) if hits.any() else None
+        end = len(features) if row is None else row + 1
+
+        for values, start, initial in ((upper, self.upper_start, self.upper), (lower, self.lower_start, self.lower)):
+            # 变化开始时间: 累积量最后一次为0之后的第一个周期
+            zero = np.vstack([initial == 0, values[:end - 1] == 0])
+            left = (end - 1) - np.argmax(zero[::-1], axis=0)
+            restart = zero.any(axis=0)
+            start[restart] = times[left[restart]]
+        self.upper = upper[end - 1].copy()
+        self.lower = lower[end - 1].copy()
+
+        block = features[:end]
+        # 建立基线期间不截断，避免用少量周期估计的σ过小、截断后σ越估越小
+        clipped = np.where(ready, np.clip(block, mean - CLIP_SIGMA * sigma, mean + CLIP_SIGMA * sigma), block)
+        # 一批end个周期的EWMA系数；建立基线时为累计平均
+        alpha = np.maximum(1.0 - (1.0 - self.alpha) ** end, end / (self.cycles + end))
+        self.mean = mean + alpha * (clipped.mean(axis=0) - mean)
+        self.mean_sq += alpha * ((clipped * clipped).mean(axis=0) - self.mean_sq)
+        self.cycles += end
+        if row is None:
+            return None
+
+        rising = self.upper > self.threshold
+        for index in np.flatnonzero(crossed[row]):
+            start = self.upper_start[index] if rising[index] else self.lower_start[index]
+            changes.append((CHANGE_FEATURES[index], 1 if rising[index] else -1, float(mean[index]),
+                            float(features[row, index]), float(start), float(times[row])))
+        # 重新建立基线：下一批的alpha为1，基线从新的水平开始
+        changed = crossed[row]
+        self.cycles[changed] = 0
+        self.upper[changed] = 0.0
+        self.lower[changed] = 0.0
+        return row
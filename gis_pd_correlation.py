@@ -0,0 +1,266 @@
+"""多传感器时间关联和放电源定位
+
+同一GIS上相邻的传感器会检测到同一个放电脉冲，离放电源越近幅值越大、到达越早。
+CorrelationEngine把各传感器提取出的脉冲（gis_pd_pulses.PulseBuffer）按两级对齐后关联:
+    1. 周期对齐: 每个周期的对齐键为帧序号（传感器的固件填写帧序号时，各传感器的帧序号同步，
+       uint16循环计数按最近的键展开为连续的整数）或按工频周期量化的帧到达时间
+       round(时间 / CYCLE_PERIOD)（在MQTT线程收到帧时记录，回放时为保存的帧时间戳），
+       不同主题中键相同的周期视为同一个工频周期
+    2. 脉冲关联: 同一对齐周期中相位相差不超过phase_tolerance的脉冲视为同一个放电事件
+关联全部用数组运算完成: 一次lexsort按(对齐键, 相位)排序，相邻脉冲的间隔超过容差处为事件边界，
+cumsum得到事件编号，np.maximum.at得到(事件数, 传感器数)的幅值矩阵，之后的统计都是矩阵运算，
+不逐个脉冲循环。
+
+各主题的脉冲按批提取，到达时间不同，新脉冲先放入滑动窗口，对齐键落后最新键JOIN_LAG个周期后
+（所有传感器的脉冲都已提取）才关联，避免同一事件被拆开。
+
+对每个至少出现在min_sensors个传感器上的事件（同时出现事件）统计:
+    幅值最大的传感器（最强）、相位最早的传感器（最早到达）、各传感器相对最强传感器的幅值比，
+    以及传感器两两同时出现的次数。
+统计按时间常数decay_seconds指数衰减，反映最近的情况；最强次数占比最高的传感器所在的气室
+即为最可能的放电源。
+"""
+import numpy as np
+
+from gis_pd_frame import SEQUENCE_MODULUS
+
+CYCLE_PERIOD = 0.02  # 工频周期(秒)，50Hz
+PHASE_TOLERANCE = 5.0  # 同一事件的相位容差(度)，50Hz时约0.28ms
+JOIN_LAG = 25  # 对齐键落后最新键的周期数超过该值后才关联（等待其他传感器的脉冲）
+MIN_SENSORS = 2  # 同时出现事件的最少传感器数
+DECAY_SECONDS = 60.0  # 统计的衰减时间常数(秒)
+MIN_EVENTS = 20  # 同时出现事件（衰减后）少于该值时不判断放电源
+PULSE_COLUMNS = ("key", "sensor", "phase", "amplitude")
+# 每个传感器的统计（按时间衰减）
+SENSOR_STATS = (
+    "pulses",  # 脉冲数
+    "coincident",  # 参与同时出现事件的脉冲数
+    "strongest",  # 作为最强传感器的事件数
+    "earliest",  # 作为最早到达传感器的事件数
+    "ratio_sum",  # 不是最强传感器时，相对最强传感器的幅值比之和
+    "ratio_count",
+)
+
+
+def cycle_keys(times, period=CYCLE_PERIOD):
+    """由周期时间戳(秒)得到对齐键（按工频周期量化）"""
+    return np.rint(np.asarray(times, dtype=np.float64) / period).astype(np.int64)
+
+
+def unwrap_sequences(sequences, reference, modulus=SEQUENCE_MODULUS):
+    """把循环计数的帧序号展开为离reference最近的整数（与reference相差不超过modulus的一半）"""
+    sequences = np.asarray(sequences, dtype=np.int64)
+    return reference + (sequences - reference + modulus // 2) % modulus - modulus // 2
+
+
+def group_events(key, phase, tolerance=PHASE_TOLERANCE):
+    """把脉冲分组为事件
+
+    Args:
+        key, phase: 每个脉冲的对齐键和相位(度)
+    Returns:
+        (排序下标, 按排序后顺序每个脉冲的事件编号)，事件编号从0开始连续
+    """
+    order = np.lexsort((phase, key))
+    sorted_key = key[order]
+    sorted_phase = phase[order]
+    boundary = np.ones(len(order), dtype=bool)
+    boundary[1:] = (sorted_key[1:] != sorted_key[:-1]) | (np.diff(sorted_phase) > tolerance)
+    return order, np.cumsum(boundary) - 1
+
+
+class CorrelationEngine:
+    """多传感器脉冲关联，在调用线程中使用（约每秒调用一次update）"""
+    def __init__(self, compartments=None, phase_tolerance=PHASE_TOLERANCE, min_sensors=MIN_SENSORS,
+                 decay_seconds=DECAY_SECONDS, period=CYCLE_PERIOD):
+        """
+        Args:
+            compartments: {主题: 气室名称}，没有设置的主题以主题名作为气室
+            phase_tolerance: 同一事件的相位容差(度)
+            min_sensors: 同时出现事件的最少传感器数
+            decay_seconds: 统计的衰减时间常数(秒)
+            period: 工频周期(秒)
+        """
+        self.compartments = dict(compartments or {})
+        self.phase_tolerance = phase_tolerance
+        self.min_sensors = min_sensors
+        self.decay_seconds = decay_seconds
+        self.period = period
+        self.clear()
+
+    def clear(self):
+        self.topics = []  # 传感器下标 -> 主题
+        self.sensor_index = {}  # 主题 -> 传感器下标
+        self.cursors = {}  # 主题 -> 已读取的脉冲累计数(PulseBuffer.total)
+        self.window = {name: np.empty(0, dtype=np.int64 if name in ("key", "sensor") else np.float64)
+                       for name in PULSE_COLUMNS}  # 等待关联的脉冲
+        self.last_time = None
+        self.sequence_key = None  # 最近展开的帧序号，展开之后的帧序号作为对齐键
+        for name in SENSOR_STATS:
+            setattr(self, name, np.zeros(0))
+        self.pairs = np.zeros((0, 0))  # 两两同时出现的事件数
+        self.events = 0.0  # 同时出现事件数
+
+    def sensor(self, topic):
+        """主题对应的传感器下标，新的主题扩大统计数组"""
+        index = self.sensor_index.get(topic)
+        if index is None:
+            index = self.sensor_index[topic] = len(self.topics)
+            self.topics.append(topic)
+            for name in SENSOR_STATS:
+                setattr(self, name, np.append(getattr(self, name), 0.0))
+            self.pairs = np.pad(self.pairs, ((0, 1), (0, 1)))
+        return index
+
+    def add_pulses(self, topic, times, phase, amplitude, keys=None):
+        """加入一个传感器的一批脉冲（times为脉冲所在周期的时间戳，keys不为None时直接作为对齐键）"""
+        sensor = self.sensor(topic)
+        new = {
+            "key": cycle_keys(times, self.period) if keys is None else np.asarray(keys, dtype=np.int64),
+            "sensor": np.full(len(phase), sensor, dtype=np.int64),
+            "phase": np.asarray(phase, dtype=np.float64),
+            "amplitude": np.asarray(amplitude, dtype=np.float64),
+        }
+        self.window = {name: np.concatenate([self.window[name], new[name]]) for name in PULSE_COLUMNS}
+
+    def sequence_keys(self, sequences):
+        """帧序号的对齐键（展开循环计数，各传感器使用同一个参考，同步的帧序号得到相同的键）"""
+        if self.sequence_key is None:
+            self.sequence_key = int(sequences[0])
+        keys = unwrap_sequences(sequences, self.sequence_key)
+        self.sequence_key = int(keys.max())
+        return keys
+
+    def read_extractor(self, pulse_extractor):
+        """读取脉冲提取器中各传感器上次读取以来的新脉冲（有帧序号的周期按帧序号对齐，其余按到达时间）"""
+        pulse_extractor.flush()
+        for topic, buffer in pulse_extractor.buffers.items():
+            start = self.cursors.get(topic, 0)
+            if start > buffer.total:
+                start = 0  # 脉冲提取器已清空重新开始
+            pulses = buffer.since(start)
+            self.cursors[topic] = buffer.total
+            if len(pulses["phase"]):
+                keys = cycle_keys(pulses["time"], self.period)
+                numbered = pulses["sequence"] >= 0
+                if numbered.any():
+                    keys[numbered] = self.sequence_keys(pulses["sequence"][numbered])
+                self.add_pulses(topic, pulses["time"], pulses["phase"], pulses["amplitude"], keys)
+
+    def update(self, pulse_extractor=None, now=None, final=False):
+        """关联滑动窗口中已经完整的脉冲并更新统计
+
+        Args:
+            pulse_extractor: 不为None时先读取其中的新脉冲
+            now: 当前时间（Unix时间），用于统计的衰减
+            final: 为True时关联窗口中的全部脉冲（不再等待）
+        Returns:
+            本次关联的同时出现事件数
+        """
+        if pulse_extractor is not None:
+            self.read_extractor(pulse_extractor)
+        if now is not None:
+            if self.last_time is not None and now > self.last_time:
+                self.decay(np.exp(-(now - self.last_time) / self.decay_seconds))
+            self.last_time = now
+
+        key = self.window["key"]
+        if not len(key):
+            return 0
+        ready = np.ones(len(key), dtype=bool) if final else key <= key.max() - JOIN_LAG
+        if not ready.any():
+            return 0
+        batch = {name: column[ready] for name, column in self.window.items()}
+        self.window = {name: column[~ready] for name, column in self.window.items()}
+        return self.correlate(batch)
+
+    def decay(self, factor):
+        for name in SENSOR_STATS:
+            getattr(self, name)[:] *= factor
+        self.pairs *= factor
+        self.events *= factor
+
+    def correlate(self, batch):
+        """关联一批脉冲（各传感器对齐键都已完整）"""
+        sensors = len(self.topics)
+        order, event = group_events(batch["key"], batch["phase"], self.phase_tolerance)
+        sensor = batch["sensor"][order]
+        amplitude = batch["amplitude"][order]
+        phase = batch["phase"][order]
+        events = int(event[-1]) + 1
+        self.pulses += np.bincount(sensor, minlength=sensors)
+
+        # 每个事件中各传感器的最大幅值和最早相位（未出现为0和inf）
+        peak = np.zeros((events, sensors))
+        np.maximum.at(peak, (event, sensor), amplitude)
+        first = np.full((events, sensors), np.inf)
+        np.minimum.at(first, (event, sensor), phase)
+        present = peak > 0
+        joint = present.sum(axis=1) >= self.min_sensors
+        if not joint.any():
+            return 0
+        peak = peak[joint]
+        present = present[joint]
+        first = first[joint]
+
+        strongest = peak.argmax(axis=1)
+        # 最早相位相同（同一采样点）时无法区分先后，不计入最早到达
+        earliest = first.argmin(axis=1)
+        distinct = (first == first.min(axis=1, keepdims=True)).sum(axis=1) == 1
+        ratio = peak / peak.max(axis=1, keepdims=True)
+        others = present.copy()
+        others[np.arange(len(strongest)), strongest] = False
+        self.events += len(peak)
+        self.coincident += present.sum(axis=0)
+        self.strongest += np.bincount(strongest, minlength=sensors)
+        self.earliest += np.bincount(earliest[distinct], minlength=sensors)
+        self.ratio_sum += np.where(others, ratio, 0.0).sum(axis=0)
+        self.ratio_count += others.sum(axis=0)
+        present = present.astype(np.float64)
+        self.pairs += present.T @ present
+        return len(peak)
+
+    def compartment(self, topic):
+        return self.compartments.get(topic) or topic
+
+    def report(self):
+        """各传感器的关联统计，按作为最强传感器的次数从多到少排列
+
+        Returns:
+            [{"topic", "compartment", "pulses", "coincident", "strongest", "earliest", "ratio"}]
+            strongest/earliest为占同时出现事件的比例，ratio为非最强时相对最强传感器的平均幅值比
+        """
+        events = max(self.events, 1e-12)
+        rows = []
+        for index, topic in enumerate(self.topics):
+            rows.append({
+                "topic": topic,
+                "compartment": self.compartment(topic),
+                "pulses": self.pulses[index],
+                "coincident": self.coincident[index],
+                "strongest": self.strongest[index] / events,
+                "earliest": self.earliest[index] / events,
+                "ratio": self.ratio_sum[index] / self.ratio_count[index] if self.ratio_count[index] else np.nan,
+            })
+        return sorted(rows, key=lambda row: -row["strongest"])
+
+    def likely_source(self):
+        """最可能的放电源(气室, 最强次数占比, 同时出现事件数)，事件不足时返回None
+
+        同一气室有多个传感器时按气室合计最强次数。
+        """
+        if self.events < MIN_EVENTS or not self.topics:
+            return None
+        totals = {}
+        for index, topic in enumerate(self.topics):
+            name = self.compartment(topic)
+            totals[name] = totals.get(name, 0.0) + self.strongest[index]
+        name = max(totals, key=totals.get)
+        return name, totals[name] / self.events, self.events
+
+    def status_text(self):
+        source = self.likely_source()
+        if source is None:
+            return ""
+        name, share, _ = source
+        return f"放电源: {name} ({share * 100:.0f}%)"
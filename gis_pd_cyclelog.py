@@ -0,0 +1,521 @@
+"""内存映射的追加式周期日志
+
+用于高速率连续记录的存储引擎，接口与DatabaseManager相同，可以直接替换。
+
+周期数据以固定长度的记录追加写入预先分配的段文件(segment_000000.cyc)：
+    timestamp  float64   Unix时间戳(秒)
+    sensor_id  uint16    传感器编号（由主题映射，见sensors.json）
+    length     uint16    有效采样点数
+    seq        uint32    该传感器的周期序号
+    samples    uint16[360]  ADC原始码值，mV = 码值 * 3.3 / 4096
+
+段文件通过np.memmap映射，写入只是内存拷贝，由操作系统负责落盘。
+每INDEX_STRIDE条记录在内存中保留一个时间戳作为稀疏索引，按时间查询时先在稀疏索引上
+二分定位，再在一个索引块内二分，读取结果直接是段文件的内存映射视图，不复制数据。
+
+原始数据(raw_data)的写入频率较低，仍然保存在日志目录下的raw.db中。
+按特征筛选(find_cycles)不需要额外的索引，直接对内存映射的记录分块做向量化计算。
+"""
+import os
+import json
+import datetime
+
+import numpy as np
+
+from gis_pd_perf import perf_monitor  # 性能计时
+from gis_pd_metrics import metrics  # Prometheus指标
+from gis_pd_storage import (DatabaseManager, TIMESTAMP_FORMAT, EXPORT_BATCH_SIZE, get_application_path,
+                            mv_to_codes, codes_to_mv, compute_cycle_features, make_cycle_batch)
+
+SAMPLES_PER_CYCLE = 360
+CYCLE_RECORD_DTYPE = np.dtype([
+    ("timestamp", "<f8"),
+    ("sensor_id", "<u2"),
+    ("length", "<u2"),
+    ("seq", "<u4"),
+    ("samples", "<u2", (SAMPLES_PER_CYCLE,)),
+])
+SEGMENT_RECORDS = 65536  # 每个段文件的记录数，约46MB
+INDEX_STRIDE = 256  # 稀疏时间索引的间隔（记录数）
+FLUSH_INTERVAL = 1024  # 每写入多少条记录同步一次段文件
+
+
+def iter_record_batches(views, names, wanted, batch_size):
+    """将记录视图按batch_size分块转换为导出批次（生成器）
+
+    Args:
+        views: read_range返回的[(全局起始序号, 记录数组视图)]
+        names: 传感器编号 -> 主题
+        wanted: 需要的传感器编号数组，None表示全部
+    """
+    for _, records in views:
+        for start in range(0, len(records), batch_size):
+            chunk = records[start:start + batch_size]
+            if wanted is not None:
+                chunk = chunk[np.isin(chunk["sensor_id"], wanted)]
+            if not len(chunk):
+                continue
+            # 同一批次中的采样点数必须相同
+            lengths = chunk["length"]
+            bounds = [0] + (np.flatnonzero(np.diff(lengths)) + 1).tolist() + [len(chunk)]
+            for lo, hi in zip(bounds[:-1], bounds[1:]):
+                part = chunk[lo:hi]
+                timestamps = [datetime.datetime.fromtimestamp(t).strftime(TIMESTAMP_FORMAT)
+                              for t in part["timestamp"].tolist()]
+                topics = [names.get(sensor_id, "") for sensor_id in part["sensor_id"].tolist()]
+                yield make_cycle_batch(timestamps, topics, part["seq"],
+                                       codes_to_mv(part["samples"][:, :int(lengths[lo])]))
+
+
+class CycleLogSegment:
+    """单个段文件"""
+    def __init__(self, path, number, writable):
+        self.path = path
+        self.number = number
+        if not os.path.exists(path):
+            # 预先分配整个段文件，写入时不需要扩展文件
+            with open(path, "wb") as f:
+                f.truncate(SEGMENT_RECORDS * CYCLE_RECORD_DTYPE.itemsize)
+        self.records = np.memmap(path, dtype=CYCLE_RECORD_DTYPE, mode="r+" if writable else "r",
+                                 shape=(SEGMENT_RECORDS,))
+        self.count = self.find_count()
+        # 稀疏时间索引: 第 k 项为第 k*INDEX_STRIDE 条记录的时间戳
+        self.index_times = np.array(self.records["timestamp"][:self.count:INDEX_STRIDE])
+
+    def find_count(self):
+        """已写入的记录数。未写入的记录时间戳为0，时间戳单调递增，因此可以二分查找"""
+        timestamps = self.records["timestamp"]
+        low, high = 0, SEGMENT_RECORDS
+        while low < high:
+            mid = (low + high) // 2
+            if timestamps[mid] > 0:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    @property
+    def first_time(self):
+        return float(self.records["timestamp"][0]) if self.count else None
+
+    @property
+    def last_time(self):
+        return float(self.records["timestamp"][self.count - 1]) if self.count else None
+
+    def search(self, timestamp, side):
+        """在段内查找时间戳的位置，先查稀疏索引，再在一个索引块内查找"""
+        block = int(np.searchsorted(self.index_times, timestamp, side=side))
+        start = max(0, (block - 1) * INDEX_STRIDE)
+        stop = min(self.count, block * INDEX_STRIDE + 1)
+        if start >= stop:
+            return self.count if block else 0
+        return start + int(np.searchsorted(self.records["timestamp"][start:stop], timestamp, side=side))
+
+    def close(self):
+        if self.records is not None:
+            if self.records.mode == "r+":
+                self.records.flush()
+            # np.memmap没有close方法，删除引用后由mmap对象关闭
+            self.records = None
+
+
+class CycleLogManager:
+    """追加式周期日志管理类，接口与DatabaseManager相同"""
+    def __init__(self, dir_name="gis_pd_cyclelog"):
+        self.log_dir = os.path.join(get_application_path(), dir_name)
+        self.db_path = self.log_dir  # 用于界面显示
+        print(f"周期日志目录: {self.log_dir}")
+
+        self.segments = []
+        self.sensor_ids = {}  # 主题 -> 传感器编号
+        self.sensor_seq = {}  # 传感器编号 -> 下一个周期序号
+        self.last_time = 0.0
+        self.unflushed = 0
+        self.raw_db = None
+        self.connected = False
+
+        try:
+            os.makedirs(self.log_dir, exist_ok=True)
+            self.load_sensors()
+            names = sorted(name for name in os.listdir(self.log_dir)
+                           if name.startswith("segment_") and name.endswith(".cyc"))
+            for i, name in enumerate(names):
+                self.segments.append(CycleLogSegment(os.path.join(self.log_dir, name),
+                                                     int(name[8:14]), i == len(names) - 1))
+            if not self.segments:
+                self.add_segment()
+            self.recover_state()
+            self.raw_db = DatabaseManager(os.path.join(self.log_dir, "raw.db"))
+            self.connected = True
+            print(f"周期日志打开成功: {len(self.segments)} 个段文件, {self.get_cycle_count()} 条记录")
+        except (OSError, ValueError) as e:
+            print(f"周期日志打开错误: {str(e)}")
+
+    def load_sensors(self):
+        """读取主题与传感器编号的对应关系，以及上次切换段文件时各传感器的周期序号"""
+        path = os.path.join(self.log_dir, "sensors.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.sensor_ids = json.load(f)
+        path = os.path.join(self.log_dir, "sequence.json")
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.sensor_seq = {int(k): v for k, v in json.load(f).items()}
+
+    def save_sequence(self):
+        """保存各传感器的下一个周期序号，重新打开时只需扫描最后一个段文件"""
+        with open(os.path.join(self.log_dir, "sequence.json"), "w", encoding="utf-8") as f:
+            json.dump(self.sensor_seq, f)
+
+    def get_sensor_id(self, topic):
+        """获取主题对应的传感器编号，新主题自动分配编号"""
+        topic = topic or ""
+        sensor_id = self.sensor_ids.get(topic)
+        if sensor_id is None:
+            sensor_id = len(self.sensor_ids)
+            self.sensor_ids[topic] = sensor_id
+            with open(os.path.join(self.log_dir, "sensors.json"), "w", encoding="utf-8") as f:
+                json.dump(self.sensor_ids, f, ensure_ascii=False, indent=2)
+        return sensor_id
+
+    def recover_state(self):
+        """恢复最后时间戳，并用最后一个段文件中的记录更新各传感器的序号"""
+        for segment in reversed(self.segments):
+            if segment.count:
+                self.last_time = segment.last_time
+                break
+        segment = self.segments[-1]
+        if segment.count:
+            records = segment.records[:segment.count]
+            sensor_ids = np.asarray(records["sensor_id"])
+            seqs = np.asarray(records["seq"])
+            for sensor_id in np.unique(sensor_ids).tolist():
+                last = int(seqs[sensor_ids == sensor_id][-1])
+                self.sensor_seq[sensor_id] = max(self.sensor_seq.get(sensor_id, 0), last + 1)
+
+    def add_segment(self):
+        """创建新的段文件，并将前一个段文件改为只读映射"""
+        number = self.segments[-1].number + 1 if self.segments else 0
+        if self.segments:
+            self.save_sequence()
+            previous = self.segments[-1]
+            previous.close()
+            self.segments[-1] = CycleLogSegment(previous.path, previous.number, False)
+        path = os.path.join(self.log_dir, f"segment_{number:06d}.cyc")
+        self.segments.append(CycleLogSegment(path, number, True))
+
+    def append_codes(self, sensor_id, codes, timestamps):
+        """批量追加周期记录
+
+        Args:
+            sensor_id: 传感器编号
+            codes: 形状为(n, 采样点数)的ADC码值数组
+            timestamps: 长度为n的Unix时间戳数组
+        """
+        codes = np.atleast_2d(codes)
+        # 时间戳保持单调递增（系统时间回拨时沿用上一条记录的时间）
+        timestamps = np.maximum.accumulate(np.maximum(np.asarray(timestamps, dtype=np.float64), self.last_time))
+        length = min(codes.shape[1], SAMPLES_PER_CYCLE)
+        seq = self.sensor_seq.get(sensor_id, 0)
+
+        written = 0
+        while written < len(codes):
+            segment = self.segments[-1]
+            if segment.count >= SEGMENT_RECORDS:
+                self.add_segment()
+                segment = self.segments[-1]
+            n = min(len(codes) - written, SEGMENT_RECORDS - segment.count)
+            block = segment.records[segment.count:segment.count + n]
+            block["sensor_id"] = sensor_id
+            block["length"] = length
+            block["seq"] = np.arange(seq + written, seq + written + n, dtype=np.uint32)
+            block["samples"][:, :length] = codes[written:written + n, :length]
+            # 时间戳最后写入，恢复时以时间戳非0判断记录是否完整
+            block["timestamp"] = timestamps[written:written + n]
+
+            # 更新稀疏索引
+            first_index = -(-segment.count // INDEX_STRIDE) * INDEX_STRIDE
+            if first_index < segment.count + n:
+                segment.index_times = np.concatenate(
+                    [segment.index_times, segment.records["timestamp"][first_index:segment.count + n:INDEX_STRIDE]])
+            segment.count += n
+            written += n
+
+        self.sensor_seq[sensor_id] = seq + written
+        self.last_time = float(timestamps[-1])
+        self.unflushed += written
+        if self.unflushed >= FLUSH_INTERVAL:
+            self.flush()
+        metrics.inc("gis_pd_db_rows_written_total", {"table": "cycle_log"}, written)
+
+    def flush(self):
+        """将当前段文件的修改同步到磁盘"""
+        if self.segments and self.segments[-1].records is not None:
+            self.segments[-1].records.flush()
+        self.unflushed = 0
+
+    @perf_monitor.timed("db.save_cycle_data")
+    def save_cycle_data(self, cycle_number, data, timestamp=None, topic=None, frame=None):
+        """保存周期数据（cycle_number和帧信息frame不保存，使用各传感器独立的周期序号）"""
+        if not self.connected:
+            return
+        if timestamp is None:
+            moment = datetime.datetime.now().timestamp()
+        else:
+            moment = datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+        try:
+            self.append_codes(self.get_sensor_id(topic), mv_to_codes(data)[np.newaxis, :], [moment])
+            return True
+        except (OSError, ValueError) as e:
+            print(f"保存周期数据错误: {str(e)}")
+            return False
+
+    def save_event(self, event):
+        """保存触发事件：事件的周期追加到周期日志，事件信息保存在raw.db的trigger_events表
+        
+        周期日志的时间戳必须单调递增，多个传感器的事件时间重叠时，
+        较晚保存的事件中早于日志末尾的时间戳按append_codes的规则顺延。
+        """
+        if not self.connected:
+            return
+        moments = [datetime.datetime.strptime(timestamp, TIMESTAMP_FORMAT).timestamp()
+                   for timestamp in event["timestamps"]]
+        try:
+            self.append_codes(self.get_sensor_id(event["topic"]), mv_to_codes(event["values"]), moments)
+        except (OSError, ValueError) as e:
+            print(f"保存触发事件错误: {str(e)}")
+            return False
+        return self.raw_db.save_event(event, store_cycles=False)
+
+    def get_trigger_events(self, limit=100, start_time=None, end_time=None):
+        """获取触发事件（raw.db）"""
+        if not self.connected:
+            return []
+        return self.raw_db.get_trigger_events(limit, start_time, end_time)
+
+    def save_alarm_event(self, event):
+        """保存报警事件（raw.db）"""
+        if not self.connected:
+            return
+        return self.raw_db.save_alarm_event(event)
+
+    def get_alarm_events(self, limit=100, start_time=None, end_time=None):
+        """获取报警事件（raw.db）"""
+        if not self.connected:
+            return []
+        return self.raw_db.get_alarm_events(limit, start_time, end_time)
+
+    def save_trend_rows(self, rows):
+        """保存趋势数据（raw.db）"""
+        if not self.connected:
+            return
+        return self.raw_db.save_trend_rows(rows)
+
+    def prune_trend_rows(self, before):
+        if not self.connected:
+            return
+        return self.raw_db.prune_trend_rows(before)
+
+    def get_trend_rows(self, level, topic, start_time, end_time):
+        """获取趋势数据（raw.db）"""
+        if not self.connected:
+            return []
+        return self.raw_db.get_trend_rows(level, topic, start_time, end_time)
+
+    def get_trend_topics(self):
+        if not self.connected:
+            return []
+        return self.raw_db.get_trend_topics()
+
+    def save_raw_data(self, broker, topic, raw_data, timestamp=None, frame=None, shift=0):
+        """保存原始数据（写入日志目录下的raw.db）"""
+        if not self.connected:
+            return
+        return self.raw_db.save_raw_data(broker, topic, raw_data, timestamp=timestamp, frame=frame, shift=shift)
+
+    def read_range(self, start, end):
+        """读取时间范围[start, end]内的记录
+
+        Args:
+            start, end: Unix时间戳
+        Returns:
+            [(全局起始序号, 记录数组视图)]，每个段文件一项，数组为内存映射视图，不复制数据
+        """
+        views = []
+        for segment in self.segments:
+            if not segment.count or segment.first_time > end or segment.last_time < start:
+                continue
+            lo = segment.search(start, "left")
+            hi = segment.search(end, "right")
+            if hi > lo:
+                views.append((segment.number * SEGMENT_RECORDS + lo, segment.records[lo:hi]))
+        return views
+
+    def read_latest(self, count, offset=0):
+        """读取最新的count条记录（跳过最新的offset条），返回格式同read_range，按时间顺序"""
+        views = []
+        skip, remaining = offset, count
+        for segment in reversed(self.segments):
+            if remaining <= 0:
+                break
+            hi = segment.count - min(skip, segment.count)
+            skip -= segment.count - hi
+            lo = max(0, hi - remaining)
+            if hi > lo:
+                views.insert(0, (segment.number * SEGMENT_RECORDS + lo, segment.records[lo:hi]))
+                remaining -= hi - lo
+        return views
+
+    def views_to_rows(self, views, newest_first=False):
+        """将记录视图转换为与cycle_data表相同格式的行: (id, 时间戳, 周期序号, 数据字符串)"""
+        rows = []
+        for first_id, records in views:
+            values = codes_to_mv(records["samples"])
+            for i, record in enumerate(records):
+                timestamp = datetime.datetime.fromtimestamp(float(record["timestamp"])).strftime(TIMESTAMP_FORMAT)
+                data = values[i, :record["length"]].tolist()
+                rows.append((first_id + i + 1, timestamp, int(record["seq"]), ','.join(map(str, data))))
+        if newest_first:
+            rows.reverse()
+        return rows
+
+    @staticmethod
+    def parse_time(text):
+        """将查询时间字符串转换为Unix时间戳"""
+        for fmt in (TIMESTAMP_FORMAT, "%Y-%m-%d %H:%M:%S"):
+            try:
+                return datetime.datetime.strptime(text, fmt).timestamp()
+            except ValueError:
+                continue
+        raise ValueError(f"无法解析时间: {text}")
+
+    @perf_monitor.timed("db.find_cycles")
+    def find_cycles(self, min_peak=None, min_pulses=None, start_time=None, end_time=None, limit=1000,
+                    chunk_size=8192):
+        """按特征值筛选周期数据，返回格式与DatabaseManager.find_cycles相同
+
+        周期日志不保存帧信息，帧序号和帧标志为None。
+        """
+        if not self.connected:
+            return []
+        try:
+            if start_time is not None and end_time is not None:
+                views = self.read_range(self.parse_time(start_time), self.parse_time(end_time))
+            else:
+                views = self.read_latest(self.get_cycle_count())
+        except ValueError as e:
+            print(f"按特征筛选周期数据错误: {str(e)}")
+            return []
+
+        rows = []
+        for first_id, records in views:
+            for start in range(0, len(records), chunk_size):
+                if len(rows) >= limit:
+                    return rows
+                chunk = records[start:start + chunk_size]
+                features = compute_cycle_features(codes_to_mv(chunk["samples"]))
+                mask = np.ones(len(chunk), dtype=bool)
+                if min_peak is not None:
+                    mask &= features[0] >= min_peak
+                if min_pulses is not None:
+                    mask &= features[3] >= min_pulses
+                for i in np.flatnonzero(mask)[:limit - len(rows)].tolist():
+                    row = self.views_to_rows([(first_id + start + i, chunk[i:i + 1])])[0]
+                    rows.append(row + tuple(column[i].item() for column in features) + (None, None))
+        return rows
+
+    @perf_monitor.timed("db.get_cycle_data")
+    def get_cycle_data(self, limit=100, offset=0):
+        """获取周期数据（按时间倒序）"""
+        if not self.connected:
+            return []
+        return self.views_to_rows(self.read_latest(limit, offset), newest_first=True)
+
+    def get_raw_data(self, limit=100, offset=0):
+        """获取原始数据"""
+        if not self.connected:
+            return []
+        return self.raw_db.get_raw_data(limit, offset)
+
+    def get_cycle_count(self):
+        """获取周期数据总数"""
+        return sum(segment.count for segment in self.segments)
+
+    def get_raw_count(self):
+        """获取原始数据总数"""
+        if not self.connected:
+            return 0
+        return self.raw_db.get_raw_count()
+
+    @perf_monitor.timed("db.get_latest_cycle_data")
+    def get_latest_cycle_data(self, count=1):
+        """获取最新的周期数据"""
+        if not self.connected:
+            return []
+        return self.views_to_rows(self.read_latest(count), newest_first=True)
+
+    @perf_monitor.timed("db.get_cycle_data_by_time")
+    def get_cycle_data_by_time(self, start_time, end_time):
+        """根据时间范围获取周期数据"""
+        if not self.connected:
+            return []
+        try:
+            views = self.read_range(self.parse_time(start_time), self.parse_time(end_time))
+        except ValueError as e:
+            print(f"根据时间范围获取周期数据错误: {str(e)}")
+            return []
+        return self.views_to_rows(views)
+
+    def get_raw_data_by_time(self, start_time, end_time):
+        """根据时间范围获取原始数据"""
+        if not self.connected:
+            return []
+        return self.raw_db.get_raw_data_by_time(start_time, end_time)
+
+    def iter_raw_data(self, start_time=None, end_time=None, chunk_size=500):
+        """按时间顺序分块读取原始数据（生成器）"""
+        if not self.connected:
+            return
+        yield from self.raw_db.iter_raw_data(start_time, end_time, chunk_size)
+
+    def iter_cycle_batches(self, start_time, end_time, topics=None, batch_size=EXPORT_BATCH_SIZE):
+        """按时间顺序分批读取周期数据，直接对内存映射视图分块转换，用于导出等后台任务
+
+        迭代期间不能关闭周期日志（视图引用段文件的内存映射）。
+        """
+        if not self.connected:
+            return iter(())
+        try:
+            views = self.read_range(self.parse_time(start_time), self.parse_time(end_time))
+        except ValueError as e:
+            print(f"读取周期数据错误: {str(e)}")
+            return iter(())
+        names = {sensor_id: topic for topic, sensor_id in self.sensor_ids.items()}
+        wanted = None
+        if topics:
+            wanted = np.array([self.sensor_ids[topic] for topic in topics if topic in self.sensor_ids],
+                              dtype=np.uint16)
+        return iter_record_batches(views, names, wanted, batch_size)
+
+    def maintenance_status(self):
+        """原始数据库(raw.db)的后台维护状态，段文件是预先分配的，不需要维护"""
+        return self.raw_db.maintenance_status() if self.raw_db is not None else ""
+
+    def flush_expired(self):
+        """周期直接写入内存映射文件，没有在内存中缓存的周期"""
+
+    def run_maintenance(self):
+        if self.raw_db is not None:
+            self.raw_db.run_maintenance()
+
+    def close(self):
+        """同步并关闭所有段文件"""
+        if not self.connected:
+            return
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+        self.save_sequence()
+        self.raw_db.close()
+        self.connected = False
+        print("周期日志已关闭")
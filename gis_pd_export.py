@@ -0,0 +1,268 @@
+"""周期数据批量导出
+
+从数据库管理器的iter_cycle_batches按批次读取周期数据，逐批写入文件，内存占用只与批次大小有关，
+可以导出数百万个周期。支持的格式（按文件扩展名选择）：
+    .csv  每行: 时间戳,主题,周期编号,采样点1..N（mV，两位小数），按批次格式化后一次写入
+    .npy  形状(周期数, 采样点数)的float32 mV矩阵
+    .npz  values(同.npy)、timestamps(datetime64[us])、cycle_numbers(int64)、
+          sensor_index(int16，对应topics中的下标)、topics(主题名)
+    .parquet / .arrow  列式格式（需要安装pyarrow），包含每个周期的特征值，见write_arrow_format
+
+.npy的数组头在写入结束后按实际行数改写，不需要预先统计周期数；
+.npz的各个数组先流式写入临时.npy文件，最后打包（ZIP_STORED，与np.savez相同）。
+"""
+import io
+import os
+import struct
+import zipfile
+import tempfile
+
+import numpy as np
+
+from gis_pd_storage import ADC_SCALE, SUMMARY_COLUMNS, mv_to_codes, compute_cycle_features
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None  # 未安装pyarrow时不支持列式格式
+
+NPY_HEADER_SIZE = 128  # 预留的.npy文件头长度，足够容纳任意行数的shape
+NPY_DTYPE = np.float32  # 导出的mV矩阵类型（原始数据为两位小数，float32精度足够）
+ROW_GROUP_SIZE = 16384  # Parquet每个行组的周期数（约12MB未压缩），行组越小按统计信息跳过的粒度越细
+DEFAULT_SAMPLES = 360  # 没有数据时列式文件表结构中的采样点数
+
+
+class ExportCancelled(Exception):
+    """导出被取消"""
+
+
+def npy_header(dtype, shape):
+    """生成固定长度的.npy(1.0版)文件头，用于写入结束后原位改写"""
+    header = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)),
+                   "fortran_order": False, "shape": tuple(shape)})
+    header = header.ljust(NPY_HEADER_SIZE - 11) + "\n"
+    return b"\x93NUMPY\x01\x00" + struct.pack("<H", len(header)) + header.encode("latin1")
+
+
+class NpyStreamWriter:
+    """流式写入.npy文件：逐批追加行，关闭时改写文件头中的行数"""
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.file = open(path, "wb")
+        self.row_shape = None
+        self.rows = 0
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        if self.row_shape is None:
+            self.row_shape = array.shape[1:]
+            self.file.write(npy_header(self.dtype, (0,) + self.row_shape))
+        elif array.shape[1:] != self.row_shape:
+            raise ValueError(f"数据形状不一致: {array.shape[1:]} != {self.row_shape}")
+        self.file.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self):
+        if self.row_shape is None:
+            self.row_shape = ()
+            self.file.write(npy_header(self.dtype, (0,)))
+        self.file.seek(0)
+        self.file.write(npy_header(self.dtype, (self.rows,) + self.row_shape))
+        self.file.close()
+
+
+def write_csv(batches, path, report):
+    """导出为CSV，每批的采样点用np.savetxt一次格式化"""
+    count = 0
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        for batch in batches:
+            values = batch["values"]
+            if count == 0:
+                f.write("timestamp,topic,cycle_number,"
+                        + ",".join(f"p{i + 1}" for i in range(values.shape[1])) + "\n")
+            buffer = io.StringIO()
+            np.savetxt(buffer, values, fmt="%.2f", delimiter=",")
+            lines = buffer.getvalue().splitlines()
+            f.write("".join(f"{timestamp},{topic},{cycle_number},{line}\n" for timestamp, topic, cycle_number, line
+                            in zip(batch["timestamps"], batch["topics"], batch["cycle_numbers"].tolist(), lines)))
+            count += len(values)
+            report(count, batch)
+    return count
+
+
+def write_npy(batches, path, report):
+    """导出为.npy（只包含mV矩阵）"""
+    writer = NpyStreamWriter(path, NPY_DTYPE)
+    try:
+        for batch in batches:
+            writer.append(batch["values"])
+            report(writer.rows, batch)
+    finally:
+        writer.close()
+    return writer.rows
+
+
+def write_npz(batches, path, report):
+    """导出为.npz，包含mV矩阵、时间戳、周期编号和传感器（主题）"""
+    topic_index = {}
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as temp_dir:
+        writers = {
+            "values": NpyStreamWriter(os.path.join(temp_dir, "values.npy"), NPY_DTYPE),
+            "timestamps": NpyStreamWriter(os.path.join(temp_dir, "timestamps.npy"), "datetime64[us]"),
+            "cycle_numbers": NpyStreamWriter(os.path.join(temp_dir, "cycle_numbers.npy"), np.int64),
+            "sensor_index": NpyStreamWriter(os.path.join(temp_dir, "sensor_index.npy"), np.int16),
+        }
+        try:
+            for batch in batches:
+                writers["values"].append(batch["values"])
+                writers["timestamps"].append(np.array(batch["timestamps"], dtype="datetime64[us]"))
+                writers["cycle_numbers"].append(batch["cycle_numbers"])
+                writers["sensor_index"].append(
+                    [topic_index.setdefault(topic, len(topic_index)) for topic in batch["topics"]])
+                report(writers["values"].rows, batch)
+        finally:
+            for writer in writers.values():
+                writer.close()
+        topics_path = os.path.join(temp_dir, "topics.npy")
+        np.save(topics_path, np.array(sorted(topic_index, key=topic_index.get), dtype=str))
+        with zipfile.ZipFile(path, "w", zipfile.ZIP_STORED, allowZip64=True) as archive:
+            for name, writer in writers.items():
+                archive.write(writer.path, name + ".npy")
+            archive.write(topics_path, "topics.npy")
+    return writers["values"].rows
+
+
+def arrow_available():
+    return pa is not None
+
+
+def arrow_schema(samples):
+    """列式导出的表结构，采样点保存为ADC码值(uint16)的定长列表，mV = 码值 * adc_scale_mv"""
+    fields = [
+        pa.field("timestamp", pa.timestamp("us")),
+        pa.field("sensor", pa.dictionary(pa.int16(), pa.string())),
+        pa.field("cycle_number", pa.int64()),
+        pa.field("samples", pa.list_(pa.uint16(), samples)),
+        pa.field("peak", pa.float32()),
+        pa.field("mean", pa.float32()),
+        pa.field("rms", pa.float32()),
+        pa.field("pulse_count", pa.int32()),
+        pa.field("peak_phase", pa.float32()),
+    ]
+    return pa.schema(fields, metadata={"adc_scale_mv": repr(ADC_SCALE), "samples_per_cycle": str(samples)})
+
+
+def arrow_table(batches, schema):
+    """将若干批次转换为一个Arrow表（采样点矩阵直接作为定长列表的底层数组，不逐行转换）"""
+    samples = schema.field("samples").type.list_size
+    values = np.concatenate([batch["values"] for batch in batches])
+    if values.shape[1] != samples:
+        raise ValueError(f"采样点数不一致: {values.shape[1]} != {samples}")
+    features = compute_cycle_features(values)
+    timestamps = np.concatenate([np.array(batch["timestamps"], dtype="datetime64[us]") for batch in batches])
+    topics = [topic for batch in batches for topic in batch["topics"]]
+    columns = [
+        pa.array(timestamps, type=pa.timestamp("us")),
+        pa.array(topics, type=pa.string()).dictionary_encode().cast(schema.field("sensor").type),
+        pa.array(np.concatenate([batch["cycle_numbers"] for batch in batches])),
+        pa.FixedSizeListArray.from_arrays(pa.array(mv_to_codes(values).ravel()), samples),
+    ]
+    for name, column in zip(SUMMARY_COLUMNS, features):
+        columns.append(pa.array(column.astype(schema.field(name).type.to_pandas_dtype())))
+    return pa.Table.from_arrays(columns, schema=schema)
+
+
+def write_arrow_format(batches, path, report, parquet):
+    """导出为Parquet或Arrow IPC文件
+    
+    批次累积到ROW_GROUP_SIZE个周期后一次写入（每次写入为一个行组），内存占用不超过一个行组。
+    Parquet按列保存每个行组的最小值/最大值统计，按时间、传感器或峰值筛选时
+    pandas/DuckDB/pyarrow可以跳过不相关的行组。
+    """
+    if pa is None:
+        raise ValueError("导出Parquet/Arrow格式需要安装pyarrow，请先执行 pip install pyarrow")
+    schema = writer = None
+    pending, pending_rows, count = [], 0, 0
+
+    def open_writer():
+        if parquet:
+            return pq.ParquetWriter(path, schema, compression="zstd")
+        return pa.ipc.new_file(path, schema)
+
+    try:
+        for batch in batches:
+            pending.append(batch)
+            pending_rows += len(batch["values"])
+            count += len(batch["values"])
+            if pending_rows >= ROW_GROUP_SIZE:
+                if writer is None:
+                    schema = arrow_schema(pending[0]["values"].shape[1])
+                    writer = open_writer()
+                writer.write_table(arrow_table(pending, schema), ROW_GROUP_SIZE)
+                pending, pending_rows = [], 0
+            report(count, batch)
+        if writer is None:
+            schema = arrow_schema(pending[0]["values"].shape[1] if pending else DEFAULT_SAMPLES)
+            writer = open_writer()
+        if pending:
+            writer.write_table(arrow_table(pending, schema), ROW_GROUP_SIZE)
+    finally:
+        if writer is not None:
+            writer.close()
+    return count
+
+
+def write_parquet(batches, path, report):
+    """导出为Parquet（zstd压缩）"""
+    return write_arrow_format(batches, path, report, parquet=True)
+
+
+def write_arrow(batches, path, report):
+    """导出为Arrow IPC文件，可用pyarrow.ipc.open_file以内存映射方式读取"""
+    return write_arrow_format(batches, path, report, parquet=False)
+
+
+EXPORT_FORMATS = {
+    ".csv": write_csv,
+    ".npy": write_npy,
+    ".npz": write_npz,
+    ".parquet": write_parquet,
+    ".arrow": write_arrow,
+}
+
+
+def export_cycles(batches, path, progress=None, should_stop=None):
+    """将周期数据批次写入文件，格式由扩展名决定
+
+    Args:
+        batches: 数据库管理器iter_cycle_batches返回的生成器
+        progress: 每写完一批调用progress(已导出周期数, 该批最后一个时间戳)
+        should_stop: 每批之前调用，返回True时取消导出并删除未完成的文件
+    Returns:
+        导出的周期数
+    Raises:
+        ExportCancelled: 导出被取消
+        ValueError: 不支持的文件格式
+    """
+    writer = EXPORT_FORMATS.get(os.path.splitext(path)[1].lower())
+    if writer is None:
+        raise ValueError(f"不支持的导出格式: {path}")
+
+    def report(count, batch):
+        if progress is not None:
+            progress(count, batch["timestamps"][-1])
+
+    def checked(batches):
+        for batch in batches:
+            if should_stop is not None and should_stop():
+                raise ExportCancelled()
+            yield batch
+
+    try:
+        return writer(checked(batches), path, report)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
@@ -0,0 +1,176 @@
+"""PRPD统计指纹
+
+PRPDStatistics按相位窗(bin)累加脉冲的计数、幅值和、幅值平方和以及最大幅值，每个周期的
+更新只涉及bins个数值（O(bins)），不需要重新扫描累积的周期数据。
+设置window时为滑动窗口：每个周期的贡献保存在环形数组中，周期移出窗口时从累加值中减去；
+最大幅值不能相减，读取时对窗口内每个周期的最大值再取最大。
+
+由累加值得到的相位分布（每个相位窗一个值）:
+    Hn(φ)     脉冲数
+    Hqmax(φ)  最大幅值
+    Hqn(φ)    平均幅值
+按正半周(0~180°)和负半周(180~360°)分别计算的指纹参数:
+    Sk, Ku    分布的偏斜度和峭度（以相位为自变量、分布值为权重；Ku为超额峭度，正态分布为0）
+以及正负半周之间的参数:
+    Qf        放电量因数，负半周与正半周平均脉冲幅值之比
+    cc        正负半周Hqn分布的互相关系数
+    mcc       修正互相关系数 = Qf * cc
+    Asy       脉冲数不对称度 = (N+ - N-) / (N+ + N-)
+"""
+import numpy as np
+
+PHASE_BINS = 72  # 相位窗数量（每个5°）
+DEFAULT_WINDOW = 1000  # 默认滑动窗口的周期数（50Hz时20秒），每个传感器的环形数组约1.2MB
+DISTRIBUTIONS = ("Hn", "Hqn", "Hqmax")
+
+
+def shape_moments(phases, weights):
+    """以weights为权重计算相位的偏斜度和峭度，权重全为0或分布退化时返回(nan, nan)"""
+    total = weights.sum()
+    if total <= 0:
+        return np.nan, np.nan
+    mean = (phases * weights).sum() / total
+    deviation = phases - mean
+    variance = (deviation ** 2 * weights).sum() / total
+    if variance <= 0:
+        return np.nan, np.nan
+    skewness = (deviation ** 3 * weights).sum() / total / variance ** 1.5
+    kurtosis = (deviation ** 4 * weights).sum() / total / variance ** 2 - 3.0
+    return skewness, kurtosis
+
+
+def compute_fingerprint(dist, phase_centers, cycles):
+    """由相位分布计算指纹参数
+
+    Args:
+        dist: PRPDStatistics.distributions()返回的相位分布（可以是其他线程中保存的副本）
+        phase_centers: 各相位窗的中心相位(度)
+        cycles: 统计的周期数
+    Returns:
+        {参数名: 数值}，无法计算的参数为nan
+    """
+    half = len(phase_centers) // 2
+    halves = (("+", slice(0, half)), ("-", slice(half, None)))
+    params = {"cycles": cycles}
+    for sign, part in halves:
+        params[f"N{sign}"] = dist["Hn"][part].sum()
+    for name in DISTRIBUTIONS:
+        for sign, part in halves:
+            sk, ku = shape_moments(phase_centers[part], dist[name][part])
+            params[f"Sk{sign}({name})"] = sk
+            params[f"Ku{sign}({name})"] = ku
+
+    n_pos, n_neg = params["N+"], params["N-"]
+    total_q = dist["Hqn"] * dist["Hn"]  # 每个相位窗的幅值和
+    q_pos = total_q[:half].sum() / n_pos if n_pos > 0 else np.nan
+    q_neg = total_q[half:].sum() / n_neg if n_neg > 0 else np.nan
+    params["Qf"] = q_neg / q_pos if q_pos > 0 else np.nan
+    positive, negative = dist["Hqn"][:half], dist["Hqn"][half:half * 2]
+    if positive.std() > 0 and negative.std() > 0:
+        params["cc"] = float(np.corrcoef(positive, negative)[0, 1])
+    else:
+        params["cc"] = np.nan
+    params["mcc"] = params["Qf"] * params["cc"]
+    params["Asy"] = (n_pos - n_neg) / (n_pos + n_neg) if n_pos + n_neg > 0 else np.nan
+    return params
+
+
+class PRPDStatistics:
+    """单个传感器的PRPD相位分布和指纹参数（增量计算）"""
+    def __init__(self, bins=PHASE_BINS, window=None):
+        """
+        Args:
+            bins: 相位窗数量（偶数，正负半周各一半）
+            window: 滑动窗口的周期数，None表示累计全部周期
+        """
+        self.bins = bins
+        self.window = window
+        self.phase_centers = (np.arange(bins) + 0.5) * (360.0 / bins)
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0  # 累计加入的周期数
+        self.count = np.zeros(self.bins)
+        self.sum_q = np.zeros(self.bins)
+        self.sum_q2 = np.zeros(self.bins)
+        self.max_q = np.zeros(self.bins)  # 累计模式下的最大幅值
+        self.since_resync = 0  # 滑动窗口上次重新求和以来加入的周期数
+        if self.window:
+            # 窗口内每个周期的贡献（单个周期的值用float32足够），第cycles % window行为下一个周期的位置
+            self.ring_count = np.zeros((self.window, self.bins), dtype=np.float32)
+            self.ring_sum_q = np.zeros((self.window, self.bins), dtype=np.float32)
+            self.ring_sum_q2 = np.zeros((self.window, self.bins), dtype=np.float32)
+            self.ring_max_q = np.zeros((self.window, self.bins), dtype=np.float32)
+
+    def add_pulses(self, cycle_index, phase, amplitude, cycles):
+        """加入一批周期的脉冲
+
+        Args:
+            cycle_index: 每个脉冲所在周期在本批中的下标(0..cycles-1)
+            phase, amplitude: 脉冲的相位(度)和幅值
+            cycles: 本批的周期数（包括没有脉冲的周期）
+        """
+        if cycles <= 0:
+            return
+        phase_bin = np.minimum((np.asarray(phase) * (self.bins / 360.0)).astype(np.int64), self.bins - 1)
+        key = np.asarray(cycle_index, dtype=np.int64) * self.bins + phase_bin
+        amplitude = np.asarray(amplitude, dtype=np.float64)
+        size = cycles * self.bins
+        count = np.bincount(key, minlength=size).reshape(cycles, self.bins).astype(np.float64)
+        sum_q = np.bincount(key, amplitude, minlength=size).reshape(cycles, self.bins)
+        sum_q2 = np.bincount(key, amplitude ** 2, minlength=size).reshape(cycles, self.bins)
+        max_q = np.zeros(size)
+        np.maximum.at(max_q, key, amplitude)
+        max_q = max_q.reshape(cycles, self.bins)
+
+        if not self.window:
+            self.count += count.sum(axis=0)
+            self.sum_q += sum_q.sum(axis=0)
+            self.sum_q2 += sum_q2.sum(axis=0)
+            np.maximum(self.max_q, max_q.max(axis=0), out=self.max_q)
+            self.cycles += cycles
+            return
+
+        # 滑动窗口：只有最后window个周期会留在窗口中
+        skipped = max(cycles - self.window, 0)
+        rows = (self.cycles + skipped + np.arange(cycles - skipped)) % self.window
+        for total, ring, new in ((self.count, self.ring_count, count), (self.sum_q, self.ring_sum_q, sum_q),
+                                 (self.sum_q2, self.ring_sum_q2, sum_q2)):
+            total -= ring[rows].sum(axis=0, dtype=np.float64)  # 移出窗口的周期
+            ring[rows] = new[skipped:]
+            total += ring[rows].sum(axis=0, dtype=np.float64)
+        self.ring_max_q[rows] = max_q[skipped:]
+        self.cycles += cycles
+        # 每经过一个窗口长度重新求和一次，消除反复加减累积的浮点误差
+        self.since_resync += cycles
+        if self.since_resync >= self.window:
+            self.count = self.ring_count.sum(axis=0, dtype=np.float64)
+            self.sum_q = self.ring_sum_q.sum(axis=0, dtype=np.float64)
+            self.sum_q2 = self.ring_sum_q2.sum(axis=0, dtype=np.float64)
+            self.since_resync = 0
+
+    def window_cycles(self):
+        """当前统计的周期数"""
+        return min(self.cycles, self.window) if self.window else self.cycles
+
+    def distributions(self):
+        """相位分布Hn、Hqn、Hqmax以及每个相位窗的幅值标准差Hqstd"""
+        count = np.maximum(self.count, 0)  # 滑动窗口相减后的舍入误差
+        max_q = self.ring_max_q.max(axis=0).astype(np.float64) if self.window else self.max_q.copy()
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_q = np.where(count > 0, self.sum_q / count, 0.0)
+            variance = np.where(count > 0, self.sum_q2 / count - mean_q ** 2, 0.0)
+        return {
+            "Hn": count,
+            "Hqn": mean_q,
+            "Hqmax": max_q,
+            "Hqstd": np.sqrt(np.maximum(variance, 0.0)),
+        }
+
+    def snapshot(self):
+        """相位分布的副本(分布, 相位窗中心, 周期数)，可以交给其他线程计算指纹参数"""
+        return self.distributions(), self.phase_centers, self.window_cycles()
+
+    def fingerprint(self):
+        """计算指纹参数，返回{参数名: 数值}，无法计算的参数为nan"""
+        return compute_fingerprint(self.distributions(), self.phase_centers, self.window_cycles())
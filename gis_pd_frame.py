@@ -0,0 +1,281 @@
+"""数据帧解析、帧校验和相位对齐
+
+传感器每个工频周期发送一帧（大端uint16）:
+    字0      帧头: 高字节为帧标志0xA5，低字节为传感器编号
+    字1      帧序号（0~65535循环）
+    字2      同步相位: 第0个采样点相对工频电压正向过零点的相位，单位0.01°（0~35999）
+    字3      增益码
+    字4~N+3  N个采样点（ADC码值）
+    最后一个字  帧尾，固定为0xAABB
+目前的传感器固件不填写帧序号和同步相位，这两个字固定为0x0203和0x0405。是否填写按传感器判断
+（HeaderWord），不按单帧的值判断：真实的帧序号每次循环都会经过0x0203，同步相位也可能正好为10.29°。
+帧序号在相邻帧之间变化后认为已填写，同步相位出现0x0405以外的值后认为已填写；连续PLACEHOLDER_FRAMES帧
+保持不变（同步相位为保持0x0405）时认为未填写，未填写的字解析为None（未提供）。
+帧格式没有校验和，FrameChecker检查帧标志、帧尾和帧长度（4 + 360 + 1个字），结构错误的帧为损坏帧。
+
+帧中有帧序号时，FrameChecker按传感器跟踪序号（与IPsec的防重放窗口相同的方法）:
+最近收到的最大序号和其后SEQUENCE_WINDOW个序号是否已收到的位图，每帧O(1):
+    序号增加d        d > 1时中间的d - 1帧计为丢失（FRAME_GAP）
+    序号在窗口内且已收到  重复帧（FRAME_DUPLICATE，例如MQTT QoS 1的重复投递）
+    序号在窗口内且未收到  乱序帧（FRAME_REORDERED），之前计为丢失的帧数减1
+    序号跳变超过MAX_SEQUENCE_GAP或落后超过窗口  传感器重新启动（FRAME_RESTART），重新开始跟踪
+帧标志（按位组合）随周期保存在cycle_summary.frame_flags，各类计数同时计入Prometheus指标。
+
+PRPD图、脉冲提取和特征计算都按采样点下标线性对应0~360°，只有第0个采样点正好在电压过零点时
+相位分析才有意义。PhaseAligner把每个周期循环移动 (同步相位 + 传感器校准偏移) 对应的采样点数，
+使第0个采样点对应0°。按整数个采样点移动（360个采样点时误差不超过0.5°），不插值，
+脉冲幅值不会被平滑。
+"""
+import struct
+
+import numpy as np
+
+from gis_pd_metrics import metrics  # Prometheus指标
+
+FRAME_MARKER = 0xA5  # 帧头第一个字的高字节
+FRAME_TRAILER = 0xAABB  # 帧尾
+HEADER_WORDS = 4  # 帧头字数
+TRAILER_WORDS = 1  # 帧尾字数
+SAMPLES_PER_FRAME = 360  # 每帧的采样点数
+FRAME_BYTES = (HEADER_WORDS + SAMPLES_PER_FRAME + TRAILER_WORDS) * 2
+SYNC_PLACEHOLDER = 0x0405  # 固件未填写同步相位时的固定值（未填写的帧序号固定为0x0203，按不变判断）
+PLACEHOLDER_FRAMES = 10  # 帧序号或同步相位连续保持不变的帧数达到该值时认为固件未填写
+SYNC_PHASE_SCALE = 0.01  # 同步相位的单位(°)
+SEQUENCE_MODULUS = 0x10000  # 帧序号为uint16，循环计数
+SEQUENCE_WINDOW = 64  # 检测重复帧和乱序帧的窗口（帧数）
+MAX_SEQUENCE_GAP = 3000  # 序号一次增加超过该值视为传感器重新启动，不计为丢帧（50Hz时为1分钟）
+
+# 帧标志（按位组合）
+FRAME_BAD_MARKER = 1
+FRAME_BAD_TRAILER = 2
+FRAME_BAD_LENGTH = 4
+FRAME_GAP = 8  # 与上一帧之间有丢失的帧
+FRAME_DUPLICATE = 16
+FRAME_REORDERED = 32
+FRAME_RESTART = 64
+FRAME_DAMAGED = FRAME_BAD_MARKER | FRAME_BAD_TRAILER | FRAME_BAD_LENGTH  # 损坏帧，不进入分析
+# 帧标志 -> (指标中的原因, 显示名称)
+FRAME_FLAGS = {
+    FRAME_BAD_MARKER: ("marker", "帧标志错误"),
+    FRAME_BAD_TRAILER: ("trailer", "帧尾错误"),
+    FRAME_BAD_LENGTH: ("length", "长度错误"),
+    FRAME_GAP: ("gap", "丢帧之后"),
+    FRAME_DUPLICATE: ("duplicate", "重复帧"),
+    FRAME_REORDERED: ("reordered", "乱序帧"),
+    FRAME_RESTART: ("restart", "序号重新开始"),
+}
+# 每个传感器的帧统计
+FRAME_STATS = ("frames", "damaged", "lost", "duplicate", "reordered", "restart")
+
+
+class FrameHeader:
+    """解析后的帧头、帧尾和校验结果"""
+    __slots__ = ("marker", "sensor_id", "sequence", "sync_phase", "gain", "trailer", "flags", "lost")
+
+    def __init__(self, marker, sensor_id, sequence, sync_phase, gain, trailer=FRAME_TRAILER, flags=0):
+        self.marker = marker  # 帧标志
+        self.sensor_id = sensor_id  # 传感器编号
+        self.sequence = sequence  # 帧序号，未提供时为None
+        self.sync_phase = sync_phase  # 同步相位(°)，未提供时为None
+        self.gain = gain  # 增益码
+        self.trailer = trailer  # 帧尾
+        self.flags = flags  # 帧标志（FRAME_*按位组合）
+        self.lost = 0  # 与上一帧之间丢失的帧数
+
+    @property
+    def valid(self):
+        """帧标志是否正确"""
+        return self.marker == FRAME_MARKER
+
+    @property
+    def damaged(self):
+        """帧结构错误（帧标志、帧尾或长度）"""
+        return bool(self.flags & FRAME_DAMAGED)
+
+    def __repr__(self):
+        return (f"FrameHeader(sensor_id={self.sensor_id}, sequence={self.sequence}, "
+                f"sync_phase={self.sync_phase}, gain={self.gain}, flags={self.flags})")
+
+
+def parse_frame_header(payload):
+    """解析帧头和帧尾并检查帧结构（payload为bytes），长度不足帧头加帧尾时返回None
+
+    帧序号和同步相位按帧中的值解析（超出0~360°的同步相位为None），固件是否填写由FrameChecker按传感器判断。
+    """
+    if len(payload) < (HEADER_WORDS + TRAILER_WORDS) * 2:
+        return None
+    first, sequence, sync, gain = struct.unpack_from(">4H", payload)
+    sync_phase = sync * SYNC_PHASE_SCALE if sync * SYNC_PHASE_SCALE < 360 else None
+    header = FrameHeader(first >> 8, first & 0xFF, sequence, sync_phase, gain,
+                         struct.unpack_from(">H", payload, len(payload) - len(payload) % 2 - 2)[0])
+    if header.marker != FRAME_MARKER:
+        header.flags |= FRAME_BAD_MARKER
+    if header.trailer != FRAME_TRAILER:
+        header.flags |= FRAME_BAD_TRAILER
+    if len(payload) != FRAME_BYTES:
+        header.flags |= FRAME_BAD_LENGTH
+    return header
+
+
+def flags_text(flags):
+    """帧标志的显示文本"""
+    if not flags:
+        return "正常"
+    return "、".join(name for flag, (_, name) in FRAME_FLAGS.items() if flags & flag)
+
+
+class HeaderWord:
+    """按传感器判断固件是否填写帧头中的一个字（帧序号或同步相位）
+
+    placeholder为None时该字在相邻帧之间变化后认为已填写，否则出现不同于placeholder的值后认为已填写；
+    连续PLACEHOLDER_FRAMES帧保持不变（指定placeholder时为保持该值）时认为未填写。
+    """
+    def __init__(self, placeholder=None, frames=PLACEHOLDER_FRAMES):
+        self.placeholder = placeholder
+        self.frames = frames
+        self.value = None  # 上一帧中的值
+        self.repeats = 0  # 连续保持不变的帧数
+        self.provided = False
+
+    def update(self, value):
+        """记录一帧中该字的值，返回该传感器是否填写该字"""
+        if value == self.value:
+            self.repeats += 1
+        else:
+            if self.placeholder is None and self.value is not None:
+                self.provided = True
+            self.value, self.repeats = value, 1
+        if self.placeholder is not None and value != self.placeholder:
+            self.provided = True
+        elif self.repeats >= self.frames:
+            self.provided = False
+        return self.provided
+
+
+class SensorFrames:
+    """单个传感器的帧序号跟踪状态和统计"""
+    def __init__(self):
+        self.last = None  # 收到的最大帧序号
+        self.window = 0  # 位图，第i位表示序号last - i已收到
+        self.sequence_word = HeaderWord()  # 固件是否填写帧序号
+        self.sync_word = HeaderWord(SYNC_PLACEHOLDER)  # 固件是否填写同步相位
+        for name in FRAME_STATS:
+            setattr(self, name, 0)
+
+
+class FrameChecker:
+    """检查帧结构和帧序号，每个实例只在一个线程中使用（实时数据在MQTT线程，回放数据在回放线程，界面线程只读取统计）"""
+    def __init__(self, window=SEQUENCE_WINDOW, max_gap=MAX_SEQUENCE_GAP):
+        self.window = window
+        self.max_gap = max_gap
+        self.sensors = {}  # 主题 -> SensorFrames
+
+    def check(self, topic, payload):
+        """解析并检查一帧，返回FrameHeader（长度不足时返回None，计为损坏帧）
+
+        帧标志和丢帧数写入返回的FrameHeader，并计入指标；该传感器的固件未填写的帧序号和同步相位为None。
+        """
+        sensor = self.sensors.get(topic)
+        if sensor is None:
+            sensor = self.sensors[topic] = SensorFrames()
+        sensor.frames += 1
+        header = parse_frame_header(payload)
+        if header is None:
+            sensor.damaged += 1
+            metrics.inc("gis_pd_frame_errors_total", {"topic": topic, "reason": "length"})
+            return None
+        if header.damaged:
+            sensor.damaged += 1
+            # 损坏帧的帧头不可靠，不参与判断
+            if not sensor.sequence_word.provided:
+                header.sequence = None
+            if not sensor.sync_word.provided:
+                header.sync_phase = None
+        else:
+            if not sensor.sync_word.update(struct.unpack_from(">H", payload, 4)[0]):
+                header.sync_phase = None
+            if sensor.sequence_word.update(header.sequence):
+                self.check_sequence(sensor, header)
+            else:
+                header.sequence = None
+        if header.flags:
+            for flag, (reason, _) in FRAME_FLAGS.items():
+                if header.flags & flag and flag != FRAME_GAP:
+                    metrics.inc("gis_pd_frame_errors_total", {"topic": topic, "reason": reason})
+        if header.lost:
+            metrics.inc("gis_pd_frames_lost_total", {"topic": topic}, header.lost)
+        return header
+
+    def check_sequence(self, sensor, header):
+        sequence = header.sequence
+        if sensor.last is None:
+            sensor.last, sensor.window = sequence, 1
+            return
+        delta = (sequence - sensor.last) % SEQUENCE_MODULUS
+        if delta >= SEQUENCE_MODULUS // 2:
+            delta -= SEQUENCE_MODULUS  # 比最大序号小（较早的帧）
+        if delta > self.max_gap or delta <= -self.window:
+            header.flags |= FRAME_RESTART
+            sensor.restart += 1
+            sensor.last, sensor.window = sequence, 1
+        elif delta > 0:
+            if delta > 1:
+                header.flags |= FRAME_GAP
+                header.lost = delta - 1
+                sensor.lost += delta - 1
+            sensor.last = sequence
+            sensor.window = ((sensor.window << delta) | 1) & ((1 << self.window) - 1)
+        elif sensor.window >> -delta & 1:
+            header.flags |= FRAME_DUPLICATE
+            sensor.duplicate += 1
+        else:
+            # 之前计为丢失的帧迟到
+            header.flags |= FRAME_REORDERED
+            sensor.reordered += 1
+            sensor.lost = max(sensor.lost - 1, 0)
+            sensor.window |= 1 << -delta
+
+    def stats(self, topic):
+        """传感器的帧统计{FRAME_STATS中的名称: 次数}，没有收到过帧时返回None"""
+        sensor = self.sensors.get(topic)
+        if sensor is None:
+            return None
+        return {name: getattr(sensor, name) for name in FRAME_STATS}
+
+
+def rotate_cycle(data, shift):
+    """循环移动一个周期（与np.roll(data, shift)相同），列表直接切片，不转换为数组"""
+    shift %= len(data)
+    if not shift:
+        return data
+    if isinstance(data, list):
+        return data[-shift:] + data[:-shift]
+    return np.roll(np.asarray(data), shift)
+
+
+class PhaseAligner:
+    """按传感器（MQTT主题）把周期对齐到电压过零点，在调用线程中使用"""
+    def __init__(self, offsets=None):
+        """
+        Args:
+            offsets: {主题: 校准偏移(°)}，为传感器第0个采样点相对电压过零点的相位
+                     （帧中有同步相位时为在同步相位之外的附加偏移，例如耦合回路的相移）
+        """
+        self.offsets = dict(offsets or {})
+
+    def phase_offset(self, topic, header=None):
+        """第0个采样点相对电压过零点的相位(°) = 同步相位 + 校准偏移"""
+        offset = self.offsets.get(topic or "", 0.0)
+        if header is not None and header.sync_phase is not None:
+            offset += header.sync_phase
+        return offset
+
+    def shift(self, topic, header, samples):
+        """对齐需要循环移动的采样点数"""
+        return int(round(self.phase_offset(topic, header) * samples / 360.0)) % samples if samples else 0
+
+    def align(self, topic, data, header=None):
+        """返回对齐后的周期（偏移为0时原样返回）"""
+        if not len(data):
+            return data
+        return rotate_cycle(data, self.shift(topic, header, len(data)))
@@ -0,0 +1,210 @@
+"""数据库后台维护
+
+DatabaseMaintenance在后台线程中定期检查，写入空闲时执行以下维护任务：
+    - WAL检查点(PASSIVE)：把-wal文件中的页写回数据库文件，不等待读连接，不阻塞写入
+    - PRAGMA optimize：按需更新查询规划器使用的统计信息
+    - ANALYZE：重新收集索引统计信息，使用analysis_limit限制每个索引的扫描行数
+    - 增量清理：auto_vacuum=INCREMENTAL的数据库分步回收空闲页（旧版本创建的数据库不支持，只统计碎片率）
+
+所有任务都作为普通写操作提交给DatabaseWriter，与实时写入在同一个写连接上排队执行，
+因此不会与写入争抢写锁；每个任务（增量清理的每一步）都很短，不会使写入队列积压。
+写入繁忙时推迟执行，推迟超过两个周期后仍然执行一次。
+"""
+import os
+import time
+import sqlite3
+import datetime
+import threading
+
+from gis_pd_perf import perf_monitor  # 性能计时
+
+LOW_ACTIVITY_RATE = 5.0  # 写操作速率低于该值(次/秒)且写入队列为空时视为空闲
+ANALYSIS_LIMIT = 1000  # ANALYZE和optimize时每个索引最多扫描的行数
+VACUUM_STEP_PAGES = 256  # 增量清理每一步回收的页数
+VACUUM_MAX_STEPS = 64  # 每次增量清理最多执行的步数
+VACUUM_MIN_FREE_RATIO = 0.05  # 空闲页比例超过该值时才执行增量清理
+MAX_STEP_SECONDS = 0.2  # 单步耗时超过该值时停止本次增量清理，把写连接让给实时写入
+
+# 任务名称 -> (显示名称, 默认执行间隔(秒))
+MAINTENANCE_TASKS = {
+    "checkpoint": ("检查点", 60),
+    "optimize": ("optimize", 3600),
+    "analyze": ("ANALYZE", 24 * 3600),
+    "vacuum": ("增量清理", 3600),
+}
+
+
+class DatabaseMaintenance(threading.Thread):
+    """数据库维护线程，维护操作通过writer在写入线程中执行"""
+    def __init__(self, writer, db_path, tick=5.0, intervals=None):
+        """
+        Args:
+            writer: 数据库的DatabaseWriter
+            db_path: 数据库文件路径，用于统计文件大小
+            tick: 检查间隔(秒)
+            intervals: 覆盖默认的任务执行间隔，{任务名称: 秒}
+        """
+        super().__init__(name="db-maintenance", daemon=True)
+        self.writer = writer
+        self.db_path = db_path
+        self.tick = tick
+        self.intervals = {name: interval for name, (_, interval) in MAINTENANCE_TASKS.items()}
+        self.intervals.update(intervals or {})
+        now = time.time()
+        self.last_run = {name: now for name in self.intervals}
+        self.last_write_count = writer.write_count
+        self.last_tick = now
+        self.force = False  # 为True时下一次检查立即执行所有任务
+        self.wakeup = threading.Event()
+        self.stopped = False
+        self.lock = threading.Lock()  # 保护以下状态，界面线程读取
+        self.last_round = None  # 最近一次执行的任务: (完成时刻, [(任务名称, 耗时(秒), 说明)])
+        self.stats = {}  # 文件大小、页数、空闲页数等
+
+    def run(self):
+        # 从未收集过统计信息的数据库尽快执行一次ANALYZE
+        try:
+            has_stats = self.writer.call(lambda conn: conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None)
+        except sqlite3.Error as e:
+            print(f"数据库维护错误: {str(e)}")
+            return
+        if not has_stats:
+            self.last_run["analyze"] = 0.0
+        while not self.stopped:
+            self.wakeup.wait(self.tick)
+            self.wakeup.clear()
+            if self.stopped:
+                break
+            try:
+                self.run_due_tasks()
+            except sqlite3.Error as e:
+                print(f"数据库维护错误: {str(e)}")
+
+    def stop(self):
+        self.stopped = True
+        self.wakeup.set()
+        if self.is_alive():
+            self.join()
+
+    def run_now(self):
+        """请求立即执行所有维护任务"""
+        self.force = True
+        self.wakeup.set()
+
+    def is_idle(self):
+        """根据上次检查以来的写操作速率和写入队列长度判断写入是否空闲"""
+        now = time.time()
+        write_count = self.writer.write_count
+        rate = (write_count - self.last_write_count) / max(now - self.last_tick, 1e-3)
+        self.last_write_count, self.last_tick = write_count, now
+        return self.writer.pending_count() == 0 and rate <= LOW_ACTIVITY_RATE
+
+    def run_due_tasks(self):
+        idle = self.is_idle()
+        force, self.force = self.force, False
+        now = time.time()
+        finished = []
+        for name, interval in self.intervals.items():
+            elapsed = now - self.last_run[name]
+            if force or (elapsed >= interval and idle) or elapsed >= 2 * interval:
+                if self.stopped:
+                    return
+                finished.append(self.run_task(name))
+        self.update_stats()
+        if finished:
+            with self.lock:
+                self.last_round = (datetime.datetime.now(), finished)
+
+    def run_task(self, name):
+        """执行一个维护任务，返回(任务名称, 耗时(秒), 说明)"""
+        start = time.perf_counter()
+        with perf_monitor.measure(f"db.maintenance.{name}"):
+            detail = getattr(self, f"task_{name}")()
+        self.last_run[name] = time.time()
+        return name, time.perf_counter() - start, detail
+
+    def task_checkpoint(self):
+        def checkpoint(conn):
+            conn.commit()  # 检查点不能在写事务中执行，先提交同一批中的实时写入
+            busy, log_pages, checkpointed = conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchone()
+            return f"{checkpointed}/{log_pages}页"
+        return self.writer.call(checkpoint)
+
+    def task_optimize(self):
+        def optimize(conn):
+            conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            conn.execute("PRAGMA optimize")
+        self.writer.call(optimize)
+        return ""
+
+    def task_analyze(self):
+        def analyze(conn):
+            conn.execute(f"PRAGMA analysis_limit={ANALYSIS_LIMIT}")
+            conn.execute("ANALYZE")
+        self.writer.call(analyze)
+        return ""
+
+    def task_vacuum(self):
+        """分步增量清理，每一步是一个独立的写操作，实时写入可以插在两步之间"""
+        def free_pages(conn):
+            mode = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+            page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+            freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+            return mode, page_count, freelist
+
+        mode, page_count, freelist = self.writer.call(free_pages)
+        if mode != 2:
+            return "未启用增量清理"
+        if not freelist or freelist < VACUUM_MIN_FREE_RATIO * page_count:
+            return "无需清理"
+
+        reclaimed = 0
+        for _ in range(VACUUM_MAX_STEPS):
+            if self.stopped or not freelist:
+                break
+            step_start = time.perf_counter()
+            # execute只执行一步（每步释放一页），executescript会执行到结束（并先提交之前的写入）
+            self.writer.call(lambda conn: conn.executescript(f"PRAGMA incremental_vacuum({VACUUM_STEP_PAGES});"))
+            remaining = self.writer.call(lambda conn: conn.execute("PRAGMA freelist_count").fetchone()[0])
+            reclaimed += freelist - remaining
+            freelist = remaining
+            if time.perf_counter() - step_start > MAX_STEP_SECONDS:
+                break
+        return f"回收{reclaimed}页"
+
+    def update_stats(self):
+        """统计文件大小和碎片率（空闲页比例）"""
+        def page_stats(conn):
+            return tuple(conn.execute(f"PRAGMA {name}").fetchone()[0]
+                         for name in ("page_count", "freelist_count", "page_size", "auto_vacuum"))
+
+        page_count, freelist, page_size, mode = self.writer.call(page_stats)
+        wal_path = self.db_path + "-wal"
+        with self.lock:
+            self.stats = {
+                "file_bytes": os.path.getsize(self.db_path) if os.path.exists(self.db_path) else 0,
+                "wal_bytes": os.path.getsize(wal_path) if os.path.exists(wal_path) else 0,
+                "page_count": page_count,
+                "freelist_count": freelist,
+                "page_size": page_size,
+                "free_ratio": freelist / page_count if page_count else 0.0,
+                "incremental_vacuum": mode == 2,
+            }
+
+    def status_text(self):
+        """状态栏显示的维护信息：最近一次执行的任务耗时、文件大小和碎片率"""
+        with self.lock:
+            last_round = self.last_round
+            stats = dict(self.stats)
+        parts = []
+        if last_round is not None:
+            finished, tasks = last_round
+            parts.append(f"维护 {finished.strftime('%H:%M')}")
+            for name, seconds, detail in tasks:
+                text = f"{MAINTENANCE_TASKS[name][0]} {seconds * 1000:.0f}ms"
+                parts.append(f"{text}({detail})" if detail else text)
+        if stats:
+            parts.append(f"文件 {(stats['file_bytes'] + stats['wal_bytes']) / 1048576:.1f}MB, "
+                         f"空闲页 {stats['free_ratio'] * 100:.1f}%")
+        return " ".join(parts)
@@ -0,0 +1,196 @@
+"""Prometheus/OpenMetrics指标导出
+
+在后台线程中提供本地HTTP /metrics 接口，使用Prometheus文本格式输出：
+    - 各主题的消息数、字节数和丢帧数（计数器，由Prometheus计算速率）
+    - 消息队列深度、MQTT连接状态（采集时读取的实时值）
+    - 各处理阶段（解码、数据库写入、重绘等）的耗时分位数，来自gis_pd_perf的计时
+    - 数据库写入的行数和提交次数（两者之比即为平均批量大小）
+    - 进程常驻内存(RSS)
+
+只使用标准库，不依赖prometheus_client。
+"""
+import os
+import sys
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from gis_pd_perf import perf_monitor
+
+DEFAULT_METRICS_PORT = 9108
+
+
+def read_rss_bytes():
+    """读取当前进程的常驻内存(字节)"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return rss if sys.platform == "darwin" else rss * 1024
+    except ImportError:
+        return 0
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class MetricsRegistry:
+    """指标注册表
+
+    未启用时所有记录操作直接返回，对数据处理流程几乎没有影响。
+    """
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.metadata = {}  # 指标名 -> (类型, 说明)
+        self.values = {}  # (指标名, 标签元组) -> 数值
+        self.callbacks = {}  # 指标名 -> 采集时调用的函数，返回数值
+        self.start_time = time.time()
+
+        self.describe("gis_pd_messages_total", "counter", "接收到的MQTT消息数")
+        self.describe("gis_pd_message_bytes_total", "counter", "接收到的MQTT消息字节数")
+        self.describe("gis_pd_dropped_frames_total", "counter", "消息队列已满而丢弃的帧数")
+        self.describe("gis_pd_db_rows_written_total", "counter", "写入数据库的行数")
+        self.describe("gis_pd_db_commits_total", "counter", "数据库提交次数")
+        self.describe("gis_pd_redraws_total", "counter", "图表重绘次数")
+        self.describe("gis_pd_trigger_events_total", "counter", "触发记录保存的事件数")
+        self.describe("gis_pd_alarm_events_total", "counter", "报警规则产生的事件数")
+        self.describe("gis_pd_frame_errors_total", "counter", "损坏、重复、乱序和序号重新开始的帧数（按原因）")
+        self.describe("gis_pd_frames_lost_total", "counter", "按帧序号检测到的丢失帧数")
+
+    def describe(self, name, metric_type, help_text):
+        self.metadata[name] = (metric_type, help_text)
+
+    def inc(self, name, labels=None, value=1):
+        """计数器加value"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def set(self, name, value, labels=None):
+        """设置仪表值"""
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())) if labels else ())
+        with self.lock:
+            self.values[key] = value
+
+    def register_callback(self, name, help_text, func):
+        """注册在采集时读取的仪表，例如队列深度"""
+        self.describe(name, "gauge", help_text)
+        self.callbacks[name] = func
+
+    def render(self):
+        """生成Prometheus文本格式的指标"""
+        lines = []
+        with self.lock:
+            values = dict(self.values)
+
+        # 计数器和仪表
+        grouped = {}
+        for (name, labels), value in values.items():
+            grouped.setdefault(name, []).append((labels, value))
+        for name in sorted(grouped):
+            metric_type, help_text = self.metadata.get(name, ("gauge", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in sorted(grouped[name]):
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+
+        # 采集时读取的仪表
+        for name, func in sorted(self.callbacks.items()):
+            try:
+                value = func()
+            except Exception:
+                continue
+            _, help_text = self.metadata[name]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {value}")
+
+        # 各阶段耗时（来自性能计时器的滚动窗口）
+        summary = perf_monitor.summary()
+        if summary:
+            name = "gis_pd_stage_duration_seconds"
+            lines.append(f"# HELP {name} 各处理阶段耗时（最近{perf_monitor.window_size}次的分位数）")
+            lines.append(f"# TYPE {name} summary")
+            for stage, item in summary.items():
+                for quantile, key in (("0.5", "p50_ms"), ("0.95", "p95_ms"), ("0.99", "p99_ms")):
+                    labels = _format_labels((("stage", stage), ("quantile", quantile)))
+                    lines.append(f"{name}{labels} {item[key] / 1000.0:.9f}")
+                labels = _format_labels((("stage", stage),))
+                lines.append(f"{name}_sum{labels} {item['total_s']:.9f}")
+                lines.append(f"{name}_count{labels} {item['count']}")
+
+        # 进程信息
+        lines.append("# HELP process_resident_memory_bytes 进程常驻内存")
+        lines.append("# TYPE process_resident_memory_bytes gauge")
+        lines.append(f"process_resident_memory_bytes {read_rss_bytes()}")
+        lines.append("# HELP process_start_time_seconds 进程启动时间")
+        lines.append("# TYPE process_start_time_seconds gauge")
+        lines.append(f"process_start_time_seconds {self.start_time:.3f}")
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """在后台线程中运行的 /metrics HTTP服务"""
+    def __init__(self, registry, host="127.0.0.1", port=DEFAULT_METRICS_PORT):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.httpd = None
+        self.thread = None
+
+    def start(self):
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # 不输出访问日志
+
+        self.httpd = ThreadingHTTPServer((self.host, self.port), Handler)
+        self.httpd.daemon_threads = True
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="metrics-server", daemon=True)
+        self.thread.start()
+        # 导出指标需要计时数据
+        registry.enabled = True
+        perf_monitor.enabled = True
+
+    def stop(self):
+        if self.httpd is not None:
+            self.httpd.shutdown()
+            self.httpd.server_close()
+            self.httpd = None
+        self.registry.enabled = False
+
+    @property
+    def running(self):
+        return self.httpd is not None
+
+
+# 全局指标注册表
+metrics = MetricsRegistry()
@@ -12,16 +12,31 @@ from PySide6.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout,
                               QGroupBox, QGridLayout, QSpinBox, QComboBox, 
                               QStatusBar, QMessageBox, QCheckBox, QDoubleSpinBox,
                               QTableWidget, QTableWidgetItem, QDialog, QDateTimeEdit,
-                              QScrollArea, QFileDialog)
-from PySide6.QtCore import Qt, QTimer, Signal, Slot, QThread, QMutex, QDateTime
+                              QScrollArea, QFileDialog, QHeaderView, QInputDialog)
+from PySide6.QtCore import Qt, QTimer, Signal, Slot, QThread, QMutex, QDateTime, QSettings
 from matplotlib import rcParams
 from mpl_toolkits.mplot3d import Axes3D
 import time
 import queue
-import sqlite3
 import os
 import datetime
 import csv  # 导入csv模块用于保存CSV文件
+import json
+from gis_pd_perf import perf_monitor  # 性能计时
+from gis_pd_metrics import metrics, MetricsServer, DEFAULT_METRICS_PORT  # Prometheus指标
+from gis_pd_storage import DatabaseManager, PartitionedDatabaseManager  # 数据存储
+from gis_pd_cyclelog import CycleLogManager  # 内存映射周期日志
+from gis_pd_export import export_cycles, arrow_available, ExportCancelled  # 批量导出
+from gis_pd_trigger import TriggeredRecorder, TRIGGER_REASONS  # 触发记录
+from gis_pd_pulses import PulseExtractor  # 脉冲提取
+from gis_pd_fingerprint import DISTRIBUTIONS, compute_fingerprint  # PRPD统计指纹
+from gis_pd_classifier import PDClassifier, PD_CLASSES, class_text  # 放电类型识别
+from gis_pd_alarms import AlarmEngine, DEFAULT_RULES, RULE_KINDS, ALARM_ACTIONS, ALARM_STATES, merge_default_rules  # 报警规则
+from gis_pd_noise import NoiseTracker, NOISE_K  # 噪声底估计
+from gis_pd_trend import (TrendAggregator, TREND_LEVELS, TREND_LEVEL_NAMES, TREND_RETENTION,  # 长期趋势
+                          choose_level, trend_arrays)
+from gis_pd_correlation import CorrelationEngine, MIN_EVENTS  # 多传感器关联定位
+from gis_pd_frame import FrameChecker, PhaseAligner, FRAME_DUPLICATE, SAMPLES_PER_FRAME, flags_text  # 帧校验和相位对齐
 
 # 设置matplotlib中文支持
 rcParams['font.sans-serif'] = ['SimHei']  # 设置中文字体支持
@@ -32,209 +47,6 @@ matplotlib.rcParams['path.simplify'] = True
 matplotlib.rcParams['path.simplify_threshold'] = 1.0
 matplotlib.rcParams['agg.path.chunksize'] = 10000
 
-class DatabaseManager:
-    """数据库管理类，负责数据库的连接、创建表和数据存储"""
-    def __init__(self, db_name="gis_pd_data.db"):
-        """初始化数据库连接"""
-        # 数据库文件路径
-        try:
-            # 获取应用程序根目录
-            if getattr(sys, 'frozen', False):
-                # 如果是打包后的应用程序，使用可执行文件所在目录
-                # 注意：不使用sys._MEIPASS，因为那是临时目录，应用关闭后会被删除
-                application_path = os.path.dirname(sys.executable)
-            else:
-                # 如果是普通Python脚本，使用脚本所在目录
-                application_path = os.path.dirname(os.path.abspath(__file__))
-            
-            # 数据库文件保存在应用程序目录下
-            self.db_path = os.path.join(application_path, db_name)
-            print(f"数据库路径: {self.db_path}")
-        except Exception as e:
-            # 如果出错，回退到当前工作目录
-            self.db_path = os.path.join(os.getcwd(), db_name)
-            print(f"获取应用路径出错，使用当前工作目录: {self.db_path}, 错误: {str(e)}")
-        
-        self.conn = None
-        self.cursor = None
-        self.connected = False
-        
-        # 创建数据库连接，使用check_same_thread=False允许在不同线程中使用
-        try:
-            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
-            self.cursor = self.conn.cursor()
-            self.connected = True
-            
-            # 创建数据表
-            self.create_tables()
-            
-            print(f"数据库连接成功: {self.db_path}")
-        except sqlite3.Error as e:
-            print(f"数据库连接错误: {str(e)}")
-    
-    def create_tables(self):
-        """创建必要的数据表"""
-        if not self.connected:
-            return
-            
-        try:
-            # 创建周期数据表
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS cycle_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    cycle_number INTEGER NOT NULL,
-                    data BLOB NOT NULL
-                )
-            ''')
-            
-            # 创建原始数据表
-            self.cursor.execute('''
-                CREATE TABLE IF NOT EXISTS raw_data (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    timestamp TEXT NOT NULL,
-                    broker TEXT NOT NULL,
-                    topic TEXT NOT NULL,
-                    raw_data BLOB NOT NULL
-                )
-            ''')
-            
-            self.conn.commit()
-        except sqlite3.Error as e:
-            print(f"创建数据表错误: {str(e)}")
-    
-    def save_cycle_data(self, cycle_number, data):
-        """保存周期数据"""
-        if not self.connected:
-            return
-            
-        try:
-            # 将数据列表转换为字符串存储
-            data_str = ','.join(map(str, data))
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-            
-            self.cursor.execute(
-                "INSERT INTO cycle_data (timestamp, cycle_number, data) VALUES (?, ?, ?)",
-                (timestamp, cycle_number, data_str)
-            )
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            print(f"保存周期数据错误: {str(e)}")
-            return False
-    
-    def save_raw_data(self, broker, topic, raw_data):
-        """保存原始数据"""
-        if not self.connected:
-            return
-            
-        try:
-            timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-            
-            self.cursor.execute(
-                "INSERT INTO raw_data (timestamp, broker, topic, raw_data) VALUES (?, ?, ?, ?)",
-                (timestamp, broker, topic, raw_data)
-            )
-            self.conn.commit()
-            return True
-        except sqlite3.Error as e:
-            print(f"保存原始数据错误: {str(e)}")
-            return False
-    
-    def get_cycle_data(self, limit=100, offset=0):
-        """获取周期数据"""
-        if not self.connected:
-            return []
-            
-        try:
-            self.cursor.execute(
-                "SELECT * FROM cycle_data ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-                (limit, offset)
-            )
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"获取周期数据错误: {str(e)}")
-            return []
-    
-    def get_raw_data(self, limit=100, offset=0):
-        """获取原始数据"""
-        if not self.connected:
-            return []
-            
-        try:
-            self.cursor.execute(
-                "SELECT * FROM raw_data ORDER BY timestamp DESC LIMIT ? OFFSET ?",
-                (limit, offset)
-            )
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"获取原始数据错误: {str(e)}")
-            return []
-    
-    def get_cycle_count(self):
-        """获取周期数据总数"""
-        if not self.connected:
-            return 0
-            
-        try:
-            self.cursor.execute("SELECT COUNT(*) FROM cycle_data")
-            return self.cursor.fetchone()[0]
-        except sqlite3.Error as e:
-            print(f"获取周期数据总数错误: {str(e)}")
-            return 0
-    
-    def get_raw_count(self):
-        """获取原始数据总数"""
-        if not self.connected:
-            return 0
-            
-        try:
-            self.cursor.execute("SELECT COUNT(*) FROM raw_data")
-            return self.cursor.fetchone()[0]
-        except sqlite3.Error as e:
-            print(f"获取原始数据总数错误: {str(e)}")
-            return 0
-    
-    def get_latest_cycle_data(self, count=1):
-        """获取最新的周期数据"""
-        if not self.connected:
-            return []
-            
-        try:
-            self.cursor.execute(
-                "SELECT * FROM cycle_data ORDER BY timestamp DESC LIMIT ?",
-                (count,)
-            )
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"获取最新周期数据错误: {str(e)}")
-            return []
-    
-    def get_cycle_data_by_time(self, start_time, end_time):
-        """根据时间范围获取周期数据"""
-        if not self.connected:
-            return []
-            
-        try:
-            self.cursor.execute(
-                "SELECT * FROM cycle_data WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp",
-                (start_time, end_time)
-            )
-            return self.cursor.fetchall()
-        except sqlite3.Error as e:
-            print(f"根据时间范围获取周期数据错误: {str(e)}")
-            return []
-    
-    def close(self):
-        """关闭数据库连接"""
-        if self.connected:
-            try:
-                self.conn.close()
-                self.connected = False
-                print("数据库连接已关闭")
-            except sqlite3.Error as e:
-                print(f"关闭数据库连接错误: {str(e)}")
-
 class MplCanvas(FigureCanvas):
     """Matplotlib画布类，用于在Qt界面中嵌入matplotlib图形"""
     def __init__(self, parent=None, width=10, height=4, dpi=100, with_3d=True, unit_label="幅值 (mV)"):
@@ -297,9 +109,9 @@ class MQTTThread(QThread):
 
 class MQTTClient(QWidget):
     """MQTT客户端类，处理MQTT连接和消息接收"""
-    message_received = Signal(list)  # 信号：接收到新消息时发出
+    message_received = Signal(list, str, object, bool, float)  # 信号：接收到新消息时发出，传递数据、主题、帧头、是否为回放数据和帧到达时间
     connection_status = Signal(bool, str)  # 信号：连接状态变化时发出
-    raw_data_received = Signal(str, str, str)  # 信号：接收到原始数据时发出，传递broker、topic和数据
+    raw_data_received = Signal(str, str, str, object, bool)  # 信号：接收到原始数据时发出，传递broker、topic、数据、帧头和是否为回放数据
 
     def __init__(self):
         super().__init__()
@@ -314,6 +126,8 @@ class MQTTClient(QWidget):
         self.connected = False
         self.mqtt_thread = None
         self.message_queue = queue.Queue(maxsize=10)  # 限制队列大小，避免内存溢出
+        self.frame_checker = FrameChecker()  # 帧结构和帧序号检查（实时数据，在MQTT线程中使用）
+        self.replay_checker = FrameChecker()  # 回放数据的帧检查（在回放线程中使用，帧序号与实时数据分开跟踪）
         
         # 数据库管理器
         self.db_manager = None
@@ -326,6 +140,17 @@ class MQTTClient(QWidget):
     def set_database_manager(self, db_manager):
         """设置数据库管理器"""
         self.db_manager = db_manager
+    
+    def publish(self, topic, payload):
+        """发布消息（例如报警事件），未连接时不发送"""
+        if not self.connected:
+            return False
+        try:
+            self.client.publish(topic, payload, qos=1)
+            return True
+        except Exception as e:
+            print(f"发布消息错误: {str(e)}")
+            return False
 
     def connect_to_broker(self, broker_address, broker_port, topic):
         """连接到MQTT Broker"""
@@ -418,46 +243,710 @@ class MQTTClient(QWidget):
         self.connected = False
         self.connection_status.emit(False, "已断开连接")
 
+    @perf_monitor.timed("process_message_queue")
     def process_message_queue(self):
-        """处理消息队列"""
-        if not self.message_queue.empty():
+        """处理消息队列（每次最多处理队列容量条消息，回放时队列持续有数据）"""
+        for _ in range(self.message_queue.maxsize or 1):
             try:
-                data = self.message_queue.get_nowait()
-                self.message_received.emit(data)
-                self.message_queue.task_done()
+                topic, data, header, replayed, received = self.message_queue.get_nowait()
             except queue.Empty:
-                pass
+                break
+            self.message_received.emit(data, topic, header, replayed, received)
+            self.message_queue.task_done()
+
+    @perf_monitor.timed("on_message")
+    def decode_message(self, topic, payload, replayed=False, received=None):
+        """解码一帧，返回放入消息队列的(主题, 数据, 帧头, 是否为回放数据, 帧到达时间)，损坏帧和重复帧返回None
+        
+        实时数据和回放数据在不同的线程中解码，分别使用frame_checker和replay_checker检查帧，
+        回放的历史帧序号不影响实时数据的帧序号跟踪。received为帧到达的Unix时间，为None时使用当前时间；
+        界面线程每50ms批量处理消息队列，多传感器关联按到达时间而不是处理时间对齐周期。
+        """
+        if received is None:
+            received = time.time()
+        hex_message = payload.hex()  # 解码消息内容为十六进制字符串
+        metrics.inc("gis_pd_messages_total", {"topic": topic})
+        metrics.inc("gis_pd_message_bytes_total", {"topic": topic}, len(payload))
+        # 检查帧标志、帧尾、长度和帧序号：传感器编号、帧序号、同步相位、增益码和帧标志
+        checker = self.replay_checker if replayed else self.frame_checker
+        header = checker.check(topic, payload)
+        
+        # 发出原始数据信号，让主线程处理数据库保存
+        if hasattr(self, 'db_manager') and self.db_manager is not None:
+            # 使用信号将原始数据发送到主线程，而不是直接在MQTT线程中保存
+            self.raw_data_received.emit(self.broker_address, topic, hex_message, header, replayed)
+        # 损坏帧和重复帧不进入分析（原始帧照常保存，帧标志记录在周期特征中）
+        if header is None or header.damaged or header.flags & FRAME_DUPLICATE:
+            return None
+            
+        results = []
+        for i in range(0, len(hex_message), 4):  # 每4个字符解析为一个16进制数
+            if i + 4 <= len(hex_message):
+                hex_value = hex_message[i:i+4]
+                decimal_value = int(hex_value, 16)
+                converted_value = decimal_value * 3.3 / 4096
+                results.append(round(converted_value, 2))  # 保留两位小数
+        
+        meaningful_data = results[4:-1]  # 去掉前4个和最后一个数据
+        return topic, meaningful_data, header, replayed, received
 
     def on_message(self, client, userdata, msg):
         """消息接收回调函数"""
         try:
-            hex_message = msg.payload.hex()  # 解码消息内容为十六进制字符串
-            
-            # 发出原始数据信号，让主线程处理数据库保存
-            if hasattr(self, 'db_manager') and self.db_manager is not None:
-                # 使用信号将原始数据发送到主线程，而不是直接在MQTT线程中保存
-                self.raw_data_received.emit(self.broker_address, self.topic, hex_message)
-                
-            results = []
-            for i in range(0, len(hex_message), 4):  # 每4个字符解析为一个16进制数
-                if i + 4 <= len(hex_message):
-                    hex_value = hex_message[i:i+4]
-                    decimal_value = int(hex_value, 16)
-                    converted_value = decimal_value * 3.3 / 4096
-                    results.append(round(converted_value, 2))  # 保留两位小数
-            
-            meaningful_data = results[4:-1]  # 去掉前4个和最后一个数据
+            item = self.decode_message(msg.topic, msg.payload, received=time.time())
+            if item is None:
+                return
             
             # 将数据放入队列，而不是直接发送信号
             # 如果队列已满，则丢弃这条消息，避免处理积压
             try:
-                self.message_queue.put_nowait(meaningful_data)
+                self.message_queue.put_nowait(item)
             except queue.Full:
-                pass
+                metrics.inc("gis_pd_dropped_frames_total", {"topic": msg.topic})
                 
         except Exception as e:
             print(f"消息处理错误: {str(e)}")
 
+    def replay_message(self, topic, payload, timestamp=None):
+        """解码一帧回放数据（与实时数据相同的解码流程），返回放入消息队列的元素，不进入分析时返回None
+        
+        timestamp为保存的帧时间(秒)，作为帧到达时间，为None时使用当前时间。
+        """
+        return self.decode_message(topic, payload, replayed=True, received=timestamp)
+
+def parse_frame_timestamp(value):
+    """将帧时间戳转换为秒数
+    
+    支持数据库中的"%Y-%m-%d %H:%M:%S.%f"格式，以及mosquitto_sub -F '%U'输出的Unix时间戳
+    """
+    text = str(value).strip()
+    try:
+        return float(text)
+    except ValueError:
+        pass
+    for fmt in ("%Y-%m-%d %H:%M:%S.%f", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.datetime.strptime(text, fmt).timestamp()
+        except ValueError:
+            continue
+    raise ValueError(f"无法解析时间戳: {text}")
+
+def load_capture_file(file_path):
+    """读取捕获文件（生成器）
+    
+    捕获文件为CSV格式，每行: 时间戳,主题,十六进制数据
+    可以直接使用 mosquitto_sub -t <主题> -F '%U,%t,%x' 录制
+    
+    Yields:
+        (timestamp, topic, raw_data) 元组
+    """
+    with open(file_path, 'r', newline='') as f:
+        for row in csv.reader(f):
+            if len(row) < 3:
+                continue
+            timestamp, topic, raw_data = row[0], row[1], row[2].strip()
+            # 跳过表头
+            if timestamp.strip().lower() == "timestamp":
+                continue
+            yield timestamp, topic, raw_data
+
+class ReplayThread(QThread):
+    """数据回放线程，将存储的原始帧重新送入解码流程
+    
+    与实时数据不同，消息队列已满时等待而不丢弃，回放的每一帧都会被处理，
+    最大速度回放时的帧率即为解码和绘图流程的处理能力。
+    """
+    progress = Signal(int)  # 信号：已回放的帧数
+    replay_finished = Signal(int, int, float)  # 信号：回放结束，传递进入分析的帧数、不进入分析的帧数和耗时(秒)
+    
+    def __init__(self, frames, decoder, message_queue, speed=1.0, accurate_timing=False):
+        """
+        Args:
+            frames: 可迭代对象，元素为(timestamp, topic, raw_data)
+            decoder: 解码函数decoder(topic, payload, timestamp)，timestamp为保存的帧时间(秒，无法解析时为None)，
+                     返回放入消息队列的元素，不进入分析时返回None
+            message_queue: 解码结果放入的消息队列
+            speed: 回放倍速，0表示以最大速度回放（忽略原始时间间隔）
+            accurate_timing: 为True时按绝对时间表调度，误差不累积
+        """
+        super().__init__()
+        self.frames = frames
+        self.decoder = decoder
+        self.message_queue = message_queue
+        self.speed = speed
+        self.accurate_timing = accurate_timing
+        self.running = True
+        self.mutex = QMutex()  # 保护running变量
+    
+    def is_running(self):
+        self.mutex.lock()
+        running = self.running
+        self.mutex.unlock()
+        return running
+    
+    def stop(self):
+        self.mutex.lock()
+        self.running = False
+        self.mutex.unlock()
+    
+    def wait_until(self, deadline):
+        """等待到指定的perf_counter时刻，期间响应停止请求"""
+        while self.is_running():
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                return
+            if self.accurate_timing and remaining < 0.002:
+                # 最后2ms忙等，获得亚毫秒级的定时精度
+                continue
+            time.sleep(min(remaining, 0.05))
+    
+    def deliver(self, item):
+        """放入消息队列，队列已满时等待（期间响应停止请求），停止时返回False"""
+        while self.is_running():
+            try:
+                self.message_queue.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                continue
+        return False
+    
+    def run(self):
+        count = 0
+        dropped = 0  # 损坏帧、重复帧和无法解码的帧
+        start = time.perf_counter()
+        first_frame_time = None
+        last_frame_time = None
+        
+        for timestamp, topic, raw_data in self.frames:
+            if not self.is_running():
+                break
+            
+            try:
+                frame_time = parse_frame_timestamp(timestamp)
+            except ValueError:
+                frame_time = None
+            
+            # 按原始时间间隔调度
+            if self.speed > 0:
+                if frame_time is None:
+                    frame_time = last_frame_time
+                if frame_time is not None:
+                    if first_frame_time is None:
+                        first_frame_time = frame_time
+                        last_frame_time = frame_time
+                    if self.accurate_timing:
+                        # 相对第一帧计算绝对时刻，避免误差累积
+                        deadline = start + (frame_time - first_frame_time) / self.speed
+                    else:
+                        deadline = time.perf_counter() + max(0.0, frame_time - last_frame_time) / self.speed
+                    last_frame_time = frame_time
+                    self.wait_until(deadline)
+            
+            try:
+                payload = bytes.fromhex(raw_data) if isinstance(raw_data, str) else bytes(raw_data)
+                item = self.decoder(topic, payload, frame_time)
+            except Exception as e:
+                print(f"回放数据错误: {str(e)}")
+                item = None
+            if item is None:
+                dropped += 1
+                continue
+            if not self.deliver(item):
+                break
+            
+            count += 1
+            if count % 100 == 0:
+                self.progress.emit(count)
+        
+        # 等待队列中的帧处理完，耗时包括全部处理时间
+        while self.is_running() and not self.message_queue.empty():
+            time.sleep(0.005)
+        self.progress.emit(count)
+        self.replay_finished.emit(count, dropped, time.perf_counter() - start)
+
+class ReplayDialog(QDialog):
+    """数据回放设置对话框"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("数据回放")
+        self.setMinimumWidth(460)
+        self.capture_file = ""
+        
+        layout = QVBoxLayout(self)
+        settings_layout = QGridLayout()
+        
+        # 数据来源选择
+        settings_layout.addWidget(QLabel("数据来源:"), 0, 0)
+        self.source_combo = QComboBox()
+        self.source_combo.addItems(["数据库原始数据", "捕获文件"])
+        self.source_combo.currentIndexChanged.connect(self.toggle_source)
+        settings_layout.addWidget(self.source_combo, 0, 1)
+        
+        # 捕获文件选择
+        self.file_button = QPushButton("选择文件")
+        self.file_button.clicked.connect(self.choose_file)
+        self.file_button.setEnabled(False)
+        settings_layout.addWidget(self.file_button, 0, 2)
+        self.file_label = QLabel("")
+        settings_layout.addWidget(self.file_label, 1, 0, 1, 3)
+        
+        # 时间范围（仅数据库）
+        self.use_time_range_checkbox = QCheckBox("按时间范围")
+        settings_layout.addWidget(self.use_time_range_checkbox, 2, 0)
+        self.start_time_edit = QDateTimeEdit()
+        self.start_time_edit.setDateTime(QDateTime.currentDateTime().addDays(-1))
+        self.start_time_edit.setCalendarPopup(True)
+        settings_layout.addWidget(self.start_time_edit, 2, 1)
+        self.end_time_edit = QDateTimeEdit()
+        self.end_time_edit.setDateTime(QDateTime.currentDateTime())
+        self.end_time_edit.setCalendarPopup(True)
+        settings_layout.addWidget(self.end_time_edit, 2, 2)
+        
+        # 回放速度
+        settings_layout.addWidget(QLabel("回放速度:"), 3, 0)
+        self.speed_combo = QComboBox()
+        self.speed_combo.addItems(["1×", "2×", "5×", "10×", "100×", "最大速度"])
+        settings_layout.addWidget(self.speed_combo, 3, 1)
+        
+        # 精确时间
+        self.accurate_checkbox = QCheckBox("精确还原原始时间间隔")
+        settings_layout.addWidget(self.accurate_checkbox, 4, 0, 1, 3)
+        
+        # 回放数据是否写入数据库
+        self.persist_checkbox = QCheckBox("回放数据写入数据库（需启用保存数据到数据库）")
+        settings_layout.addWidget(self.persist_checkbox, 5, 0, 1, 3)
+        
+        layout.addLayout(settings_layout)
+        
+        # 按钮
+        button_layout = QHBoxLayout()
+        self.start_button = QPushButton("开始回放")
+        self.start_button.clicked.connect(self.accept)
+        cancel_button = QPushButton("取消")
+        cancel_button.clicked.connect(self.reject)
+        button_layout.addWidget(self.start_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+    
+    def toggle_source(self, index):
+        """切换数据来源"""
+        is_file = (index == 1)
+        self.file_button.setEnabled(is_file)
+        self.use_time_range_checkbox.setEnabled(not is_file)
+        self.start_time_edit.setEnabled(not is_file)
+        self.end_time_edit.setEnabled(not is_file)
+    
+    def choose_file(self):
+        """选择捕获文件"""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "选择捕获文件", "", "捕获文件 (*.csv *.txt);;所有文件 (*.*)"
+        )
+        if file_path:
+            self.capture_file = file_path
+            self.file_label.setText(file_path)
+    
+    def get_speed(self):
+        """获取回放倍速，0表示最大速度"""
+        text = self.speed_combo.currentText()
+        if text == "最大速度":
+            return 0
+        return float(text.rstrip("×"))
+    
+    def get_time_range(self):
+        """获取时间范围，未启用时返回(None, None)"""
+        if not self.use_time_range_checkbox.isChecked():
+            return None, None
+        start_time = self.start_time_edit.dateTime().toString("yyyy-MM-dd hh:mm:ss")
+        end_time = self.end_time_edit.dateTime().toString("yyyy-MM-dd hh:mm:ss")
+        return start_time, end_time
+
+class ExportThread(QThread):
+    """批量导出线程，从数据库按批次流式读取周期数据并写入文件"""
+    progress = Signal(int, str)  # 信号：已导出的周期数和当前时间戳
+    export_finished = Signal(int, float, str)  # 信号：导出结束，传递周期数、耗时(秒)和错误信息（成功时为空）
+    
+    def __init__(self, batches, file_path):
+        super().__init__()
+        self.batches = batches
+        self.file_path = file_path
+        self.running = True
+        self.mutex = QMutex()  # 保护running变量
+    
+    def is_running(self):
+        self.mutex.lock()
+        running = self.running
+        self.mutex.unlock()
+        return running
+    
+    def stop(self):
+        self.mutex.lock()
+        self.running = False
+        self.mutex.unlock()
+    
+    def run(self):
+        start = time.perf_counter()
+        count = 0
+        
+        def on_progress(exported, timestamp):
+            nonlocal count
+            count = exported
+            self.progress.emit(exported, timestamp)
+        
+        try:
+            count = export_cycles(self.batches, self.file_path, on_progress, lambda: not self.is_running())
+            error = ""
+        except ExportCancelled:
+            error = "已取消"
+        except (OSError, ValueError) as e:
+            error = str(e)
+        except Exception as e:
+            # 读取数据库或解码数据块的错误（sqlite3.Error、zlib.error等），导出的文件已删除
+            error = f"{type(e).__name__}: {str(e)}"
+        self.export_finished.emit(count, time.perf_counter() - start, error)
+
+class ClassifierThread(QThread):
+    """放电类型识别线程，由主线程提交的相位分布副本计算指纹参数并识别"""
+    classified = Signal(dict)  # 信号：识别结果 {主题: (类别, 置信度)}
+    
+    def __init__(self, classifier):
+        super().__init__()
+        self.classifier = classifier
+        self.snapshots = queue.Queue(maxsize=1)  # 只保留最新一次提交的数据
+        self.running = True
+        self.mutex = QMutex()  # 保护running变量
+    
+    def is_running(self):
+        self.mutex.lock()
+        running = self.running
+        self.mutex.unlock()
+        return running
+    
+    def stop(self):
+        self.mutex.lock()
+        self.running = False
+        self.mutex.unlock()
+    
+    def set_classifier(self, classifier):
+        self.classifier = classifier
+    
+    def submit(self, snapshots):
+        """提交各传感器的相位分布副本（PulseExtractor.snapshots），上一次未处理的数据被丢弃"""
+        try:
+            self.snapshots.get_nowait()
+        except queue.Empty:
+            pass
+        try:
+            self.snapshots.put_nowait(snapshots)
+        except queue.Full:
+            pass
+    
+    def run(self):
+        while self.is_running():
+            try:
+                snapshots = self.snapshots.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                with perf_monitor.measure("classify"):
+                    fingerprints = {topic: compute_fingerprint(dist, centers, cycles)
+                                    for topic, (dist, centers, cycles) in snapshots.items()}
+                    results = self.classifier.classify(fingerprints)
+            except Exception as e:
+                print(f"放电类型识别错误: {str(e)}")
+                continue
+            self.classified.emit(results)
+
+class ExportDialog(QDialog):
+    """批量导出设置对话框：时间范围、传感器和文件格式"""
+    FORMATS = [("CSV (*.csv)", ".csv"), ("NumPy数组 (*.npy)", ".npy"), ("NumPy压缩包 (*.npz)", ".npz"),
+               ("Parquet (*.parquet)", ".parquet"), ("Arrow IPC (*.arrow)", ".arrow")]
+    
+    def __init__(self, topics="", parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("导出数据")
+        self.setMinimumWidth(460)
+        
+        layout = QVBoxLayout(self)
+        settings_layout = QGridLayout()
+        
+        # 时间范围
+        settings_layout.addWidget(QLabel("开始时间:"), 0, 0)
+        self.start_time_edit = QDateTimeEdit()
+        self.start_time_edit.setDateTime(QDateTime.currentDateTime().addDays(-1))
+        self.start_time_edit.setCalendarPopup(True)
+        settings_layout.addWidget(self.start_time_edit, 0, 1, 1, 2)
+        settings_layout.addWidget(QLabel("结束时间:"), 1, 0)
+        self.end_time_edit = QDateTimeEdit()
+        self.end_time_edit.setDateTime(QDateTime.currentDateTime())
+        self.end_time_edit.setCalendarPopup(True)
+        settings_layout.addWidget(self.end_time_edit, 1, 1, 1, 2)
+        
+        # 传感器（MQTT主题）
+        settings_layout.addWidget(QLabel("传感器主题:"), 2, 0)
+        self.topics_input = QLineEdit(topics)
+        self.topics_input.setPlaceholderText("多个主题用逗号分隔，留空导出全部")
+        settings_layout.addWidget(self.topics_input, 2, 1, 1, 2)
+        
+        # 格式和文件
+        settings_layout.addWidget(QLabel("文件格式:"), 3, 0)
+        self.format_combo = QComboBox()
+        self.format_combo.addItems([name for name, _ in self.FORMATS])
+        settings_layout.addWidget(self.format_combo, 3, 1, 1, 2)
+        settings_layout.addWidget(QLabel("保存到:"), 4, 0)
+        self.file_input = QLineEdit()
+        settings_layout.addWidget(self.file_input, 4, 1)
+        file_button = QPushButton("浏览...")
+        file_button.clicked.connect(self.choose_file)
+        settings_layout.addWidget(file_button, 4, 2)
+        
+        layout.addLayout(settings_layout)
+        
+        # 按钮
+        button_layout = QHBoxLayout()
+        export_button = QPushButton("开始导出")
+        export_button.clicked.connect(self.accept)
+        cancel_button = QPushButton("取消")
+        cancel_button.clicked.connect(self.reject)
+        button_layout.addWidget(export_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+    
+    def choose_file(self):
+        """选择导出文件"""
+        name, suffix = self.FORMATS[self.format_combo.currentIndex()]
+        default_name = f"pd_export_{datetime.datetime.now().strftime('%Y%m%d_%H%M%S')}{suffix}"
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出数据", default_name, name)
+        if file_path:
+            self.file_input.setText(file_path)
+    
+    def get_file_path(self):
+        """获取导出文件路径，补全所选格式的扩展名"""
+        file_path = self.file_input.text().strip()
+        suffix = self.FORMATS[self.format_combo.currentIndex()][1]
+        if file_path and not file_path.lower().endswith(suffix):
+            file_path += suffix
+        return file_path
+    
+    def get_time_range(self):
+        start_time = self.start_time_edit.dateTime().toString("yyyy-MM-dd hh:mm:ss")
+        end_time = self.end_time_edit.dateTime().toString("yyyy-MM-dd hh:mm:ss")
+        return start_time, end_time
+    
+    def get_topics(self):
+        return [topic.strip() for topic in self.topics_input.text().split(",") if topic.strip()]
+
+class StorageSettingsDialog(QDialog):
+    """存储设置对话框：单文件、按时间分区或内存映射周期日志，分区保留策略和触发记录"""
+    MODES = [("single", "单个数据库文件"), ("partitioned", "按时间分区"), ("cyclelog", "周期日志(内存映射，高速记录)")]
+    PERIODS = [("day", "按天"), ("week", "按周")]
+    RETENTION_ACTIONS = [("delete", "删除"), ("archive", "移动到archive目录")]
+    CODECS = [("", "不压缩"), ("zlib", "zlib（较快）"), ("lzma", "lzma（压缩率更高）")]
+    
+    def __init__(self, settings, db_manager, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("存储设置")
+        self.setMinimumWidth(560)
+        self.settings = settings
+        
+        layout = QVBoxLayout(self)
+        settings_layout = QGridLayout()
+        
+        # 存储方式
+        settings_layout.addWidget(QLabel("存储方式:"), 0, 0)
+        self.mode_combo = QComboBox()
+        for key, text in self.MODES:
+            self.mode_combo.addItem(text, key)
+        self.mode_combo.setCurrentIndex(
+            max(0, self.mode_combo.findData(settings.value("storage/mode", "single"))))
+        self.mode_combo.currentIndexChanged.connect(self.toggle_mode)
+        settings_layout.addWidget(self.mode_combo, 0, 1)
+        
+        # 分区周期
+        settings_layout.addWidget(QLabel("分区周期:"), 1, 0)
+        self.period_combo = QComboBox()
+        for key, text in self.PERIODS:
+            self.period_combo.addItem(text, key)
+        self.period_combo.setCurrentIndex(
+            max(0, self.period_combo.findData(settings.value("storage/period", "day"))))
+        settings_layout.addWidget(self.period_combo, 1, 1)
+        
+        # 保留分区数
+        settings_layout.addWidget(QLabel("保留分区数:"), 2, 0)
+        self.retention_spin = QSpinBox()
+        self.retention_spin.setRange(0, 3650)
+        self.retention_spin.setSpecialValueText("不限制")
+        self.retention_spin.setValue(int(settings.value("storage/retention", 30)))
+        settings_layout.addWidget(self.retention_spin, 2, 1)
+        
+        # 过期分区处理方式
+        settings_layout.addWidget(QLabel("过期分区:"), 3, 0)
+        self.action_combo = QComboBox()
+        for key, text in self.RETENTION_ACTIONS:
+            self.action_combo.addItem(text, key)
+        self.action_combo.setCurrentIndex(
+            max(0, self.action_combo.findData(settings.value("storage/retention_action", "delete"))))
+        settings_layout.addWidget(self.action_combo, 3, 1)
+        
+        # 周期数据压缩
+        settings_layout.addWidget(QLabel("周期数据压缩:"), 4, 0)
+        self.codec_combo = QComboBox()
+        for key, text in self.CODECS:
+            self.codec_combo.addItem(text, key)
+        self.codec_combo.setCurrentIndex(
+            max(0, self.codec_combo.findData(settings.value("storage/codec", ""))))
+        self.codec_combo.setToolTip("每256个周期压缩为一个数据块保存，查询时自动解压")
+        settings_layout.addWidget(self.codec_combo, 4, 1)
+        
+        # 单次写入模式
+        self.derive_checkbox = QCheckBox("单次写入：只保存二进制原始帧，周期数据在查询时解码")
+        self.derive_checkbox.setChecked(settings.value("storage/derive_cycles", "false") in (True, "true"))
+        self.derive_checkbox.toggled.connect(lambda: self.toggle_mode(self.mode_combo.currentIndex()))
+        settings_layout.addWidget(self.derive_checkbox, 5, 0, 1, 2)
+        
+        # 长期趋势
+        self.trend_checkbox = QCheckBox("记录长期趋势（每秒、每分钟、每小时聚合，不受\"保存数据到数据库\"选项影响）")
+        self.trend_checkbox.setChecked(settings.value("trend/enabled", "true") in (True, "true"))
+        settings_layout.addWidget(self.trend_checkbox, 6, 0, 1, 2)
+        
+        layout.addLayout(settings_layout)
+        
+        # 触发记录：只保存触发条件前后的周期
+        trigger_group = QGroupBox("触发记录")
+        trigger_layout = QGridLayout()
+        self.trigger_checkbox = QCheckBox("只保存触发事件（触发前后的周期），不保存原始帧")
+        self.trigger_checkbox.setChecked(settings.value("trigger/enabled", "false") in (True, "true"))
+        self.trigger_checkbox.toggled.connect(self.toggle_trigger)
+        trigger_layout.addWidget(self.trigger_checkbox, 0, 0, 1, 4)
+        
+        trigger_layout.addWidget(QLabel("触发前周期数:"), 1, 0)
+        self.pre_cycles_spin = QSpinBox()
+        self.pre_cycles_spin.setRange(0, 2000)
+        self.pre_cycles_spin.setValue(int(settings.value("trigger/pre_cycles", 50)))
+        trigger_layout.addWidget(self.pre_cycles_spin, 1, 1)
+        
+        trigger_layout.addWidget(QLabel("触发后周期数:"), 1, 2)
+        self.post_cycles_spin = QSpinBox()
+        self.post_cycles_spin.setRange(0, 2000)
+        self.post_cycles_spin.setValue(int(settings.value("trigger/post_cycles", 50)))
+        self.post_cycles_spin.setToolTip("连续多少个周期不满足触发条件后结束事件")
+        trigger_layout.addWidget(self.post_cycles_spin, 1, 3)
+        
+        # 触发条件，值为0时不使用
+        trigger_layout.addWidget(QLabel("峰值 ≥"), 2, 0)
+        self.trigger_peak_spin = QDoubleSpinBox()
+        self.trigger_peak_spin.setRange(0, 100)
+        self.trigger_peak_spin.setDecimals(2)
+        self.trigger_peak_spin.setSingleStep(0.1)
+        self.trigger_peak_spin.setSpecialValueText("不使用")
+        self.trigger_peak_spin.setSuffix(" mV")
+        self.trigger_peak_spin.setValue(float(settings.value("trigger/peak", 2.0)))
+        trigger_layout.addWidget(self.trigger_peak_spin, 2, 1)
+        
+        trigger_layout.addWidget(QLabel("脉冲数 ≥"), 2, 2)
+        self.trigger_pulses_spin = QSpinBox()
+        self.trigger_pulses_spin.setRange(0, 360)
+        self.trigger_pulses_spin.setSpecialValueText("不使用")
+        self.trigger_pulses_spin.setValue(int(settings.value("trigger/pulses", 0)))
+        trigger_layout.addWidget(self.trigger_pulses_spin, 2, 3)
+        
+        trigger_layout.addWidget(QLabel("峰值变化率 ≥"), 3, 0)
+        self.trigger_rise_spin = QDoubleSpinBox()
+        self.trigger_rise_spin.setRange(0, 100)
+        self.trigger_rise_spin.setDecimals(2)
+        self.trigger_rise_spin.setSingleStep(0.1)
+        self.trigger_rise_spin.setSpecialValueText("不使用")
+        self.trigger_rise_spin.setSuffix(" mV/周期")
+        self.trigger_rise_spin.setValue(float(settings.value("trigger/rise", 0.0)))
+        trigger_layout.addWidget(self.trigger_rise_spin, 3, 1)
+        
+        trigger_group.setLayout(trigger_layout)
+        layout.addWidget(trigger_group)
+        
+        # 去除噪声底：只保存超过各相位窗噪声阈值的采样点
+        noise_group = QGroupBox("去除噪声底")
+        noise_layout = QGridLayout()
+        self.denoise_checkbox = QCheckBox("只保存超过噪声阈值的采样点（其余置为0），不保存原始帧")
+        self.denoise_checkbox.setChecked(settings.value("noise/store_denoised", "false") in (True, "true"))
+        self.denoise_checkbox.toggled.connect(lambda: self.toggle_mode(self.mode_combo.currentIndex()))
+        noise_layout.addWidget(self.denoise_checkbox, 0, 0, 1, 2)
+        
+        noise_layout.addWidget(QLabel("噪声阈值: 均值 + k倍标准差，k ="), 1, 0)
+        self.store_k_spin = QDoubleSpinBox()
+        self.store_k_spin.setRange(0, 20)
+        self.store_k_spin.setDecimals(1)
+        self.store_k_spin.setSingleStep(0.5)
+        self.store_k_spin.setValue(float(settings.value("noise/store_k", NOISE_K)))
+        noise_layout.addWidget(self.store_k_spin, 1, 1)
+        
+        noise_group.setLayout(noise_layout)
+        layout.addWidget(noise_group)
+        
+        # 当前分区列表
+        if isinstance(db_manager, PartitionedDatabaseManager) and db_manager.connected:
+            layout.addWidget(QLabel(f"分区目录: {db_manager.partition_dir}"))
+            partitions = db_manager.list_partitions()
+            table = QTableWidget(len(partitions), 6)
+            table.setHorizontalHeaderLabels(["分区", "开始时间", "结束时间", "状态", "周期数据", "原始数据"])
+            for row, (key, start_time, end_time, _, status, cycle_count, raw_count) in enumerate(partitions):
+                if key == db_manager.active_key:
+                    status = "当前"
+                for col, value in enumerate([key, start_time[:19], end_time[:19], status,
+                                             str(cycle_count), str(raw_count)]):
+                    table.setItem(row, col, QTableWidgetItem(value))
+            table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+            layout.addWidget(table)
+        
+        # 按钮
+        button_layout = QHBoxLayout()
+        ok_button = QPushButton("确定")
+        ok_button.clicked.connect(self.accept)
+        cancel_button = QPushButton("取消")
+        cancel_button.clicked.connect(self.reject)
+        button_layout.addWidget(ok_button)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+        
+        self.toggle_mode(self.mode_combo.currentIndex())
+        self.toggle_trigger(self.trigger_checkbox.isChecked())
+    
+    def toggle_trigger(self, enabled):
+        """触发条件只在启用触发记录时可用"""
+        for widget in (self.pre_cycles_spin, self.post_cycles_spin, self.trigger_peak_spin,
+                       self.trigger_pulses_spin, self.trigger_rise_spin):
+            widget.setEnabled(enabled)
+    
+    def toggle_mode(self, index):
+        """分区选项只在按时间分区时可用"""
+        mode = self.mode_combo.itemData(index)
+        partitioned = (mode == "partitioned")
+        self.period_combo.setEnabled(partitioned)
+        self.retention_spin.setEnabled(partitioned)
+        self.action_combo.setEnabled(partitioned)
+        # 去除噪声底时周期数据与原始帧不同，不能由原始帧解码得到
+        denoise = self.denoise_checkbox.isChecked()
+        self.derive_checkbox.setEnabled(mode != "cyclelog" and not denoise)
+        self.store_k_spin.setEnabled(denoise)
+        # 单次写入模式不再单独保存周期数据，压缩选项不起作用
+        self.codec_combo.setEnabled(mode != "cyclelog" and (denoise or not self.derive_checkbox.isChecked()))
+    
+    def save_settings(self):
+        """保存设置"""
+        self.settings.setValue("storage/mode", self.mode_combo.currentData())
+        self.settings.setValue("storage/period", self.period_combo.currentData())
+        self.settings.setValue("storage/retention", self.retention_spin.value())
+        self.settings.setValue("storage/retention_action", self.action_combo.currentData())
+        self.settings.setValue("storage/codec", self.codec_combo.currentData())
+        self.settings.setValue("storage/derive_cycles", self.derive_checkbox.isChecked())
+        self.settings.setValue("trigger/enabled", self.trigger_checkbox.isChecked())
+        self.settings.setValue("trigger/pre_cycles", self.pre_cycles_spin.value())
+        self.settings.setValue("trigger/post_cycles", self.post_cycles_spin.value())
+        self.settings.setValue("trigger/peak", self.trigger_peak_spin.value())
+        self.settings.setValue("trigger/pulses", self.trigger_pulses_spin.value())
+        self.settings.setValue("trigger/rise", self.trigger_rise_spin.value())
+        self.settings.setValue("noise/store_denoised", self.denoise_checkbox.isChecked())
+        self.settings.setValue("noise/store_k", self.store_k_spin.value())
+        self.settings.setValue("trend/enabled", self.trend_checkbox.isChecked())
+
 class DatabaseViewDialog(QDialog):
     """数据库查看对话框"""
     def __init__(self, db_manager, parent=None):
@@ -476,13 +965,13 @@ class DatabaseViewDialog(QDialog):
         # 添加数据类型选择
         query_layout.addWidget(QLabel("数据类型:"), 0, 0)
         self.data_type_combo = QComboBox()
-        self.data_type_combo.addItems(["周期数据", "原始数据"])
+        self.data_type_combo.addItems(["周期数据", "原始数据", "触发事件", "报警事件"])
         query_layout.addWidget(self.data_type_combo, 0, 1)
         
         # 添加查询类型选择
         query_layout.addWidget(QLabel("查询类型:"), 0, 2)
         self.query_type_combo = QComboBox()
-        self.query_type_combo.addItems(["最新数据", "按时间范围"])
+        self.query_type_combo.addItems(["最新数据", "按时间范围", "按特征筛选"])
         self.query_type_combo.currentIndexChanged.connect(self.toggle_query_mode)
         query_layout.addWidget(self.query_type_combo, 0, 3)
         
@@ -519,6 +1008,30 @@ class DatabaseViewDialog(QDialog):
         self.generate_prpd_button.clicked.connect(self.view_historical_charts)
         query_layout.addWidget(self.generate_prpd_button, 1, 6)
         
+        # 添加特征筛选条件（只对周期数据有效）
+        self.min_peak_checkbox = QCheckBox("峰值 ≥")
+        query_layout.addWidget(self.min_peak_checkbox, 2, 0)
+        self.min_peak_spin = QDoubleSpinBox()
+        self.min_peak_spin.setRange(0, 100)
+        self.min_peak_spin.setDecimals(2)
+        self.min_peak_spin.setSingleStep(0.1)
+        self.min_peak_spin.setValue(2.0)
+        self.min_peak_spin.setSuffix(" mV")
+        query_layout.addWidget(self.min_peak_spin, 2, 1)
+        
+        self.min_pulses_checkbox = QCheckBox("脉冲数 ≥")
+        query_layout.addWidget(self.min_pulses_checkbox, 2, 2)
+        self.min_pulses_spin = QSpinBox()
+        self.min_pulses_spin.setRange(0, 360)
+        self.min_pulses_spin.setValue(3)
+        query_layout.addWidget(self.min_pulses_spin, 2, 3)
+        
+        self.filter_time_checkbox = QCheckBox("限定时间范围")
+        query_layout.addWidget(self.filter_time_checkbox, 2, 4)
+        self.filter_time_checkbox.toggled.connect(
+            lambda: self.toggle_query_mode(self.query_type_combo.currentIndex()))
+        self.toggle_query_mode(0)
+        
         query_group.setLayout(query_layout)
         layout.addWidget(query_group)
         
@@ -542,12 +1055,26 @@ class DatabaseViewDialog(QDialog):
     def toggle_query_mode(self, index):
         """切换查询模式"""
         is_time_range = (index == 1)
-        self.start_time_edit.setEnabled(is_time_range)
-        self.end_time_edit.setEnabled(is_time_range)
+        is_filter = (index == 2)
+        use_time = is_time_range or (is_filter and self.filter_time_checkbox.isChecked())
+        self.start_time_edit.setEnabled(use_time)
+        self.end_time_edit.setEnabled(use_time)
         self.limit_spin.setEnabled(not is_time_range)
+        for widget in (self.min_peak_checkbox, self.min_peak_spin, self.min_pulses_checkbox,
+                       self.min_pulses_spin, self.filter_time_checkbox):
+            widget.setEnabled(is_filter)
     
     def view_historical_charts(self):
         """从历史数据生成PRPD或PRPS图"""
+        # 触发事件：显示选中事件的全部周期
+        if self.data_type_combo.currentText() == "触发事件":
+            row = self.table.currentRow()
+            if row < 0 or row >= len(self.query_results):
+                QMessageBox.warning(self, "无法生成图表", "请先查询触发事件，并选择一个事件。")
+                return
+            self.show_event_charts(self.query_results[row])
+            return
+        
         # 确保数据类型是周期数据
         if self.data_type_combo.currentText() != "周期数据" or not self.query_results:
             QMessageBox.warning(self, "无法生成图表", "请先查询周期数据，并确保有查询结果。")
@@ -557,11 +1084,25 @@ class DatabaseViewDialog(QDialog):
         dialog = HistoricalChartsDialog(self.query_results, self)
         dialog.exec()
     
+    def show_event_charts(self, event):
+        """显示触发事件的PRPD/PRPS图（事件开始到结束时间内的周期）"""
+        data = self.db_manager.get_cycle_data_by_time(event[3], event[4])
+        if not data:
+            QMessageBox.warning(self, "无法生成图表", "未找到该事件的周期数据。")
+            return
+        dialog = HistoricalChartsDialog(data, self)
+        dialog.exec()
+    
     def show_data_details(self, index):
         """显示数据详情"""
         row = index.row()
         if row < 0 or row >= len(self.query_results):
             return
+        if self.data_type_combo.currentText() == "触发事件":
+            self.show_event_charts(self.query_results[row])
+            return
+        if self.data_type_combo.currentText() == "报警事件":
+            return  # 报警事件的内容已全部显示在表格中
             
         # 获取数据
         data_row = self.query_results[row]
@@ -670,15 +1211,27 @@ class DatabaseViewDialog(QDialog):
             # 根据数据类型查询
             if data_type == "周期数据":
                 # 设置表头
-                self.table.setColumnCount(4)
-                self.table.setHorizontalHeaderLabels(["ID", "时间戳", "周期编号", "数据(前10个点)"])
+                headers = ["ID", "时间戳", "周期编号", "数据(前10个点)"]
+                if query_type == "按特征筛选":
+                    headers += ["峰值", "均值", "RMS", "脉冲数", "峰值相位(°)", "帧序号", "帧标志"]
+                self.table.setColumnCount(len(headers))
+                self.table.setHorizontalHeaderLabels(headers)
                 
                 # 查询数据
                 data = []
                 if query_type == "最新数据":
                     data = self.db_manager.get_latest_cycle_data(limit)
-                else:  # 按时间范围
+                elif query_type == "按时间范围":
                     data = self.db_manager.get_cycle_data_by_time(start_time, end_time)
+                else:  # 按特征筛选
+                    use_time = self.filter_time_checkbox.isChecked()
+                    data = self.db_manager.find_cycles(
+                        min_peak=self.min_peak_spin.value() if self.min_peak_checkbox.isChecked() else None,
+                        min_pulses=self.min_pulses_spin.value() if self.min_pulses_checkbox.isChecked() else None,
+                        start_time=start_time if use_time else None,
+                        end_time=end_time if use_time else None,
+                        limit=limit,
+                    )
                 
                 # 保存查询结果
                 self.query_results = data
@@ -697,9 +1250,62 @@ class DatabaseViewDialog(QDialog):
                     if len(data_points) > 10:
                         preview += "..."
                     self.table.setItem(i, 3, QTableWidgetItem(preview))
+                    
+                    # 特征值
+                    for col, value in enumerate(row[4:9], start=4):
+                        text = str(value) if isinstance(value, int) else f"{value:.3f}"
+                        self.table.setItem(i, col, QTableWidgetItem(text))
+                    if len(row) > 9:
+                        sequence, flags = row[9:11]
+                        self.table.setItem(i, 9, QTableWidgetItem("-" if sequence is None else str(sequence)))
+                        self.table.setItem(i, 10, QTableWidgetItem("-" if flags is None else flags_text(flags)))
                 
                 self.status_label.setText(f"已查询到 {len(data)} 条周期数据")
             
+            elif data_type == "触发事件":
+                headers = ["ID", "主题", "触发时间", "开始时间", "结束时间", "触发条件",
+                           "触发前周期", "触发后周期", "周期数", "峰值"]
+                self.table.setColumnCount(len(headers))
+                self.table.setHorizontalHeaderLabels(headers)
+                
+                # 按时间范围查询时只显示触发时间在范围内的事件
+                if query_type == "按时间范围":
+                    data = self.db_manager.get_trigger_events(self.limit_spin.maximum(), start_time, end_time)
+                else:
+                    data = self.db_manager.get_trigger_events(limit)
+                self.query_results = data
+                
+                self.table.setRowCount(len(data))
+                for i, row in enumerate(data):
+                    values = list(row[:9]) + [f"{row[9]:.2f}"]
+                    values[5] = TRIGGER_REASONS.get(row[5], row[5])
+                    for col, value in enumerate(values):
+                        self.table.setItem(i, col, QTableWidgetItem(str(value)))
+                
+                self.status_label.setText(f"已查询到 {len(data)} 个触发事件（双击查看PRPD/PRPS图）")
+            
+            elif data_type == "报警事件":
+                headers = ["ID", "主题", "时间", "规则", "类型", "状态", "数值", "说明"]
+                self.table.setColumnCount(len(headers))
+                self.table.setHorizontalHeaderLabels(headers)
+                
+                if query_type == "按时间范围":
+                    data = self.db_manager.get_alarm_events(self.limit_spin.maximum(), start_time, end_time)
+                else:
+                    data = self.db_manager.get_alarm_events(limit)
+                self.query_results = data
+                
+                self.table.setRowCount(len(data))
+                for i, row in enumerate(data):
+                    values = list(row)
+                    values[4] = RULE_KINDS.get(row[4], row[4])
+                    values[5] = ALARM_STATES.get(row[5], row[5])
+                    values[6] = "" if row[6] is None else f"{row[6]:.2f}"
+                    for col, value in enumerate(values):
+                        self.table.setItem(i, col, QTableWidgetItem(str(value)))
+                
+                self.status_label.setText(f"已查询到 {len(data)} 个报警事件")
+            
             else:  # 原始数据
                 # 设置表头
                 self.table.setColumnCount(5)
@@ -1135,14 +1741,689 @@ class HistoricalChartsDialog(QDialog):
         except Exception as e:
             QMessageBox.warning(self, "导出失败", f"导出图像时发生错误:\n{str(e)}")
 
-class MainWindow(QMainWindow):
-    """主窗口类"""
-    def __init__(self):
-        super().__init__()
-        self.setWindowTitle("GIS局部放电在线监测系统")
-        self.setMinimumSize(1200, 700)  # 增加窗口宽度以适应两个子图
+class PerformanceDialog(QDialog):
+    """性能面板，显示各处理阶段的耗时统计"""
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("性能面板")
+        self.setMinimumSize(760, 420)
         
-        # 预定义颜色方案
+        layout = QVBoxLayout(self)
+        
+        # 控制按钮
+        control_layout = QHBoxLayout()
+        self.enable_checkbox = QCheckBox("启用计时")
+        self.enable_checkbox.setChecked(perf_monitor.enabled)
+        self.enable_checkbox.stateChanged.connect(self.toggle_enabled)
+        control_layout.addWidget(self.enable_checkbox)
+        
+        self.reset_button = QPushButton("清空统计")
+        self.reset_button.clicked.connect(self.reset_stats)
+        control_layout.addWidget(self.reset_button)
+        
+        self.export_button = QPushButton("导出")
+        self.export_button.clicked.connect(self.export_stats)
+        control_layout.addWidget(self.export_button)
+        control_layout.addStretch()
+        layout.addLayout(control_layout)
+        
+        # 统计表格
+        self.columns = [("count", "次数"), ("mean_ms", "平均(ms)"), ("p50_ms", "p50(ms)"),
+                        ("p95_ms", "p95(ms)"), ("p99_ms", "p99(ms)"), ("max_ms", "最大(ms)"),
+                        ("total_s", "累计(s)")]
+        self.table = QTableWidget()
+        self.table.setColumnCount(len(self.columns) + 1)
+        self.table.setHorizontalHeaderLabels(["阶段"] + [label for _, label in self.columns])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        
+        # 每秒刷新一次
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+    
+    def toggle_enabled(self, state):
+        """启用或停用计时"""
+        perf_monitor.enabled = (state == Qt.CheckState.Checked.value)
+        self.refresh()
+    
+    def reset_stats(self):
+        """清空统计数据"""
+        perf_monitor.reset()
+        self.refresh()
+    
+    def refresh(self):
+        """刷新统计表格"""
+        summary = perf_monitor.summary()
+        self.table.setRowCount(len(summary))
+        for row, (name, item) in enumerate(summary.items()):
+            self.table.setItem(row, 0, QTableWidgetItem(name))
+            for col, (key, _) in enumerate(self.columns, start=1):
+                value = item[key]
+                text = str(value) if key == "count" else f"{value:.3f}"
+                self.table.setItem(row, col, QTableWidgetItem(text))
+        
+        if perf_monitor.enabled:
+            self.status_label.setText(f"计时已启用，每个阶段保留最近 {perf_monitor.window_size} 次耗时")
+        else:
+            self.status_label.setText("计时未启用")
+    
+    def export_stats(self):
+        """导出统计数据"""
+        default_filename = datetime.datetime.now().strftime("perf_%Y%m%d%H%M%S.json")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "导出性能统计", default_filename, "JSON文件 (*.json);;CSV文件 (*.csv)"
+        )
+        if not file_path:
+            return
+        try:
+            perf_monitor.export(file_path)
+            QMessageBox.information(self, "导出成功", f"性能统计已保存到:\n{file_path}")
+        except Exception as e:
+            QMessageBox.warning(self, "导出失败", f"导出性能统计时发生错误:\n{str(e)}")
+
+class FingerprintDialog(QDialog):
+    """PRPD统计指纹面板，显示各传感器的相位分布和指纹参数（由脉冲提取增量计算，每秒刷新）"""
+    def __init__(self, pulse_extractor, parent=None):
+        super().__init__(parent)
+        self.pulse_extractor = pulse_extractor
+        self.setWindowTitle("PRPD统计指纹")
+        self.setMinimumSize(760, 640)
+        
+        layout = QVBoxLayout(self)
+        
+        # 控制选项
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(QLabel("传感器:"))
+        self.topic_combo = QComboBox()
+        self.topic_combo.setMinimumWidth(160)
+        self.topic_combo.currentIndexChanged.connect(self.refresh)
+        control_layout.addWidget(self.topic_combo)
+        
+        control_layout.addWidget(QLabel("统计窗口:"))
+        self.window_spin = QSpinBox()
+        self.window_spin.setRange(0, 100000)
+        self.window_spin.setSingleStep(500)
+        self.window_spin.setSpecialValueText("累计全部")
+        self.window_spin.setSuffix(" 周期")
+        self.window_spin.setValue(pulse_extractor.stats_window or 0)
+        self.window_spin.editingFinished.connect(self.update_window)
+        control_layout.addWidget(self.window_spin)
+        
+        self.reset_button = QPushButton("重新统计")
+        self.reset_button.clicked.connect(self.update_window)
+        control_layout.addWidget(self.reset_button)
+        
+        self.export_button = QPushButton("导出CSV")
+        self.export_button.clicked.connect(self.export_fingerprints)
+        control_layout.addWidget(self.export_button)
+        control_layout.addStretch()
+        layout.addLayout(control_layout)
+        
+        # 相位分布图
+        self.figure = Figure(figsize=(7, 3), dpi=100)
+        self.canvas = FigureCanvas(self.figure)
+        self.count_axes = self.figure.add_subplot(121)
+        self.amplitude_axes = self.figure.add_subplot(122)
+        layout.addWidget(self.canvas)
+        
+        # 指纹参数表格：每行一个参数，正负半周分列
+        self.rows = [("脉冲数 N", "N")]
+        for name in DISTRIBUTIONS:
+            self.rows += [(f"偏斜度 Sk({name})", f"Sk{{}}({name})"), (f"峭度 Ku({name})", f"Ku{{}}({name})")]
+        self.rows += [("放电量因数 Qf", "Qf"), ("互相关系数 cc", "cc"), ("修正互相关系数 mcc", "mcc"),
+                      ("不对称度 Asy", "Asy")]
+        self.table = QTableWidget(len(self.rows), 3)
+        self.table.setHorizontalHeaderLabels(["参数", "正半周(+)", "负半周(-)"])
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        for row, (label, _) in enumerate(self.rows):
+            self.table.setItem(row, 0, QTableWidgetItem(label))
+        layout.addWidget(self.table)
+        
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        self.classification = {}  # 放电类型识别结果 {主题: (类别, 置信度)}
+        
+        # 每秒刷新一次
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+    
+    def update_window(self):
+        """修改统计窗口并重新开始统计"""
+        self.pulse_extractor.set_stats_window(self.window_spin.value() or None)
+        self.refresh()
+    
+    def update_topics(self):
+        """更新传感器列表（保留当前选择）"""
+        topics = sorted(self.pulse_extractor.stats)
+        if topics == [self.topic_combo.itemText(i) for i in range(self.topic_combo.count())]:
+            return
+        current = self.topic_combo.currentText()
+        self.topic_combo.blockSignals(True)
+        self.topic_combo.clear()
+        self.topic_combo.addItems(topics)
+        if current in topics:
+            self.topic_combo.setCurrentText(current)
+        self.topic_combo.blockSignals(False)
+    
+    @staticmethod
+    def format_value(value):
+        if value is None:
+            return ""
+        if np.isnan(value):
+            return "-"
+        return f"{value:.0f}" if float(value).is_integer() and abs(value) >= 1 else f"{value:.3f}"
+    
+    def refresh(self):
+        """刷新分布图和参数表格"""
+        if not self.isVisible() and self.sender() is self.refresh_timer:
+            return
+        self.update_topics()
+        stats = self.pulse_extractor.statistics(self.topic_combo.currentText()) if self.topic_combo.count() else None
+        if stats is None:
+            self.status_label.setText("暂无脉冲数据")
+            return
+        
+        params = stats.fingerprint()
+        for row, (_, key) in enumerate(self.rows):
+            if "{}" in key or key == "N":
+                key = key if "{}" in key else key + "{}"
+                values = [params[key.format("+")], params[key.format("-")]]
+            else:
+                values = [params[key], None]
+            for col, value in enumerate(values, start=1):
+                self.table.setItem(row, col, QTableWidgetItem(self.format_value(value)))
+        
+        # 相位分布
+        dist = stats.distributions()
+        width = 360.0 / stats.bins
+        self.count_axes.clear()
+        self.count_axes.bar(stats.phase_centers, dist["Hn"], width=width)
+        self.count_axes.set_title("Hn(φ)")
+        self.count_axes.set_xlabel("相位(°)")
+        self.count_axes.set_xlim(0, 360)
+        self.amplitude_axes.clear()
+        self.amplitude_axes.plot(stats.phase_centers, dist["Hqmax"], label="Hqmax(φ)")
+        self.amplitude_axes.plot(stats.phase_centers, dist["Hqn"], label="Hqn(φ)")
+        self.amplitude_axes.set_xlabel("相位(°)")
+        self.amplitude_axes.set_ylabel("幅值 (mV)")
+        self.amplitude_axes.set_xlim(0, 360)
+        self.amplitude_axes.legend(loc="upper right")
+        self.figure.tight_layout()
+        self.canvas.draw()
+        
+        window = f"最近{stats.window}个周期" if stats.window else "全部周期"
+        status = f"统计周期数: {params['cycles']}（{window}）"
+        if self.topic_combo.currentText() in self.classification:
+            status += f"  放电类型: {class_text(*self.classification[self.topic_combo.currentText()])}"
+        self.status_label.setText(status)
+    
+    def export_fingerprints(self):
+        """导出所有传感器的指纹参数"""
+        default_filename = datetime.datetime.now().strftime("fingerprint_%Y%m%d%H%M%S.csv")
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出指纹参数", default_filename, "CSV文件 (*.csv)")
+        if not file_path:
+            return
+        try:
+            fingerprints = {topic: self.pulse_extractor.statistics(topic).fingerprint()
+                            for topic in sorted(self.pulse_extractor.stats)}
+            names = list(next(iter(fingerprints.values()))) if fingerprints else []
+            with open(file_path, "w", newline="", encoding="utf-8") as f:
+                writer = csv.writer(f)
+                writer.writerow(["topic"] + names)
+                for topic, params in fingerprints.items():
+                    writer.writerow([topic] + [params[name] for name in names])
+            QMessageBox.information(self, "导出成功", f"指纹参数已保存到:\n{file_path}")
+        except Exception as e:
+            QMessageBox.warning(self, "导出失败", f"导出指纹参数时发生错误:\n{str(e)}")
+
+class TrendChartDialog(QDialog):
+    """长期趋势图：只读取趋势数据表中的聚合行（每秒/每分钟/每小时），不读取周期数据"""
+    RANGES = [("最近1小时", 3600), ("最近24小时", 86400), ("最近7天", 7 * 86400), ("最近30天", 30 * 86400),
+              ("最近180天", 180 * 86400), ("最近1年", 365 * 86400)]
+    
+    def __init__(self, db_manager, live_topics=(), parent=None):
+        super().__init__(parent)
+        self.db_manager = db_manager
+        self.end_time = None  # 显示范围的结束时间，None表示跟随最新数据
+        self.setWindowTitle("长期趋势")
+        self.setMinimumSize(900, 680)
+        
+        layout = QVBoxLayout(self)
+        
+        # 控制选项
+        control_layout = QHBoxLayout()
+        control_layout.addWidget(QLabel("传感器:"))
+        self.topic_combo = QComboBox()
+        self.topic_combo.setMinimumWidth(160)
+        self.topic_combo.addItems(sorted(set(db_manager.get_trend_topics()) | set(live_topics)))
+        self.topic_combo.currentIndexChanged.connect(self.refresh)
+        control_layout.addWidget(self.topic_combo)
+        
+        control_layout.addWidget(QLabel("时间范围:"))
+        self.range_combo = QComboBox()
+        for text, span in self.RANGES:
+            self.range_combo.addItem(text, span)
+        self.range_combo.setCurrentIndex(1)
+        self.range_combo.currentIndexChanged.connect(self.refresh)
+        control_layout.addWidget(self.range_combo)
+        
+        control_layout.addWidget(QLabel("聚合:"))
+        self.level_combo = QComboBox()
+        self.level_combo.addItem("自动", None)
+        for name, text in TREND_LEVEL_NAMES.items():
+            self.level_combo.addItem(text, name)
+        self.level_combo.currentIndexChanged.connect(self.refresh)
+        control_layout.addWidget(self.level_combo)
+        
+        # 按当前时间范围的长度前后翻页
+        self.previous_button = QPushButton("◀ 向前")
+        self.previous_button.clicked.connect(lambda: self.scroll(-1))
+        control_layout.addWidget(self.previous_button)
+        self.next_button = QPushButton("向后 ▶")
+        self.next_button.clicked.connect(lambda: self.scroll(1))
+        control_layout.addWidget(self.next_button)
+        self.latest_button = QPushButton("最新")
+        self.latest_button.clicked.connect(self.show_latest)
+        control_layout.addWidget(self.latest_button)
+        control_layout.addStretch()
+        layout.addLayout(control_layout)
+        
+        # 趋势图：幅值、每周期脉冲数、放电类型占比，共用时间轴
+        self.figure = Figure(figsize=(8, 6), dpi=100)
+        self.canvas = FigureCanvas(self.figure)
+        self.amplitude_axes = self.figure.add_subplot(311)
+        self.pulse_axes = self.figure.add_subplot(312, sharex=self.amplitude_axes)
+        self.class_axes = self.figure.add_subplot(313, sharex=self.amplitude_axes)
+        layout.addWidget(NavigationToolbar(self.canvas, self))
+        layout.addWidget(self.canvas)
+        
+        self.status_label = QLabel()
+        layout.addWidget(self.status_label)
+        
+        # 跟随最新数据时每10秒刷新一次
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(10000)
+        self.refresh()
+    
+    def scroll(self, direction):
+        """前后移动一个时间范围的长度，移动到距离现在不足1分钟时跟随最新数据"""
+        span = self.range_combo.currentData()
+        now = time.time()
+        end = (self.end_time or now) + direction * span
+        self.end_time = None if end >= now - 60 else end
+        self.refresh()
+    
+    def show_latest(self):
+        self.end_time = None
+        self.refresh()
+    
+    @staticmethod
+    def with_gaps(times, values, level):
+        """在没有数据的时间段插入nan，曲线在该处断开"""
+        gaps = np.flatnonzero(np.diff(times) > 1.5 * level) + 1
+        return np.insert(times, gaps, times[gaps - 1] + level), np.insert(values, gaps, np.nan)
+    
+    def refresh(self):
+        """读取显示范围内的趋势数据并重绘"""
+        if not self.isVisible() and self.sender() is self.refresh_timer:
+            return
+        if self.sender() is self.refresh_timer and self.end_time is not None:
+            return  # 查看历史范围时不需要刷新
+        topic = self.topic_combo.currentText()
+        span = self.range_combo.currentData()
+        end = self.end_time or time.time()
+        start = end - span
+        level_name = self.level_combo.currentData() or choose_level(span)
+        level = TREND_LEVELS[level_name]
+        
+        query_start = time.perf_counter()
+        rows = self.db_manager.get_trend_rows(level, topic, start, end) if topic else []
+        elapsed = (time.perf_counter() - query_start) * 1000
+        data = trend_arrays(rows)
+        # 时间轴显示本地时间
+        offset = datetime.datetime.now().astimezone().utcoffset().total_seconds()
+        
+        def local(times):
+            return (times + offset).astype("datetime64[s]")
+        
+        for axes in (self.amplitude_axes, self.pulse_axes, self.class_axes):
+            axes.clear()
+            axes.grid(True, linestyle='--', alpha=0.5)
+        times = data["start_time"]
+        if len(times):
+            for column, label in (("peak_max", "最大值"), ("peak_p95", "95%分位数"), ("peak_mean", "平均值")):
+                gap_times, values = self.with_gaps(times, data[column], level)
+                self.amplitude_axes.plot(local(gap_times), values, linewidth=1.0, label=label)
+            self.amplitude_axes.legend(loc="upper left")
+            with np.errstate(invalid="ignore", divide="ignore"):
+                rate = np.where(data["cycles"] > 0, data["pulse_count"] / data["cycles"], np.nan)
+            gap_times, values = self.with_gaps(times, rate, level)
+            self.pulse_axes.plot(local(gap_times), values, linewidth=1.0, color="tab:purple")
+            
+            # 放电类型占比（各时间段中识别为各类别的次数比例）
+            labels = sorted({label for counts in data["classes"] for label in counts},
+                            key=lambda label: list(PD_CLASSES).index(label) if label in PD_CLASSES else len(PD_CLASSES))
+            if labels:
+                totals = np.array([sum(counts.values()) for counts in data["classes"]], dtype=np.float64)
+                shares = [np.array([counts.get(label, 0) for counts in data["classes"]]) / np.maximum(totals, 1)
+                          for label in labels]
+                self.class_axes.stackplot(local(times), shares, step="post", alpha=0.8,
+                                          labels=[PD_CLASSES.get(label, label) for label in labels])
+                self.class_axes.legend(loc="upper left", fontsize="small", ncol=len(labels))
+            self.amplitude_axes.set_xlim(local(np.array([start, end])))
+        self.amplitude_axes.set_title(f"{topic or '无趋势数据'} 长期趋势（{TREND_LEVEL_NAMES[level_name]}）")
+        self.amplitude_axes.set_ylabel("周期峰值 (mV)")
+        self.pulse_axes.set_ylabel("脉冲数/周期")
+        self.class_axes.set_ylabel("放电类型占比")
+        self.class_axes.set_ylim(0, 1)
+        self.figure.autofmt_xdate()
+        self.figure.tight_layout()
+        self.canvas.draw()
+        
+        range_text = "最新" if self.end_time is None else datetime.datetime.fromtimestamp(end).strftime("%Y-%m-%d %H:%M")
+        self.status_label.setText(f"{TREND_LEVEL_NAMES[level_name]}聚合，{len(rows)}行，查询耗时{elapsed:.1f}ms"
+                                  f"（截至{range_text}）")
+
+class CorrelationDialog(QDialog):
+    """多传感器关联定位面板：各传感器同时出现的脉冲统计和最可能的放电源（每秒刷新）"""
+    COLUMNS = ["传感器", "气室", "脉冲数", "同时出现的脉冲", "最强占比", "最早到达占比", "相对最强的幅值比"]
+    
+    def __init__(self, correlation_engine, settings, parent=None):
+        super().__init__(parent)
+        self.engine = correlation_engine
+        self.settings = settings
+        self.setWindowTitle("多传感器关联定位")
+        self.setMinimumSize(760, 420)
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("同一工频周期中相位相近的脉冲视为同一放电事件，幅值最大的传感器最接近放电源。"
+                                "双击\"气室\"列可以设置传感器所在的气室。"))
+        
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        self.table.itemChanged.connect(self.update_compartment)
+        layout.addWidget(self.table)
+        
+        self.source_label = QLabel()
+        layout.addWidget(self.source_label)
+        
+        # 每秒刷新一次
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+    
+    def update_compartment(self, item):
+        """修改传感器所在的气室并保存到设置"""
+        if item.column() != 1:
+            return
+        topic = self.table.item(item.row(), 0).text()
+        name = item.text().strip()
+        if name and name != topic:
+            self.engine.compartments[topic] = name
+        else:
+            self.engine.compartments.pop(topic, None)
+        self.settings.setValue("correlation/compartments", json.dumps(self.engine.compartments, ensure_ascii=False))
+    
+    def refresh(self):
+        """刷新统计表格（行按主题排列，气室列只在新增传感器时填写，不影响正在编辑的单元格）"""
+        if not self.isVisible() and self.sender() is self.refresh_timer:
+            return
+        rows = {row["topic"]: row for row in self.engine.report()}
+        self.table.blockSignals(True)
+        for row_index in reversed(range(self.table.rowCount())):
+            if self.table.item(row_index, 0).text() not in rows:
+                self.table.removeRow(row_index)  # 清除数据后重新统计
+        for topic in sorted(rows):
+            found = self.table.findItems(topic, Qt.MatchExactly)
+            row_index = next((item.row() for item in found if item.column() == 0), None)
+            if row_index is None:
+                row_index = self.table.rowCount()
+                self.table.insertRow(row_index)
+                topic_item = QTableWidgetItem(topic)
+                topic_item.setFlags(topic_item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row_index, 0, topic_item)
+                self.table.setItem(row_index, 1, QTableWidgetItem(self.engine.compartment(topic)))
+            row = rows[topic]
+            ratio = "-" if np.isnan(row["ratio"]) else f"{row['ratio']:.2f}"
+            for col, text in enumerate([f"{row['pulses']:.0f}", f"{row['coincident']:.0f}",
+                                        f"{row['strongest'] * 100:.1f}%", f"{row['earliest'] * 100:.1f}%", ratio],
+                                       start=2):
+                item = QTableWidgetItem(text)
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row_index, col, item)
+        self.table.blockSignals(False)
+        
+        source = self.engine.likely_source()
+        if source is None:
+            self.source_label.setText(f"同时出现事件不足{MIN_EVENTS}个（最近约{self.engine.decay_seconds:.0f}秒："
+                                      f"{self.engine.events:.0f}个），暂不判断放电源")
+        else:
+            name, share, events = source
+            self.source_label.setText(f"最可能的放电源: {name}（{share * 100:.0f}%的同时出现事件中幅值最大，"
+                                      f"最近约{self.engine.decay_seconds:.0f}秒共{events:.0f}个事件）")
+
+class PhaseCalibrationDialog(QDialog):
+    """帧统计和相位校准面板：各传感器最近一帧的帧头、帧统计和校准偏移（每秒刷新）"""
+    COLUMNS = ["传感器", "传感器编号", "帧序号", "同步相位(°)", "增益码",
+               "帧数", "损坏", "丢失", "重复", "乱序", "校准偏移(°)"]
+    OFFSET_COLUMN = 10
+    
+    def __init__(self, phase_aligner, frame_headers, frame_checker, settings, parent=None):
+        super().__init__(parent)
+        self.aligner = phase_aligner
+        self.frame_headers = frame_headers
+        self.frame_checker = frame_checker
+        self.settings = settings
+        self.setWindowTitle("帧统计和相位校准")
+        self.setMinimumSize(900, 320)
+        
+        layout = QVBoxLayout(self)
+        layout.addWidget(QLabel("PRPD分析要求0°为工频电压过零点。校准偏移为传感器第0个采样点相对电压过零点的相位"
+                                "（帧中有同步相位时为附加偏移），每个周期按偏移循环移动后再显示、分析和保存。"
+                                "新的偏移只对之后收到的周期生效。帧中有帧序号时统计丢失、重复和乱序的帧；"
+                                "损坏帧（帧标志、帧尾或长度错误）和重复帧不进入分析。"))
+        
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        
+        # 每秒刷新一次
+        self.refresh_timer = QTimer(self)
+        self.refresh_timer.timeout.connect(self.refresh)
+        self.refresh_timer.start(1000)
+        self.refresh()
+    
+    def update_offset(self, topic, value):
+        """修改传感器的校准偏移并保存到设置"""
+        if value:
+            self.aligner.offsets[topic] = value
+        else:
+            self.aligner.offsets.pop(topic, None)
+        self.settings.setValue("phase/offsets", json.dumps(self.aligner.offsets, ensure_ascii=False))
+    
+    def refresh(self):
+        """刷新帧头信息（行按主题排列，偏移输入框只在新增传感器时创建）"""
+        if not self.isVisible() and self.sender() is self.refresh_timer:
+            return
+        for topic in sorted(set(self.frame_headers) | set(self.aligner.offsets) | set(self.frame_checker.sensors)):
+            found = self.table.findItems(topic, Qt.MatchExactly)
+            row_index = next((item.row() for item in found if item.column() == 0), None)
+            if row_index is None:
+                row_index = self.table.rowCount()
+                self.table.insertRow(row_index)
+                topic_item = QTableWidgetItem(topic)
+                topic_item.setFlags(topic_item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row_index, 0, topic_item)
+                spin = QDoubleSpinBox()
+                spin.setRange(-360.0, 360.0)
+                spin.setDecimals(1)
+                spin.setSuffix("°")
+                spin.setValue(float(self.aligner.offsets.get(topic, 0.0)))
+                spin.valueChanged.connect(lambda value, topic=topic: self.update_offset(topic, value))
+                self.table.setCellWidget(row_index, self.OFFSET_COLUMN, spin)
+            header = self.frame_headers.get(topic)
+            if header is None:
+                values = ["-"] * 4
+            else:
+                values = [str(header.sensor_id),
+                          "未提供" if header.sequence is None else str(header.sequence),
+                          "未提供" if header.sync_phase is None else f"{header.sync_phase:.2f}",
+                          str(header.gain)]
+            stats = self.frame_checker.stats(topic)
+            values += ["-"] * 5 if stats is None else [
+                str(stats[name]) for name in ("frames", "damaged", "lost", "duplicate", "reordered")]
+            for col, text in enumerate(values, start=1):
+                item = QTableWidgetItem(text)
+                item.setFlags(item.flags() & ~Qt.ItemIsEditable)
+                self.table.setItem(row_index, col, item)
+
+class AlarmRulesDialog(QDialog):
+    """报警规则设置对话框：每行一条规则，参数含义见gis_pd_alarms"""
+    COLUMNS = ["启用", "名称", "类型", "阈值", "解除阈值", "次数", "窗口", "单位"] + list(ALARM_ACTIONS.values())
+    HELP = ("峰值越限: 最近[窗口]个周期中有[次数]个周期峰值超过[阈值]时触发，超过[解除阈值]的周期数少于[次数]时解除\n"
+            "脉冲率上升: 最近[窗口]秒的脉冲率达到基线的[阈值]倍且脉冲数不少于[次数]时触发，降到基线的[解除阈值]倍以下时解除\n"
+            "放电类型变化: 识别结果连续[次数]次为新的类别（置信度不低于[阈值]）时记录事件\n"
+            "传感器无数据: 超过[阈值]秒没有收到数据时触发，收到数据时解除\n"
+            "活动突变: 周期峰值、脉冲数或能量相对基线（最近约[窗口]个周期）的偏差经CUSUM累积超过[阈值]倍标准差时"
+            "记录事件，[解除阈值]为每个周期扣除的偏移量（倍标准差，越大越不灵敏），前[次数]个周期只建立基线")
+    
+    def __init__(self, rules, mqtt_topic, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("报警规则")
+        self.setMinimumSize(980, 420)
+        
+        layout = QVBoxLayout(self)
+        self.table = QTableWidget(0, len(self.COLUMNS))
+        self.table.setHorizontalHeaderLabels(self.COLUMNS)
+        self.table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeToContents)
+        self.table.horizontalHeader().setSectionResizeMode(1, QHeaderView.Stretch)
+        layout.addWidget(self.table)
+        for rule in rules:
+            self.add_rule(rule)
+        
+        help_label = QLabel(self.HELP)
+        help_label.setWordWrap(True)
+        layout.addWidget(help_label)
+        
+        # MQTT转发的主题前缀，事件发布到 前缀/传感器主题
+        topic_layout = QHBoxLayout()
+        topic_layout.addWidget(QLabel("MQTT转发主题前缀:"))
+        self.topic_input = QLineEdit(mqtt_topic)
+        topic_layout.addWidget(self.topic_input)
+        layout.addLayout(topic_layout)
+        
+        button_layout = QHBoxLayout()
+        add_button = QPushButton("添加规则")
+        add_button.clicked.connect(lambda: self.add_rule(DEFAULT_RULES[0]))
+        button_layout.addWidget(add_button)
+        remove_button = QPushButton("删除选中规则")
+        remove_button.clicked.connect(self.remove_rule)
+        button_layout.addWidget(remove_button)
+        default_button = QPushButton("恢复默认规则")
+        default_button.clicked.connect(self.restore_defaults)
+        button_layout.addWidget(default_button)
+        button_layout.addStretch()
+        ok_button = QPushButton("确定")
+        ok_button.clicked.connect(self.accept)
+        button_layout.addWidget(ok_button)
+        cancel_button = QPushButton("取消")
+        cancel_button.clicked.connect(self.reject)
+        button_layout.addWidget(cancel_button)
+        layout.addLayout(button_layout)
+    
+    def add_rule(self, rule):
+        row = self.table.rowCount()
+        self.table.insertRow(row)
+        enabled_item = QTableWidgetItem()
+        enabled_item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsSelectable)
+        enabled_item.setCheckState(Qt.Checked if rule.get("enabled", True) else Qt.Unchecked)
+        self.table.setItem(row, 0, enabled_item)
+        self.table.setItem(row, 1, QTableWidgetItem(rule.get("name", "")))
+        
+        kind_combo = QComboBox()
+        for kind, label in RULE_KINDS.items():
+            kind_combo.addItem(label, kind)
+        kind_combo.setCurrentIndex(max(kind_combo.findData(rule.get("kind", "peak")), 0))
+        self.table.setCellWidget(row, 2, kind_combo)
+        
+        for col, key in ((3, "threshold"), (4, "clear")):
+            spin = QDoubleSpinBox()
+            spin.setRange(-200.0, 100000.0)
+            spin.setDecimals(2)
+            spin.setValue(float(rule.get(key, 0.0)))
+            self.table.setCellWidget(row, col, spin)
+        for col, key in ((5, "count"), (6, "window")):
+            spin = QSpinBox()
+            spin.setRange(0, 100000)
+            spin.setValue(int(rule.get(key, 1)))
+            self.table.setCellWidget(row, col, spin)
+        
+        unit_combo = QComboBox()
+        unit_combo.addItems(["mV", "dBm"])
+        unit_combo.setCurrentText(rule.get("unit", "mV"))
+        self.table.setCellWidget(row, 7, unit_combo)
+        
+        actions = rule.get("actions", [])
+        for col, action in enumerate(ALARM_ACTIONS, start=8):
+            item = QTableWidgetItem()
+            item.setFlags(Qt.ItemIsUserCheckable | Qt.ItemIsEnabled | Qt.ItemIsSelectable)
+            item.setCheckState(Qt.Checked if action in actions else Qt.Unchecked)
+            self.table.setItem(row, col, item)
+    
+    def remove_rule(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()}, reverse=True)
+        for row in rows:
+            self.table.removeRow(row)
+    
+    def restore_defaults(self):
+        self.table.setRowCount(0)
+        for rule in DEFAULT_RULES:
+            self.add_rule(rule)
+    
+    def get_rules(self):
+        """读取表格中的规则"""
+        rules = []
+        for row in range(self.table.rowCount()):
+            kind_combo = self.table.cellWidget(row, 2)
+            name = self.table.item(row, 1).text().strip() if self.table.item(row, 1) else ""
+            rules.append({
+                "name": name or f"{kind_combo.currentText()}{row + 1}",
+                "kind": kind_combo.currentData(),
+                "threshold": self.table.cellWidget(row, 3).value(),
+                "clear": self.table.cellWidget(row, 4).value(),
+                "count": self.table.cellWidget(row, 5).value(),
+                "window": self.table.cellWidget(row, 6).value(),
+                "unit": self.table.cellWidget(row, 7).currentText(),
+                "actions": [action for col, action in enumerate(ALARM_ACTIONS, start=8)
+                            if self.table.item(row, col).checkState() == Qt.Checked],
+                "enabled": self.table.item(row, 0).checkState() == Qt.Checked,
+            })
+        return rules
+    
+    def get_mqtt_topic(self):
+        return self.topic_input.text().strip() or "gis_pd/alarms"
+
+class MainWindow(QMainWindow):
+    """主窗口类"""
+    def __init__(self):
+        super().__init__()
+        self.setWindowTitle("GIS局部放电在线监测系统")
+        self.setMinimumSize(1200, 700)  # 增加窗口宽度以适应两个子图
+        
+        # 预定义颜色方案
         self.color_schemes = {
             "默认方案": ['#000000', '#FFFFFE', '#FFFF13', '#FF0000'],
             "蓝绿红": ['#0000FF', '#00FFFF', '#00FF00', '#FF0000'],
@@ -1165,6 +2446,23 @@ class MainWindow(QMainWindow):
         self.max_cycles = 50  # 默认最大周期数，用于PRPD图
         self.prps_max_cycles = 50  # PRPS图固定显示最新的50个周期
         self.accumulated_data = []  # 累积的数据
+        self.accumulated_topics = []  # 累积的每个周期的主题（与accumulated_data一一对应）
+        
+        # 脉冲提取，每个周期中的放电脉冲(相位, 幅值, 周期, 时间)按主题保存
+        self.pulse_extractor = PulseExtractor()
+        self.pulse_topic = ""  # 最近一个周期的主题，脉冲PRPD图显示该主题的脉冲
+        
+        # 噪声底估计，每个传感器按相位窗滚动更新，用于去除噪声底的显示和保存
+        self.noise_tracker = NoiseTracker()
+        self.show_denoised = False  # PRPD图只显示超过噪声阈值的采样点
+        self.noise_k = NOISE_K  # 显示用的噪声阈值倍数
+        
+        # 长期趋势，每秒/每分钟/每小时聚合后保存
+        self.trend_aggregator = TrendAggregator()
+        self.last_trend_prune = 0.0  # 上次删除过期趋势数据的时间
+        self.correlation_dialog = None
+        self.phase_dialog = None
+        self.frame_headers = {}  # 主题 -> 最近一帧的帧头
         
         # CSV导出设置
         self.csv_export_cycles = 50  # 默认导出50个周期数据
@@ -1185,7 +2483,39 @@ class MainWindow(QMainWindow):
         
         # 数据库设置
         self.save_to_db = False  # 默认不保存数据到数据库
-        self.db_manager = DatabaseManager()  # 创建数据库管理器
+        self.settings = QSettings("GIS_PD", "GIS_PD_MQTT")  # 存储设置等持久化配置
+        self.db_manager = self.create_db_manager()  # 创建数据库管理器
+        self.trigger_recorder = self.create_trigger_recorder()  # 触发记录，未启用时为None
+        self.load_noise_settings()  # 是否只保存超过噪声阈值的采样点
+        self.record_trend = self.settings.value("trend/enabled", "true") in (True, "true")
+        
+        # 多传感器关联定位，每秒关联各传感器新提取的脉冲
+        self.correlation_engine = CorrelationEngine(self.load_compartments())
+        
+        # 相位对齐，各传感器的周期循环移动到第0个采样点对应电压过零点
+        self.phase_aligner = PhaseAligner(self.load_phase_offsets())
+        
+        # 报警规则，每个周期在线评估
+        self.alarm_engine = AlarmEngine(self.load_alarm_rules(), self.handle_alarm_event)
+        self.alarm_mqtt_topic = self.settings.value("alarms/mqtt_topic", "gis_pd/alarms", type=str)
+        
+        # 数据回放设置
+        self.replay_thread = None  # 回放线程
+        self.replay_persist = False  # 回放数据是否写入数据库
+        self.export_thread = None  # 批量导出线程
+        
+        # 性能面板和统计指纹面板
+        self.performance_dialog = None
+        self.fingerprint_dialog = None
+        
+        # 放电类型识别，每秒把各传感器的PRPD统计交给后台线程识别
+        self.classification = {}  # {主题: (类别, 置信度)}
+        self.classifier_thread = ClassifierThread(self.load_classifier())
+        self.classifier_thread.classified.connect(self.update_classification)
+        self.classifier_thread.start()
+        
+        # Prometheus指标服务，设置环境变量GIS_PD_METRICS_PORT可在启动时自动开启
+        self.metrics_server = None
         
         # 获取保存路径信息
         self.get_save_paths()
@@ -1210,6 +2540,26 @@ class MainWindow(QMainWindow):
         self.plot_timer.timeout.connect(self.redraw_plot)
         self.plot_timer.start(200)  # 每200ms重绘一次图表
         
+        # 创建定时器用于放电类型识别
+        self.classify_timer = QTimer()
+        self.classify_timer.timeout.connect(self.submit_classification)
+        self.classify_timer.start(1000)
+        
+        # 创建定时器用于检查无数据和脉冲率报警规则
+        self.alarm_timer = QTimer()
+        self.alarm_timer.timeout.connect(self.check_alarms)
+        self.alarm_timer.start(1000)
+        
+        # 创建定时器用于多传感器关联定位
+        self.correlation_timer = QTimer()
+        self.correlation_timer.timeout.connect(self.update_correlation)
+        self.correlation_timer.start(1000)
+        
+        # 创建定时器用于保存长期趋势
+        self.trend_timer = QTimer()
+        self.trend_timer.timeout.connect(self.save_trends)
+        self.trend_timer.start(1000)
+        
         # 创建定时器用于自动保存图像
         self.image_save_timer = QTimer()
         self.image_save_timer.timeout.connect(self.auto_save_image)
@@ -1217,9 +2567,405 @@ class MainWindow(QMainWindow):
         
         # 标记是否需要重绘
         self.need_redraw = False
+        
+        # 根据环境变量自动启动指标服务
+        metrics_port = os.environ.get("GIS_PD_METRICS_PORT", "")
+        if metrics_port.isdigit():
+            self.start_metrics_server(int(metrics_port))
+    
+    def setup_menu(self):
+        """创建菜单栏"""
+        tools_menu = self.menuBar().addMenu("工具")
+        
+        perf_action = tools_menu.addAction("性能面板")
+        perf_action.triggered.connect(self.show_performance_panel)
+        
+        fingerprint_action = tools_menu.addAction("PRPD统计指纹")
+        fingerprint_action.triggered.connect(self.show_fingerprint_panel)
+        
+        classifier_action = tools_menu.addAction("加载放电类型识别模型...")
+        classifier_action.triggered.connect(self.choose_classifier_model)
+        default_classifier_action = tools_menu.addAction("使用默认识别模型")
+        default_classifier_action.triggered.connect(self.use_default_classifier)
+        
+        alarm_action = tools_menu.addAction("报警规则...")
+        alarm_action.triggered.connect(self.show_alarm_rules)
+        
+        trend_action = tools_menu.addAction("长期趋势")
+        trend_action.triggered.connect(self.show_trend_chart)
+        
+        correlation_action = tools_menu.addAction("多传感器关联定位")
+        correlation_action.triggered.connect(self.show_correlation_panel)
+        
+        phase_action = tools_menu.addAction("帧统计和相位校准")
+        phase_action.triggered.connect(self.show_phase_calibration)
+        
+        tools_menu.addSeparator()
+        self.profile_action = tools_menu.addAction("开始cProfile分析")
+        self.profile_action.triggered.connect(self.toggle_profile)
+        
+        py_spy_action = tools_menu.addAction("py-spy采样(30秒)")
+        py_spy_action.triggered.connect(self.run_py_spy)
+        
+        tools_menu.addSeparator()
+        self.metrics_action = tools_menu.addAction("启动指标服务(/metrics)")
+        self.metrics_action.triggered.connect(self.toggle_metrics_server)
+        
+        db_menu = self.menuBar().addMenu("数据库")
+        storage_action = db_menu.addAction("存储设置...")
+        storage_action.triggered.connect(self.show_storage_settings)
+        self.export_action = db_menu.addAction("导出数据...")
+        self.export_action.triggered.connect(self.toggle_export)
+        maintenance_action = db_menu.addAction("立即执行数据库维护")
+        maintenance_action.triggered.connect(self.run_db_maintenance)
+    
+    def create_db_manager(self):
+        """根据保存的存储设置创建数据库管理器"""
+        mode = self.settings.value("storage/mode", "single")
+        codec = self.settings.value("storage/codec", "") or None
+        derive_cycles = self.settings.value("storage/derive_cycles", "false") in (True, "true")
+        if self.settings.value("noise/store_denoised", "false") in (True, "true"):
+            derive_cycles = False  # 保存去除噪声底的周期数据，不能由原始帧解码得到
+        if mode == "cyclelog":
+            return CycleLogManager()
+        try:
+            if mode == "partitioned":
+                return PartitionedDatabaseManager(
+                    period=self.settings.value("storage/period", "day"),
+                    retention=int(self.settings.value("storage/retention", 30)),
+                    retention_action=self.settings.value("storage/retention_action", "delete"),
+                    codec=codec,
+                    derive_cycles=derive_cycles,
+                )
+            if codec is not None or derive_cycles:
+                return DatabaseManager(codec=codec, derive_cycles=derive_cycles)
+        except ValueError as e:
+            print(f"存储设置无效，使用单文件数据库: {str(e)}")
+        return DatabaseManager()
+    
+    def create_trigger_recorder(self):
+        """根据保存的设置创建触发记录器，未启用触发记录时返回None"""
+        if self.settings.value("trigger/enabled", "false") not in (True, "true"):
+            return None
+        peak = float(self.settings.value("trigger/peak", 2.0))
+        pulses = int(self.settings.value("trigger/pulses", 0))
+        rise = float(self.settings.value("trigger/rise", 0.0))
+        return TriggeredRecorder(
+            self.save_trigger_event,
+            pre_cycles=int(self.settings.value("trigger/pre_cycles", 50)),
+            post_cycles=int(self.settings.value("trigger/post_cycles", 50)),
+            peak_threshold=peak if peak > 0 else None,
+            min_pulses=pulses if pulses > 0 else None,
+            max_rise=rise if rise > 0 else None,
+        )
     
+    def load_noise_settings(self):
+        """读取去除噪声底保存的设置"""
+        self.store_denoised = self.settings.value("noise/store_denoised", "false") in (True, "true")
+        self.store_noise_k = float(self.settings.value("noise/store_k", NOISE_K))
+    
+    def load_alarm_rules(self):
+        """读取设置中保存的报警规则，未设置时使用默认规则
+        
+        保存之后新增的规则类型加入默认规则，并更新保存的设置。
+        """
+        try:
+            rules = json.loads(self.settings.value("alarms/rules", "", type=str) or "null")
+        except ValueError as e:
+            print(f"读取报警规则错误，使用默认规则: {str(e)}")
+            return DEFAULT_RULES
+        if not rules:
+            return DEFAULT_RULES
+        known_kinds = self.settings.value("alarms/rule_kinds", "", type=str)
+        merged = merge_default_rules(rules, known_kinds.split(",") if known_kinds else None)
+        if len(merged) != len(rules) or known_kinds != ",".join(RULE_KINDS):
+            self.save_alarm_rules(merged)
+        return merged
+    
+    def save_alarm_rules(self, rules):
+        """保存报警规则和当前程序的规则类型（用于判断以后新增的规则类型）"""
+        self.settings.setValue("alarms/rules", json.dumps(rules, ensure_ascii=False))
+        self.settings.setValue("alarms/rule_kinds", ",".join(RULE_KINDS))
+    
+    def show_alarm_rules(self):
+        """显示报警规则设置对话框，确认后保存并重新编译规则"""
+        dialog = AlarmRulesDialog(self.alarm_engine.rules, self.alarm_mqtt_topic, self)
+        if dialog.exec() != QDialog.Accepted:
+            return
+        rules = dialog.get_rules()
+        self.alarm_mqtt_topic = dialog.get_mqtt_topic()
+        self.save_alarm_rules(rules)
+        self.settings.setValue("alarms/mqtt_topic", self.alarm_mqtt_topic)
+        self.alarm_engine.set_rules(rules)
+        self.status_bar.showMessage(f"报警规则已更新（{sum(rule['enabled'] for rule in rules)}条启用）", 3000)
+    
+    def check_alarms(self):
+        """每秒检查无数据、脉冲率和变化点规则，并更新状态栏的报警状态"""
+        pulse_totals = {topic: buffer.total for topic, buffer in self.pulse_extractor.buffers.items()}
+        self.alarm_engine.tick(pulse_totals)
+        text = self.alarm_engine.status_text()
+        if hasattr(self, 'alarm_label'):
+            self.alarm_label.setText(text)
+        else:
+            self.alarm_label = QLabel(text)
+            self.status_bar.addPermanentWidget(self.alarm_label)
+        self.alarm_label.setStyleSheet("color: red;" if self.alarm_engine.active_alarms() else "")
+    
+    def handle_alarm_event(self, event):
+        """执行报警事件的动作：状态栏提示、MQTT转发、写入数据库、保存图像快照"""
+        actions = event["actions"]
+        if "status" in actions:
+            self.status_bar.showMessage(f"[{ALARM_STATES[event['state']]}] {event['rule']}: {event['message']}", 10000)
+        if "mqtt" in actions:
+            self.mqtt_client.publish(f"{self.alarm_mqtt_topic}/{event['topic']}",
+                                     json.dumps({key: value for key, value in event.items() if key != "actions"},
+                                                ensure_ascii=False))
+        if "db" in actions and self.db_manager is not None:
+            self.db_manager.save_alarm_event(event)
+        if "snapshot" in actions and event["state"] != "cleared":
+            QTimer.singleShot(0, lambda: self.save_prpd_image("ALARM"))  # 绘图较慢，不在数据处理中执行
+    
+    def save_trigger_event(self, event):
+        """保存触发记录器生成的事件"""
+        if self.db_manager is not None:
+            self.db_manager.save_event(event)
+    
+    def show_storage_settings(self):
+        """显示存储设置对话框，确认后切换数据库管理器"""
+        dialog = StorageSettingsDialog(self.settings, self.db_manager, self)
+        if dialog.exec() != QDialog.Accepted:
+            return
+        dialog.save_settings()
+        
+        # 关闭旧的数据库并按新设置重新打开（导出线程和回放线程仍在读取旧的数据库，先停止；
+        # 正在记录的触发事件和趋势数据保存到旧的数据库）
+        self.stop_export()
+        self.stop_replay()
+        if self.trigger_recorder is not None:
+            self.trigger_recorder.flush()
+        if self.db_manager is not None:
+            self.db_manager.save_trend_rows(self.trend_aggregator.flush())
+            self.db_manager.close()
+        self.db_manager = self.create_db_manager()
+        self.trigger_recorder = self.create_trigger_recorder()
+        self.load_noise_settings()
+        self.record_trend = self.settings.value("trend/enabled", "true") in (True, "true")
+        self.mqtt_client.set_database_manager(self.db_manager)
+        self.db_path = self.db_manager.db_path
+        self.status_bar.showMessage(f"存储方式已切换: {self.db_path}", 5000)
+    
+    def toggle_metrics_server(self):
+        """启动或停止Prometheus指标服务"""
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+            self.metrics_server = None
+            self.metrics_action.setText("启动指标服务(/metrics)")
+            self.status_bar.showMessage("指标服务已停止", 3000)
+            return
+        
+        port, ok = QInputDialog.getInt(self, "指标服务", "监听端口:", DEFAULT_METRICS_PORT, 1, 65535)
+        if ok:
+            self.start_metrics_server(port)
+    
+    def start_metrics_server(self, port, host="127.0.0.1"):
+        """在后台线程中启动 /metrics HTTP服务"""
+        metrics.register_callback("gis_pd_message_queue_depth", "消息队列中等待处理的帧数",
+                                  lambda: self.mqtt_client.message_queue.qsize())
+        metrics.register_callback("gis_pd_message_queue_capacity", "消息队列容量",
+                                  lambda: self.mqtt_client.message_queue.maxsize)
+        metrics.register_callback("gis_pd_mqtt_connected", "MQTT连接状态(1为已连接)",
+                                  lambda: int(self.mqtt_client.connected))
+        metrics.register_callback("gis_pd_accumulated_cycles", "内存中累积的周期数",
+                                  lambda: len(self.accumulated_data))
+        try:
+            server = MetricsServer(metrics, host=host, port=port)
+            server.start()
+        except OSError as e:
+            QMessageBox.warning(self, "指标服务启动失败", f"无法监听端口 {port}:\n{str(e)}")
+            return
+        self.metrics_server = server
+        self.metrics_action.setText(f"停止指标服务(端口 {port})")
+        self.status_bar.showMessage(f"指标服务已启动: http://{host}:{port}/metrics", 5000)
+    
+    def show_performance_panel(self):
+        """显示性能面板（非模态）"""
+        if self.performance_dialog is None:
+            self.performance_dialog = PerformanceDialog(self)
+        self.performance_dialog.show()
+        self.performance_dialog.raise_()
+    
+    def show_fingerprint_panel(self):
+        """显示PRPD统计指纹面板（非模态）"""
+        if self.fingerprint_dialog is None:
+            self.fingerprint_dialog = FingerprintDialog(self.pulse_extractor, self)
+        self.fingerprint_dialog.show()
+        self.fingerprint_dialog.raise_()
+    
+    def load_compartments(self):
+        """读取设置中保存的传感器气室对应关系{主题: 气室}"""
+        try:
+            return json.loads(self.settings.value("correlation/compartments", "", type=str) or "{}")
+        except ValueError as e:
+            print(f"读取气室设置错误: {str(e)}")
+            return {}
+    
+    def load_phase_offsets(self):
+        """读取设置中保存的各传感器相位校准偏移{主题: 偏移(°)}"""
+        try:
+            return json.loads(self.settings.value("phase/offsets", "", type=str) or "{}")
+        except ValueError as e:
+            print(f"读取相位校准设置错误: {str(e)}")
+            return {}
+    
+    def show_phase_calibration(self):
+        """显示帧统计和相位校准面板（非模态）"""
+        if self.phase_dialog is None:
+            self.phase_dialog = PhaseCalibrationDialog(self.phase_aligner, self.frame_headers,
+                                                       self.mqtt_client.frame_checker, self.settings, self)
+        self.phase_dialog.show()
+        self.phase_dialog.raise_()
+    
+    def show_correlation_panel(self):
+        """显示多传感器关联定位面板（非模态）"""
+        if self.correlation_dialog is None:
+            self.correlation_dialog = CorrelationDialog(self.correlation_engine, self.settings, self)
+        self.correlation_dialog.show()
+        self.correlation_dialog.raise_()
+    
+    def update_correlation(self):
+        """关联各传感器新提取的脉冲，有两个以上传感器时在状态栏显示最可能的放电源"""
+        self.correlation_engine.update(self.pulse_extractor, time.time())
+        if len(self.correlation_engine.topics) < 2:
+            return
+        text = self.correlation_engine.status_text()
+        if hasattr(self, 'correlation_label'):
+            self.correlation_label.setText(text)
+        else:
+            self.correlation_label = QLabel(text)
+            self.status_bar.addPermanentWidget(self.correlation_label)
+    
+    def show_trend_chart(self):
+        """显示长期趋势图（先保存已结束的聚合行）"""
+        self.save_trends()
+        dialog = TrendChartDialog(self.db_manager, list(self.trend_aggregator.topics), self)
+        dialog.show()
+    
+    def save_trends(self):
+        """每秒保存已结束的趋势聚合行，每小时删除一次过期的趋势数据"""
+        rows = self.trend_aggregator.take_rows()
+        if self.db_manager is None:
+            return
+        if rows:
+            self.db_manager.save_trend_rows(rows)
+        now = time.time()
+        if now - self.last_trend_prune >= 3600:
+            self.last_trend_prune = now
+            self.db_manager.prune_trend_rows({TREND_LEVELS[name]: now - seconds
+                                              for name, seconds in TREND_RETENTION.items() if seconds})
+    
+    def should_record_trend(self, replayed=False):
+        """判断当前数据是否需要记录长期趋势（回放数据由回放设置决定）"""
+        if not self.record_trend:
+            return False
+        return not replayed or self.replay_persist
+    
+    def load_classifier(self):
+        """加载设置中保存的识别模型，未设置或加载失败时使用默认模型"""
+        model_path = self.settings.value("classifier/model_path", "", type=str)
+        if model_path:
+            try:
+                return PDClassifier.load(model_path)
+            except (OSError, KeyError, ValueError) as e:
+                print(f"加载识别模型失败，使用默认模型: {str(e)}")
+        return PDClassifier.default()
+    
+    def choose_classifier_model(self):
+        """选择识别模型文件(.npz，由gis_pd_classifier.py训练)"""
+        file_path, _ = QFileDialog.getOpenFileName(self, "加载放电类型识别模型", "", "识别模型 (*.npz)")
+        if not file_path:
+            return
+        try:
+            classifier = PDClassifier.load(file_path)
+        except (OSError, KeyError, ValueError) as e:
+            QMessageBox.warning(self, "加载失败", f"无法加载识别模型:\n{str(e)}")
+            return
+        self.settings.setValue("classifier/model_path", file_path)
+        self.classifier_thread.set_classifier(classifier)
+        self.status_bar.showMessage(f"已加载识别模型: {file_path}（类别: {', '.join(classifier.classes)}）", 5000)
+    
+    def use_default_classifier(self):
+        self.settings.remove("classifier/model_path")
+        self.classifier_thread.set_classifier(PDClassifier.default())
+        self.status_bar.showMessage("已使用默认识别模型", 3000)
+    
+    def submit_classification(self):
+        """把各传感器PRPD统计的副本提交给识别线程"""
+        self.classifier_thread.submit(self.pulse_extractor.snapshots())
+    
+    def update_classification(self, results):
+        """显示识别结果：当前传感器的类别和置信度，以及识别出放电的传感器数"""
+        self.classification = results
+        self.alarm_engine.update_classification(results)
+        self.trend_aggregator.add_classification(results)
+        if self.fingerprint_dialog is not None:
+            self.fingerprint_dialog.classification = results
+        topic = self.pulse_topic if self.pulse_topic in results else next(iter(sorted(results)), None)
+        if topic is None:
+            text = ""  # 清空数据后没有统计
+        elif len(results) == 1:
+            text = f"放电类型: {class_text(*results[topic])}"
+        else:
+            active = sum(1 for label, _ in results.values() if label not in (None, "noise"))
+            text = f"放电类型({topic}): {class_text(*results[topic])} [{active}/{len(results)}个传感器有放电]"
+        if hasattr(self, 'classifier_label'):
+            self.classifier_label.setText(text)
+        else:
+            self.classifier_label = QLabel(text)
+            self.status_bar.addPermanentWidget(self.classifier_label)
+    
+    def toggle_profile(self):
+        """开始或停止cProfile分析"""
+        if perf_monitor.profiler is None:
+            perf_monitor.start_profile()
+            self.profile_action.setText("停止cProfile分析并保存")
+            self.status_bar.showMessage("cProfile分析已开始", 3000)
+            return
+        
+        default_filename = datetime.datetime.now().strftime("profile_%Y%m%d%H%M%S.prof")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存cProfile结果", default_filename, "cProfile文件 (*.prof)"
+        )
+        if not file_path:
+            return  # 用户取消时继续分析
+        try:
+            report_path = perf_monitor.stop_profile(file_path)
+            self.profile_action.setText("开始cProfile分析")
+            QMessageBox.information(self, "分析完成", f"cProfile结果已保存到:\n{file_path}\n\n文本报告:\n{report_path}")
+        except Exception as e:
+            QMessageBox.warning(self, "保存失败", f"保存cProfile结果时发生错误:\n{str(e)}")
+    
+    def run_py_spy(self):
+        """使用py-spy对当前进程采样并生成火焰图"""
+        if not perf_monitor.py_spy_available():
+            QMessageBox.warning(self, "未找到py-spy", "未找到py-spy，请先执行 pip install py-spy")
+            return
+        default_filename = datetime.datetime.now().strftime("py_spy_%Y%m%d%H%M%S.svg")
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "保存py-spy火焰图", default_filename, "SVG文件 (*.svg)"
+        )
+        if not file_path:
+            return
+        try:
+            perf_monitor.start_py_spy(file_path, duration=30)
+            self.status_bar.showMessage(f"py-spy正在采样30秒，结果将保存到: {file_path}", 5000)
+        except Exception as e:
+            QMessageBox.warning(self, "py-spy启动失败", str(e))
+
     def setup_ui(self):
         """设置用户界面"""
+        # 创建菜单栏
+        self.setup_menu()
+        
         # 创建中央部件
         central_widget = QWidget()
         self.setCentralWidget(central_widget)
@@ -1264,7 +3010,7 @@ class MainWindow(QMainWindow):
         # 添加图表类型选择
         chart_settings_layout.addWidget(QLabel("PRPD图类型:"), 0, 0)
         self.chart_type_combo = QComboBox()
-        self.chart_type_combo.addItems(["散点图", "线图"])
+        self.chart_type_combo.addItems(["散点图", "线图", "脉冲事件"])
         self.chart_type_combo.currentIndexChanged.connect(self.update_plot_type)
         chart_settings_layout.addWidget(self.chart_type_combo, 0, 1)
         
@@ -1358,6 +3104,27 @@ class MainWindow(QMainWindow):
         self.auto_save_checkbox.stateChanged.connect(self.toggle_auto_save)
         chart_settings_layout.addWidget(self.auto_save_checkbox, 2, 4)
         
+        # 添加数据回放按钮
+        self.replay_button = QPushButton("数据回放")
+        self.replay_button.clicked.connect(self.toggle_replay)
+        chart_settings_layout.addWidget(self.replay_button, 4, 2)
+        
+        # 添加去除噪声底选项
+        self.denoise_checkbox = QCheckBox("去除噪声底")
+        self.denoise_checkbox.setChecked(self.show_denoised)
+        self.denoise_checkbox.setToolTip("散点图和线图只显示超过噪声阈值（各相位窗噪声均值 + k倍标准差）的采样点")
+        self.denoise_checkbox.stateChanged.connect(self.toggle_denoised)
+        chart_settings_layout.addWidget(self.denoise_checkbox, 5, 0)
+        
+        chart_settings_layout.addWidget(QLabel("噪声阈值k:"), 5, 1)
+        self.noise_k_spin = QDoubleSpinBox()
+        self.noise_k_spin.setRange(0, 20)
+        self.noise_k_spin.setDecimals(1)
+        self.noise_k_spin.setSingleStep(0.5)
+        self.noise_k_spin.setValue(self.noise_k)
+        self.noise_k_spin.valueChanged.connect(self.update_noise_k)
+        chart_settings_layout.addWidget(self.noise_k_spin, 5, 2)
+        
         chart_settings_group.setLayout(chart_settings_layout)
         main_layout.addWidget(chart_settings_group)
         
@@ -1487,6 +3254,10 @@ class MainWindow(QMainWindow):
         self.data_mutex.lock()
         self.cycle_count = 1
         self.accumulated_data = []
+        self.accumulated_topics = []
+        self.pulse_extractor.clear()
+        self.noise_tracker.clear()
+        self.correlation_engine.clear()
         self.cycle_count_label.setText(f"{self.cycle_count}/{self.max_cycles}")
         self.need_redraw = True
         self.data_mutex.unlock()
@@ -1501,6 +3272,10 @@ class MainWindow(QMainWindow):
         self.data_mutex.lock()
         self.data_buffer = []
         self.accumulated_data = []
+        self.accumulated_topics = []
+        self.pulse_extractor.clear()
+        self.noise_tracker.clear()
+        self.correlation_engine.clear()
         self.cycle_count = 1
         self.cycle_count_label.setText(f"{self.cycle_count}/{self.max_cycles}")
         self.data_mutex.unlock()
@@ -1523,10 +3298,17 @@ class MainWindow(QMainWindow):
         self.canvas.draw()
         self.data_count_label.setText("数据点: 0")
     
-    def update_plot(self, data):
-        """更新数据，但不立即重绘"""
+    @perf_monitor.timed("update_plot")
+    def update_plot(self, data, topic=None, header=None, replayed=False, received=None):
+        """更新数据，但不立即重绘（header为帧头，用于相位对齐；replayed为是否为回放数据；
+        received为帧到达时间，与帧序号一起用于多传感器关联的周期对齐）"""
         current_time = time.time()
         
+        # 把周期对齐到电压过零点（帧头中的同步相位 + 传感器校准偏移）
+        if header is not None:
+            self.frame_headers[topic or ""] = header
+        data = self.phase_aligner.align(topic, data, header)
+        
         # 更新数据缓冲区
         self.data_mutex.lock()
         self.data_buffer = data
@@ -1536,21 +3318,35 @@ class MainWindow(QMainWindow):
         if len(data) > 0:
             # 添加新周期数据
             self.accumulated_data.append(data)
+            self.accumulated_topics.append(topic or "")
             
             # 如果累积的周期数超过PRPS的最大周期数，则移除最早的周期数据
             # 但保留足够的数据以满足PRPD图和PRPS图的需求
             max_needed_cycles = max(self.max_cycles, self.prps_max_cycles)
             if len(self.accumulated_data) > max_needed_cycles:
                 self.accumulated_data = self.accumulated_data[-max_needed_cycles:]
+                self.accumulated_topics = self.accumulated_topics[-max_needed_cycles:]
+            
+            # 提取放电脉冲
+            self.pulse_extractor.add_cycle(topic, data, received,
+                                           header.sequence if header is not None else None)
+            self.pulse_topic = topic or ""
+            noise_floor = self.noise_tracker.update(topic, data)
             
             # 更新周期计数
             self.cycle_count = min(self.cycle_count + 1, self.max_cycles)
             self.cycle_count_label.setText(f"{self.cycle_count}/{self.max_cycles}")
             
-            # 保存周期数据到数据库（确保在主线程中执行）
-            if self.save_to_db and self.db_manager is not None:
+            # 保存周期数据到数据库（确保在主线程中执行），启用触发记录时只保存触发事件
+            if self.should_persist(replayed) and self.db_manager is not None:
                 try:
-                    self.db_manager.save_cycle_data(self.cycle_count, data)
+                    # 去除噪声底时只保存超过噪声阈值的采样点
+                    stored = noise_floor.denoise(data, self.store_noise_k).tolist() if self.store_denoised else data
+                    if self.trigger_recorder is not None:
+                        self.trigger_recorder.add_cycle(topic, self.cycle_count, stored)
+                    else:
+                        frame = (header.sequence, header.flags) if header is not None else None
+                        self.db_manager.save_cycle_data(self.cycle_count, stored, topic=topic, frame=frame)
                 except Exception as e:
                     print(f"保存周期数据错误: {str(e)}")
         
@@ -1560,10 +3356,17 @@ class MainWindow(QMainWindow):
         self.need_redraw = True
         self.data_mutex.unlock()
         
+        # 评估报警规则（报警动作可能需要读取累积数据，在释放互斥锁后执行）
+        if len(data) > 0:
+            self.alarm_engine.add_cycle(topic, data)
+            if self.should_record_trend(replayed):
+                self.trend_aggregator.add_cycle(topic, data)
+        
         # 更新数据点数量标签
         total_points = sum(len(cycle_data) for cycle_data in self.accumulated_data)
         self.data_count_label.setText(f"数据点: {total_points}")
     
+    @perf_monitor.timed("redraw_plot")
     def redraw_plot(self):
         """重绘图表，由定时器触发"""
         if not self.need_redraw:
@@ -1571,13 +3374,14 @@ class MainWindow(QMainWindow):
             
         self.data_mutex.lock()
         accumulated_data_copy = self.accumulated_data.copy()
+        accumulated_topics_copy = self.accumulated_topics.copy()
         self.data_mutex.unlock()
         
         if not accumulated_data_copy:
             return
         
         # 绘制2D图 (PRPD)
-        self.draw_prpd(accumulated_data_copy)
+        self.draw_prpd(accumulated_data_copy, accumulated_topics_copy)
         
         # 如果启用了3D图，则绘制PRPS图
         if self.show_3d_plot and self.canvas.axes_3d:
@@ -1586,19 +3390,25 @@ class MainWindow(QMainWindow):
         # 重绘画布
         self.canvas.fig.tight_layout()
         self.canvas.draw()
+        metrics.inc("gis_pd_redraws_total")
         
         self.need_redraw = False
     
-    def draw_prpd(self, accumulated_data):
-        """绘制PRPD图"""
+    @perf_monitor.timed("draw_prpd")
+    def draw_prpd(self, accumulated_data, topics=None):
+        """绘制PRPD图（topics为每个周期的主题，去除噪声底时每个周期使用各自传感器的噪声阈值）"""
         # 清除当前2D图
         self.canvas.axes_2d.clear()
         
         # 根据选择的图表类型绘制
         chart_type = self.chart_type_combo.currentText()
+        if chart_type == "脉冲事件":
+            self.draw_pulse_prpd()
+            return
         
         # 只使用PRPD需要的周期数
         prpd_data = accumulated_data[-self.max_cycles:] if len(accumulated_data) > self.max_cycles else accumulated_data
+        prpd_topics = (topics or [self.pulse_topic] * len(accumulated_data))[-len(prpd_data):]
         
         # 合并所有周期的数据用于绘图
         all_data = []
@@ -1631,6 +3441,23 @@ class MainWindow(QMainWindow):
             display_data = prpd_data
             all_display_data = all_data
         
+        # 去除噪声底：每个周期只显示超过其传感器噪声阈值的采样点（线图中低于阈值的部分断开），
+        # 还没有噪声统计的传感器的周期原样显示
+        noise_floors = {}
+        if self.show_denoised:
+            for topic in dict.fromkeys(prpd_topics):
+                noise_floor = self.noise_tracker.get(topic)
+                if noise_floor is not None:
+                    noise_floors[topic] = noise_floor
+        if noise_floors:
+            masks = [np.asarray(cycle_data) > noise_floors[topic].sample_threshold(len(cycle_data), self.noise_k)
+                     if topic in noise_floors else np.ones(len(cycle_data), dtype=bool)
+                     for cycle_data, topic in zip(prpd_data, prpd_topics)]
+            keep = np.concatenate(masks)
+            x_data = np.asarray(x_data)[keep]
+            all_display_data = np.asarray(all_display_data, dtype=np.float64)[keep]
+            display_data = [np.where(mask, cycle_data, np.nan) for mask, cycle_data in zip(masks, display_data)]
+        
         if chart_type == "散点图":
             self.canvas.axes_2d.scatter(x_data, all_display_data, alpha=0.7, s=10)
         elif chart_type == "线图":
@@ -1645,28 +3472,22 @@ class MainWindow(QMainWindow):
         
         # 绘制参考正弦波
         if self.show_sine_wave:
-            # 确定数据的振幅范围，用于缩放正弦波
-            if all_display_data:
-                max_data = max(all_display_data)
-                min_data = min(all_display_data)
-                data_range = max_data - min_data
-                # 计算正弦波的振幅，使其与数据的振幅范围相适应
-                sine_amp = self.sine_amplitude * data_range / 4
-                # 计算正弦波的偏移量，使其居中显示
-                sine_offset = (max_data + min_data) / 2
-            else:
-                sine_amp = self.sine_amplitude
-                sine_offset = 0
-            
-            # 生成正弦波数据
-            x_sine = np.linspace(0, phase_per_cycle, 1000)
-            y_sine = sine_amp * np.sin(x_sine * 2 * np.pi / phase_per_cycle) + sine_offset
-            
-            # 绘制正弦波
-            self.canvas.axes_2d.plot(x_sine, y_sine, 'r-', linewidth=1.5, alpha=0.7, label="参考正弦波")
+            self.draw_sine_wave(self.canvas.axes_2d, all_display_data)
+        
+        # 绘制噪声阈值（多个传感器时每个传感器一条，标注主题）
+        for topic, noise_floor in noise_floors.items():
+            threshold = noise_floor.threshold(self.noise_k)
+            if self.use_dbm:
+                threshold = self.convert_unit(threshold, True)
+            phase_centers = (np.arange(noise_floor.bins) + 0.5) * (phase_per_cycle / noise_floor.bins)
+            self.canvas.axes_2d.step(phase_centers, threshold, '--', where='mid', linewidth=1.0, alpha=0.6,
+                                     color='k' if len(noise_floors) == 1 else None,
+                                     label="噪声阈值" if len(noise_floors) == 1 else f"噪声阈值 {topic}")
         
         # 设置图表标题和轴标签
         cycle_info = f"({len(prpd_data)}/{self.max_cycles}周期)"
+        if noise_floors:
+            cycle_info += " 已去除噪声底"
         self.canvas.axes_2d.set_title(f"PRPD图 {cycle_info}")
         self.canvas.axes_2d.set_xlabel("相位°)")
         self.canvas.axes_2d.set_ylabel(self.unit_label)
@@ -1674,6 +3495,44 @@ class MainWindow(QMainWindow):
         # 设置网格
         self.canvas.axes_2d.grid(True, linestyle='--', alpha=0.7)
     
+    def draw_pulse_prpd(self):
+        """绘制脉冲PRPD图：只绘制提取出的脉冲（相位, 幅值），点数比原始采样点少几个数量级"""
+        pulses = self.pulse_extractor.recent(self.pulse_topic, self.max_cycles)
+        amplitudes = pulses["amplitude"].astype(np.float64)
+        if self.use_dbm:
+            amplitudes = self.convert_unit(amplitudes, True)
+        self.canvas.axes_2d.scatter(pulses["phase"], amplitudes, alpha=0.7, s=10)
+        if self.show_sine_wave:
+            self.draw_sine_wave(self.canvas.axes_2d, amplitudes)
+        
+        self.canvas.axes_2d.set_title(f"PRPD脉冲图 ({len(amplitudes)}个脉冲, 最近{self.max_cycles}周期)")
+        self.canvas.axes_2d.set_xlabel("相位°)")
+        self.canvas.axes_2d.set_ylabel(self.unit_label)
+        self.canvas.axes_2d.grid(True, linestyle='--', alpha=0.7)
+    
+    def draw_sine_wave(self, ax, values, phase_per_cycle=360):
+        """绘制参考正弦波，振幅和偏移量按数据的范围缩放"""
+        # 确定数据的振幅范围，用于缩放正弦波
+        if len(values):
+            max_data = max(values)
+            min_data = min(values)
+            data_range = max_data - min_data
+            # 计算正弦波的振幅，使其与数据的振幅范围相适应
+            sine_amp = self.sine_amplitude * data_range / 4
+            # 计算正弦波的偏移量，使其居中显示
+            sine_offset = (max_data + min_data) / 2
+        else:
+            sine_amp = self.sine_amplitude
+            sine_offset = 0
+        
+        # 生成正弦波数据
+        x_sine = np.linspace(0, phase_per_cycle, 1000)
+        y_sine = sine_amp * np.sin(x_sine * 2 * np.pi / phase_per_cycle) + sine_offset
+        
+        # 绘制正弦波
+        ax.plot(x_sine, y_sine, 'r-', linewidth=1.5, alpha=0.7, label="参考正弦波")
+    
+    @perf_monitor.timed("draw_prps")
     def draw_prps(self, accumulated_data):
         """绘制PRPS三维图"""
         # 清除当前3D图并重新创建
@@ -1779,6 +3638,7 @@ class MainWindow(QMainWindow):
         """更新状态信息"""
         # 更新数据库状态
         if self.db_manager is not None and self.db_manager.connected:
+            self.db_manager.flush_expired()  # 写入超时的待压缩周期
             cycle_count = self.db_manager.get_cycle_count()
             raw_count = self.db_manager.get_raw_count()
             db_status = f"数据库: 已连接 (周期数据: {cycle_count}, 原始数据: {raw_count})"
@@ -1788,6 +3648,8 @@ class MainWindow(QMainWindow):
                 db_status += " [数据保存已启用]"
             else:
                 db_status += " [数据保存已禁用]"
+            if self.trigger_recorder is not None:
+                db_status += f" [{self.trigger_recorder.status_text()}]"
                 
             # 更新状态栏
             if hasattr(self, 'db_status_label'):
@@ -1795,14 +3657,49 @@ class MainWindow(QMainWindow):
             else:
                 self.db_status_label = QLabel(db_status)
                 self.status_bar.addPermanentWidget(self.db_status_label)
+            
+            # 后台维护的耗时、文件大小和碎片率
+            maintenance_status = self.db_manager.maintenance_status()
+            if hasattr(self, 'maintenance_label'):
+                self.maintenance_label.setText(maintenance_status)
+            else:
+                self.maintenance_label = QLabel(maintenance_status)
+                self.status_bar.addPermanentWidget(self.maintenance_label)
+    
+    def run_db_maintenance(self):
+        """立即执行数据库维护（ANALYZE、optimize、检查点、增量清理），结果显示在状态栏"""
+        if self.db_manager is None or not self.db_manager.connected:
+            QMessageBox.warning(self, "数据库未连接", "数据库未连接或连接失败，无法执行维护。")
+            return
+        self.db_manager.run_maintenance()
+        self.status_bar.showMessage("数据库维护已在后台开始", 3000)
     
     def closeEvent(self, event):
         """关闭窗口事件"""
+        # 停止指标服务
+        if self.metrics_server is not None:
+            self.metrics_server.stop()
+        
+        # 停止数据回放
+        if self.replay_thread is not None:
+            self.replay_thread.stop()
+            self.replay_thread.wait(1000)
+        
+        # 停止批量导出
+        self.stop_export()
+        
+        # 停止放电类型识别
+        self.classifier_thread.stop()
+        self.classifier_thread.wait(1000)
+        
         # 断开MQTT连接
         self.mqtt_client.disconnect_from_broker()
         
-        # 关闭数据库连接
+        # 保存正在记录的触发事件和未结束的趋势聚合后关闭数据库连接
+        if self.trigger_recorder is not None:
+            self.trigger_recorder.flush()
         if self.db_manager is not None:
+            self.db_manager.save_trend_rows(self.trend_aggregator.flush())
             self.db_manager.close()
             
         event.accept()
@@ -1823,19 +3720,170 @@ class MainWindow(QMainWindow):
         self.sine_amplitude = amplitude
         self.need_redraw = True
 
+    def toggle_denoised(self, state):
+        """切换是否去除噪声底显示"""
+        self.show_denoised = (state == Qt.CheckState.Checked.value)
+        self.need_redraw = True
+
+    def update_noise_k(self, k):
+        """更新显示用的噪声阈值倍数"""
+        self.noise_k = k
+        self.need_redraw = True
+
     def toggle_db_save(self, state):
         """切换是否保存数据到数据库"""
         self.save_to_db = (state == Qt.CheckState.Checked.value)
+        if not self.save_to_db and self.trigger_recorder is not None:
+            self.trigger_recorder.flush()  # 停止保存时保存正在记录的事件
         self.need_redraw = True
 
-    def save_raw_data(self, broker, topic, raw_data):
-        """保存原始数据到数据库（在主线程中执行）"""
-        if self.save_to_db and self.db_manager is not None:
+    def should_persist(self, replayed=False):
+        """判断数据是否需要保存到数据库（回放数据由回放设置决定，回放期间实时数据照常保存）"""
+        if not self.save_to_db:
+            return False
+        if replayed and not self.replay_persist:
+            return False
+        return True
+
+    def save_raw_data(self, broker, topic, raw_data, header=None, replayed=False):
+        """保存原始数据到数据库（在主线程中执行，启用触发记录或去除噪声底保存时不保存）
+        
+        帧序号和帧标志与原始数据一起保存；单次写入模式下由原始帧解码的周期按保存时的
+        相位对齐移动（与update_plot中保存的周期相同）。
+        """
+        if self.should_persist(replayed) and self.db_manager is not None and self.trigger_recorder is None \
+                and not self.store_denoised:
+            frame = (header.sequence, header.flags) if header is not None else None
+            shift = self.phase_aligner.shift(topic, header, SAMPLES_PER_FRAME)
             try:
-                self.db_manager.save_raw_data(broker, topic, raw_data)
+                self.db_manager.save_raw_data(broker, topic, raw_data, frame=frame, shift=shift)
             except Exception as e:
                 print(f"保存原始数据错误（主线程）: {str(e)}")
 
+    def toggle_replay(self):
+        """开始或停止数据回放"""
+        if self.replay_thread is not None:
+            self.replay_thread.stop()
+            self.status_bar.showMessage("正在停止回放...", 2000)
+            return
+        
+        dialog = ReplayDialog(self)
+        if not dialog.exec():
+            return
+        
+        # 准备回放数据源
+        if dialog.source_combo.currentIndex() == 1:
+            if not dialog.capture_file:
+                QMessageBox.warning(self, "无法回放", "请选择捕获文件。")
+                return
+            frames = load_capture_file(dialog.capture_file)
+            source_name = os.path.basename(dialog.capture_file)
+        else:
+            if self.db_manager is None or not self.db_manager.connected:
+                QMessageBox.warning(self, "数据库未连接", "数据库未连接或连接失败，无法回放数据。")
+                return
+            start_time, end_time = dialog.get_time_range()
+            frames = self.db_manager.iter_raw_data(start_time, end_time)
+            source_name = "数据库"
+        
+        self.replay_persist = dialog.persist_checkbox.isChecked()
+        
+        # 确保消息队列处理定时器在运行（断开连接后会被停止）
+        if not self.mqtt_client.queue_timer.isActive():
+            self.mqtt_client.queue_timer.start(50)
+        
+        # 回放帧经过与实时数据完全相同的解码流程，队列已满时等待而不丢弃；每次回放重新跟踪帧序号
+        self.mqtt_client.replay_checker = FrameChecker()
+        self.replay_thread = ReplayThread(frames, self.mqtt_client.replay_message, self.mqtt_client.message_queue,
+                                          speed=dialog.get_speed(),
+                                          accurate_timing=dialog.accurate_checkbox.isChecked())
+        self.replay_thread.progress.connect(self.update_replay_progress)
+        self.replay_thread.replay_finished.connect(self.on_replay_finished)
+        self.replay_thread.start()
+        
+        self.replay_button.setText("停止回放")
+        self.status_bar.showMessage(f"开始回放: {source_name}，速度: {dialog.speed_combo.currentText()}", 3000)
+    
+    def update_replay_progress(self, count):
+        """更新回放进度"""
+        self.status_bar.showMessage(f"正在回放: 已回放 {count} 帧")
+    
+    def on_replay_finished(self, count, dropped, elapsed):
+        """回放结束"""
+        if self.replay_thread is not None:
+            self.replay_thread.wait(1000)
+        self.replay_thread = None
+        self.replay_persist = False
+        self.replay_button.setText("数据回放")
+        rate = count / elapsed if elapsed > 0 else 0
+        self.status_bar.showMessage(f"回放结束: 处理 {count} 帧，{dropped} 帧损坏或重复未处理，"
+                                    f"耗时 {elapsed:.2f} 秒 ({rate:.1f} 帧/秒)", 5000)
+
+    def toggle_export(self):
+        """开始批量导出，导出进行中时取消导出"""
+        if self.export_thread is not None:
+            self.export_thread.stop()
+            self.status_bar.showMessage("正在取消导出...", 2000)
+            return
+        
+        if self.db_manager is None or not self.db_manager.connected:
+            QMessageBox.warning(self, "数据库未连接", "数据库未连接或连接失败，无法导出数据。")
+            return
+        
+        dialog = ExportDialog(self.topic_input.text(), self)
+        if not dialog.exec():
+            return
+        file_path = dialog.get_file_path()
+        if not file_path:
+            QMessageBox.warning(self, "无法导出", "请选择导出文件。")
+            return
+        if file_path.lower().endswith((".parquet", ".arrow")) and not arrow_available():
+            QMessageBox.warning(self, "无法导出", "导出Parquet/Arrow格式需要安装pyarrow：\npip install pyarrow")
+            return
+        
+        start_time, end_time = dialog.get_time_range()
+        # 在主线程中准备读取（写入缓存的数据块），之后的读取和写文件都在导出线程中执行
+        batches = self.db_manager.iter_cycle_batches(start_time, end_time, dialog.get_topics())
+        self.export_thread = ExportThread(batches, file_path)
+        self.export_thread.progress.connect(self.update_export_progress)
+        self.export_thread.export_finished.connect(self.on_export_finished)
+        self.export_thread.start()
+        
+        self.export_action.setText("取消导出")
+        self.status_bar.showMessage(f"开始导出: {start_time} ~ {end_time} -> {file_path}", 3000)
+    
+    def update_export_progress(self, count, timestamp):
+        """更新导出进度"""
+        self.status_bar.showMessage(f"正在导出: 已导出 {count} 个周期，当前时间 {timestamp}")
+    
+    def on_export_finished(self, count, elapsed, error):
+        """导出结束"""
+        if self.export_thread is not None:
+            file_path = self.export_thread.file_path
+            self.export_thread.wait(1000)
+        else:
+            file_path = ""
+        self.export_thread = None
+        self.export_action.setText("导出数据...")
+        if error:
+            self.status_bar.showMessage(f"导出未完成: {error}", 5000)
+            return
+        rate = count / elapsed if elapsed > 0 else 0
+        self.status_bar.showMessage(
+            f"导出完成: 共 {count} 个周期，耗时 {elapsed:.2f} 秒 ({rate:.0f} 周期/秒) -> {file_path}", 8000)
+    
+    def stop_replay(self):
+        """停止回放线程并等待其结束（关闭数据库之前调用）"""
+        if self.replay_thread is not None:
+            self.replay_thread.stop()
+            self.replay_thread.wait()
+    
+    def stop_export(self):
+        """停止导出线程并等待其结束（关闭数据库之前调用）"""
+        if self.export_thread is not None:
+            self.export_thread.stop()
+            self.export_thread.wait()
+    
     def show_database_view(self):
         """显示数据库查看对话框"""
         if self.db_manager is not None and self.db_manager.connected:
@@ -1949,9 +3997,16 @@ class MainWindow(QMainWindow):
             self.image_save_timer.stop()
             self.status_bar.showMessage("已禁用自动保存PRPD图", 3000)
     
+    @perf_monitor.timed("auto_save_image")
     def auto_save_image(self):
         """自动保存PRPD图像"""
-        if not self.auto_save_images or not self.accumulated_data:
+        if not self.auto_save_images:
+            return
+        self.save_prpd_image()
+    
+    def save_prpd_image(self, prefix="PRPD"):
+        """保存当前PRPD图像到图像保存目录，文件名为 前缀_时间.png"""
+        if not self.accumulated_data:
             return
         
         try:
@@ -1964,7 +4019,7 @@ class MainWindow(QMainWindow):
             
             # 生成文件名
             timestamp = datetime.datetime.now().strftime("%Y%m%d%H%M%S")
-            filename = f"PRPD_{timestamp}.png"
+            filename = f"{prefix}_{timestamp}.png"
             file_path = os.path.join(save_dir, filename)
             
             # 保存当前PRPD图像
@@ -2010,28 +4065,16 @@ class MainWindow(QMainWindow):
                 for i, cycle_data in enumerate(display_data):
                     cycle_phases = np.linspace(0, 360, len(cycle_data))
                     ax.plot(cycle_phases, cycle_data, linewidth=1.0)
+            elif chart_type == "脉冲事件":
+                pulses = self.pulse_extractor.recent(self.pulse_topic, self.max_cycles)
+                all_display_data = pulses["amplitude"].astype(np.float64)
+                if self.use_dbm:
+                    all_display_data = self.convert_unit(all_display_data, True)
+                ax.scatter(pulses["phase"], all_display_data, alpha=0.7, s=10)
             
             # 绘制参考正弦波
             if self.show_sine_wave:
-                # 确定数据的振幅范围，用于缩放正弦波
-                if all_display_data:
-                    max_data = max(all_display_data)
-                    min_data = min(all_display_data)
-                    data_range = max_data - min_data
-                    # 计算正弦波的振幅，使其与数据的振幅范围相适应
-                    sine_amp = self.sine_amplitude * data_range / 4
-                    # 计算正弦波的偏移量，使其居中显示
-                    sine_offset = (max_data + min_data) / 2
-                else:
-                    sine_amp = self.sine_amplitude
-                    sine_offset = 0
-                
-                # 生成正弦波数据
-                x_sine = np.linspace(0, 360, 1000)
-                y_sine = sine_amp * np.sin(x_sine * 2 * np.pi / 360) + sine_offset
-                
-                # 绘制正弦波
-                ax.plot(x_sine, y_sine, 'r-', linewidth=1.5, alpha=0.7, label="参考正弦波")
+                self.draw_sine_wave(ax, all_display_data)
             
             # 设置图表标题和轴标签
             cycle_info = f"({len(prpd_data)}/{self.max_cycles}周期)"
@@ -2094,7 +4137,7 @@ class MainWindow(QMainWindow):
             print(f"获取应用路径出错，使用当前工作目录: {application_path}, 错误: {str(e)}")
         
         # 保存路径信息
-        self.db_path = os.path.join(application_path, "gis_pd_data.db")
+        self.db_path = self.db_manager.db_path
         self.images_path = os.path.join(application_path, "saved_images")
         
         print(f"数据库路径: {self.db_path}")
@@ -0,0 +1,113 @@
+"""噪声底估计和背景扣除
+
+PRPD图中绝大部分采样点是背景噪声，放电脉冲被淹没在噪声带中。NoiseFloor为每个传感器按相位窗(bin)
+维护噪声的滚动估计，每个周期的更新只涉及bins个数值（O(bins)）:
+    1. 周期内每个相位窗的采样均值m和平方均值m2（np.bincount一次计算）
+    2. 噪声均值μ和平方均值按指数加权移动平均(EWMA)更新: μ += α(m - μ)，标准差σ = sqrt(E[x²] - μ²)
+       开始时α取max(α, 1/n)，前1/α个周期相当于算术平均，估计值很快收敛
+    3. 更新前把超过当前阈值μ+CLIP_SIGMA·σ的采样点截断到阈值，放电脉冲不会抬高噪声底
+阈值μ+k·σ随相位变化，可以扣除与工频相位相关的背景干扰（例如固定相位的通信干扰）。
+
+denoise只保留超过阈值的采样点，其余置为0: 显示时只绘制放电脉冲，保存时大量连续的0压缩后几乎不占空间。
+"""
+import numpy as np
+
+NOISE_BINS = 72  # 相位窗数量（每个5°）
+NOISE_ALPHA = 0.02  # EWMA系数，约等于最近50个周期（50Hz时1秒）的平均
+NOISE_K = 3.0  # 默认阈值：噪声均值 + 3倍标准差
+CLIP_SIGMA = 3.0  # 更新噪声估计前截断超过均值+CLIP_SIGMA倍标准差的采样点
+
+
+class NoiseFloor:
+    """单个传感器按相位窗的滚动噪声估计"""
+    def __init__(self, bins=NOISE_BINS, alpha=NOISE_ALPHA):
+        """
+        Args:
+            bins: 相位窗数量
+            alpha: EWMA系数，越大对噪声变化的响应越快
+        """
+        self.bins = bins
+        self.alpha = alpha
+        self.index_cache = {}  # 周期采样点数 -> (每个采样点的相位窗下标, 每个相位窗的采样点数)
+        self.reset()
+
+    def reset(self):
+        self.cycles = 0  # 已更新的周期数
+        self.threshold_cache = None  # (k, 采样点数, 每个采样点的阈值)，噪声估计更新后失效
+        self.mean = np.zeros(self.bins)
+        self.mean_sq = np.zeros(self.bins)
+
+    def bin_index(self, samples):
+        """长度为samples的周期中每个采样点所在的相位窗，以及每个相位窗的采样点数"""
+        cached = self.index_cache.get(samples)
+        if cached is None:
+            index = np.arange(samples) * self.bins // samples
+            cached = self.index_cache[samples] = (index, np.bincount(index, minlength=self.bins))
+        return cached
+
+    def update(self, values):
+        """加入一个周期的mV数据（一维数组）"""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return
+        index, counts = self.bin_index(len(values))
+        if self.cycles:
+            values = np.minimum(values, self.sample_threshold(len(values), CLIP_SIGMA))
+        alpha = max(self.alpha, 1.0 / (self.cycles + 1))
+        mean = np.bincount(index, values, minlength=self.bins)
+        mean_sq = np.bincount(index, values * values, minlength=self.bins)
+        if len(values) >= self.bins:
+            self.mean += alpha * (mean / counts - self.mean)
+            self.mean_sq += alpha * (mean_sq / counts - self.mean_sq)
+        else:
+            valid = counts > 0  # 采样点数少于相位窗数时部分相位窗没有采样点
+            self.mean[valid] += alpha * (mean[valid] / counts[valid] - self.mean[valid])
+            self.mean_sq[valid] += alpha * (mean_sq[valid] / counts[valid] - self.mean_sq[valid])
+        self.cycles += 1
+        self.threshold_cache = None
+
+    def sigma(self):
+        """每个相位窗的噪声标准差"""
+        return np.sqrt(np.maximum(self.mean_sq - self.mean ** 2, 0.0))
+
+    def threshold(self, k=NOISE_K):
+        """每个相位窗的噪声阈值 = 均值 + k倍标准差"""
+        return self.mean + k * self.sigma()
+
+    def sample_threshold(self, samples, k=NOISE_K):
+        """长度为samples的周期中每个采样点的噪声阈值（同一周期的显示和保存共用计算结果）"""
+        cached = self.threshold_cache
+        if cached is None or cached[0] != k or cached[1] != samples:
+            cached = self.threshold_cache = (k, samples, self.threshold(k)[self.bin_index(samples)[0]])
+        return cached[2]
+
+    def denoise(self, values, k=NOISE_K):
+        """只保留超过噪声阈值的采样点，其余置为0；values可以是一维(一个周期)或二维(周期数, 采样点数)数组"""
+        values = np.asarray(values, dtype=np.float64)
+        if not self.cycles or not values.size:
+            return values
+        return np.where(values > self.sample_threshold(values.shape[-1], k), values, 0.0)
+
+
+class NoiseTracker:
+    """按传感器（MQTT主题）维护NoiseFloor，在调用线程中使用"""
+    def __init__(self, bins=NOISE_BINS, alpha=NOISE_ALPHA):
+        self.bins = bins
+        self.alpha = alpha
+        self.floors = {}  # 主题 -> NoiseFloor
+
+    def update(self, topic, values):
+        """加入传感器的一个周期，返回该传感器的NoiseFloor"""
+        topic = topic or ""
+        floor = self.floors.get(topic)
+        if floor is None:
+            floor = self.floors[topic] = NoiseFloor(self.bins, self.alpha)
+        floor.update(values)
+        return floor
+
+    def get(self, topic):
+        """返回传感器的NoiseFloor，没有数据时返回None"""
+        return self.floors.get(topic or "")
+
+    def clear(self):
+        self.floors.clear()
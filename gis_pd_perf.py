@@ -0,0 +1,180 @@
+"""性能计时与分析工具
+
+为热点函数提供可选的轻量级计时：未启用时只增加一次布尔判断的开销，
+启用后为每个阶段保留最近若干次的耗时，用于计算p50/p95/p99等统计值。
+同时提供按需启动cProfile和py-spy采样的功能。
+"""
+import os
+import json
+import time
+import shutil
+import cProfile
+import pstats
+import threading
+import functools
+import subprocess
+from collections import deque
+
+import numpy as np
+
+
+class StageStats:
+    """单个阶段的滚动耗时统计"""
+    def __init__(self, window_size):
+        self.samples = deque(maxlen=window_size)  # 最近的耗时样本(秒)
+        self.count = 0  # 累计调用次数
+        self.total = 0.0  # 累计耗时(秒)
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+
+class PerfMonitor:
+    """性能计时器
+
+    用法:
+        @perf_monitor.timed("update_plot")
+        def update_plot(self, data): ...
+
+        with perf_monitor.measure("db.commit"):
+            ...
+    """
+    def __init__(self, window_size=2048, enabled=False):
+        self.window_size = window_size
+        self.enabled = enabled
+        self.stages = {}
+        self.lock = threading.Lock()  # on_message在MQTT线程中执行，需要加锁
+        self.profiler = None
+        self.py_spy_process = None
+
+    def record(self, name, seconds):
+        """记录一次耗时"""
+        with self.lock:
+            stats = self.stages.get(name)
+            if stats is None:
+                stats = self.stages[name] = StageStats(self.window_size)
+            stats.add(seconds)
+
+    def timed(self, name):
+        """函数计时装饰器"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def measure(self, name):
+        """代码块计时上下文管理器"""
+        return _Measure(self, name)
+
+    def reset(self):
+        """清空所有统计数据"""
+        with self.lock:
+            self.stages = {}
+
+    def summary(self):
+        """获取各阶段的统计信息（耗时单位为毫秒）"""
+        with self.lock:
+            snapshot = {name: (list(stats.samples), stats.count, stats.total)
+                        for name, stats in self.stages.items()}
+        result = {}
+        for name, (samples, count, total) in sorted(snapshot.items()):
+            if not samples:
+                continue
+            values = np.asarray(samples) * 1000.0
+            p50, p95, p99 = np.percentile(values, [50, 95, 99])
+            result[name] = {
+                "count": count,
+                "mean_ms": float(values.mean()),
+                "p50_ms": float(p50),
+                "p95_ms": float(p95),
+                "p99_ms": float(p99),
+                "max_ms": float(values.max()),
+                "total_s": total,
+            }
+        return result
+
+    def export(self, file_path):
+        """导出统计信息，根据扩展名保存为JSON或CSV"""
+        summary = self.summary()
+        if file_path.lower().endswith(".csv"):
+            with open(file_path, "w", encoding="utf-8") as f:
+                f.write("stage,count,mean_ms,p50_ms,p95_ms,p99_ms,max_ms,total_s\n")
+                for name, item in summary.items():
+                    f.write(f"{name},{item['count']},{item['mean_ms']:.4f},{item['p50_ms']:.4f},"
+                            f"{item['p95_ms']:.4f},{item['p99_ms']:.4f},{item['max_ms']:.4f},"
+                            f"{item['total_s']:.4f}\n")
+        else:
+            with open(file_path, "w", encoding="utf-8") as f:
+                json.dump({"timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+                           "stages": summary}, f, ensure_ascii=False, indent=2)
+
+    def start_profile(self):
+        """启动cProfile（只分析调用start_profile的线程，即主线程）"""
+        if self.profiler is not None:
+            return False
+        self.profiler = cProfile.Profile()
+        self.profiler.enable()
+        return True
+
+    def stop_profile(self, file_path):
+        """停止cProfile并保存结果
+
+        .prof文件可使用snakeviz等工具查看，同时生成按累计耗时排序的文本报告
+        """
+        if self.profiler is None:
+            return None
+        self.profiler.disable()
+        self.profiler.dump_stats(file_path)
+        report_path = os.path.splitext(file_path)[0] + ".txt"
+        with open(report_path, "w", encoding="utf-8") as f:
+            stats = pstats.Stats(self.profiler, stream=f)
+            stats.sort_stats("cumulative").print_stats(60)
+        self.profiler = None
+        return report_path
+
+    @staticmethod
+    def py_spy_available():
+        return shutil.which("py-spy") is not None
+
+    def start_py_spy(self, file_path, duration=30):
+        """使用py-spy对当前进程采样duration秒，生成火焰图（需要已安装py-spy）"""
+        if not self.py_spy_available():
+            raise RuntimeError("未找到py-spy，请先执行 pip install py-spy")
+        if self.py_spy_process is not None and self.py_spy_process.poll() is None:
+            raise RuntimeError("py-spy采样正在进行中")
+        self.py_spy_process = subprocess.Popen(
+            ["py-spy", "record", "--pid", str(os.getpid()), "--duration", str(int(duration)),
+             "--output", file_path, "--threads"],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+
+
+class _Measure:
+    def __init__(self, monitor, name):
+        self.monitor = monitor
+        self.name = name
+        self.start = None
+
+    def __enter__(self):
+        if self.monitor.enabled:
+            self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self.start is not None:
+            self.monitor.record(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# 全局计时器，设置环境变量GIS_PD_PERF=1可在启动时启用
+perf_monitor = PerfMonitor(enabled=os.environ.get("GIS_PD_PERF", "") not in ("", "0"))
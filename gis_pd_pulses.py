@@ -0,0 +1,227 @@
+"""脉冲提取
+
+解码后的周期数据中，绝大部分采样点是噪声，真正需要关注的是其中少量的放电脉冲。
+detect_pulses对一批周期（形状(周期数, 采样点数)）一次完成向量化计算：
+    1. 每个周期的自适应噪声阈值 = 中位数 + PULSE_THRESHOLD_SIGMA倍稳健标准差(1.4826*MAD)，
+       与compute_cycle_features的脉冲数使用同一阈值，不受基线偏移和增益变化影响
+    2. 超过阈值的连续采样点为一个脉冲，取其中的最大值（局部极大值）作为脉冲的幅值和相位
+因此每个周期提取出的脉冲数与cycle_summary中的pulse_count一致。
+
+提取出的脉冲以(相位, 幅值, 周期序号, 时间, 帧序号)保存在列式环形缓冲区PulseBuffer中，
+PRPD图、统计和后续处理可以直接使用这些数组，数据量比原始采样点少几个数量级；
+同时增量更新每个传感器的PRPD统计指纹（gis_pd_fingerprint.PRPDStatistics）。
+"""
+import time
+
+import numpy as np
+
+from gis_pd_perf import perf_monitor  # 性能计时
+from gis_pd_storage import pulse_threshold
+from gis_pd_fingerprint import PRPDStatistics, PHASE_BINS, DEFAULT_WINDOW
+
+PULSE_BUFFER_CAPACITY = 200000  # 每个传感器保留的脉冲数（约4.8MB）
+PENDING_BATCH = 64  # 逐个加入的周期攒够该数量后批量提取（单个周期提取的开销约为批量时的10倍）
+
+
+def detect_pulses(values):
+    """提取一批周期中的脉冲
+
+    Args:
+        values: 形状为(周期数, 采样点数)的mV数组（一维时视为一个周期）
+    Returns:
+        (周期下标, 采样点下标, 幅值)三个等长数组，按周期和相位排序
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    samples = values.shape[1]
+    above = values > pulse_threshold(values)
+    starts = above.copy()
+    starts[:, 1:] &= ~above[:, :-1]  # 每个超过阈值区段的第一个采样点
+
+    positions = np.flatnonzero(above)  # 超过阈值的采样点在展开数组中的位置
+    if not len(positions):
+        return np.empty(0, np.int64), np.empty(0, np.int64), np.empty(0, np.float64)
+    amplitudes = values.ravel()[positions]
+    is_start = starts.ravel()[positions]
+    run_id = np.cumsum(is_start) - 1
+    run_max = np.maximum.reduceat(amplitudes, np.flatnonzero(is_start))
+    # 每个区段中第一个达到区段最大值的采样点
+    candidates = np.flatnonzero(amplitudes == run_max[run_id])
+    first = np.ones(len(candidates), dtype=bool)
+    first[1:] = run_id[candidates[1:]] != run_id[candidates[:-1]]
+    peaks = positions[candidates[first]]
+    cycle_index, sample_index = np.divmod(peaks, samples)
+    return cycle_index, sample_index, values.ravel()[peaks]
+
+
+class PulseBuffer:
+    """脉冲的列式环形缓冲区，超过容量时覆盖最早的脉冲
+
+    列: phase(float32, 度), amplitude(float32, mV), cycle(int64, 周期序号), time(float64, 帧到达的Unix时间),
+        sequence(int64, 帧序号，固件未填写时为-1)
+    """
+    COLUMNS = (("phase", np.float32), ("amplitude", np.float32), ("cycle", np.int64), ("time", np.float64),
+               ("sequence", np.int64))
+
+    def __init__(self, capacity=PULSE_BUFFER_CAPACITY):
+        self.capacity = capacity
+        self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.COLUMNS}
+        self.total = 0  # 累计写入的脉冲数，写入位置为total % capacity
+
+    def __len__(self):
+        return min(self.total, self.capacity)
+
+    def append(self, phase, amplitude, cycle, times, sequence=None):
+        """追加一批脉冲（各参数为等长数组，sequence为None时帧序号为-1）"""
+        count = len(phase)
+        arrays = {"phase": phase, "amplitude": amplitude, "cycle": cycle, "time": times,
+                  "sequence": np.full(count, -1, dtype=np.int64) if sequence is None else sequence}
+        if count > self.capacity:
+            arrays = {name: array[-self.capacity:] for name, array in arrays.items()}
+            self.total += count - self.capacity
+            count = self.capacity
+        position = self.total % self.capacity
+        head = min(count, self.capacity - position)  # 写到缓冲区末尾的部分，其余从头开始写
+        for name, column in self.columns.items():
+            array = arrays[name]
+            column[position:position + head] = array[:head]
+            column[:count - head] = array[head:]
+        self.total += count
+
+    def get(self, min_cycle=None):
+        """按写入顺序返回各列的副本，min_cycle不为None时只返回周期序号不小于min_cycle的脉冲"""
+        size = len(self)
+        position = self.total % self.capacity
+        if size < self.capacity or position == 0:
+            result = {name: column[:size].copy() for name, column in self.columns.items()}
+        else:
+            result = {name: np.concatenate([column[position:], column[:position]])
+                      for name, column in self.columns.items()}
+        if min_cycle is not None:
+            # 周期序号随写入顺序递增，二分查找起始位置
+            start = np.searchsorted(result["cycle"], min_cycle, side="left")
+            result = {name: array[start:] for name, array in result.items()}
+        return result
+
+    def since(self, total):
+        """返回累计写入数为total之后写入的脉冲（已被覆盖的部分不返回），各列为副本"""
+        count = min(self.total - total, len(self))
+        index = np.arange(self.total - count, self.total) % self.capacity
+        return {name: column[index] for name, column in self.columns.items()}
+
+    def clear(self):
+        self.total = 0
+
+
+class PulseExtractor:
+    """按传感器（MQTT主题）提取脉冲并保存在各自的PulseBuffer中，在调用线程中使用
+
+    add_cycle只把周期加入待处理列表，攒够PENDING_BATCH个周期或读取脉冲(recent)时批量提取。
+    """
+    def __init__(self, capacity=PULSE_BUFFER_CAPACITY, stats_window=DEFAULT_WINDOW, bins=PHASE_BINS):
+        """
+        Args:
+            capacity: 每个传感器的脉冲缓冲区容量
+            stats_window: 统计指纹的滑动窗口周期数，None表示累计全部周期
+            bins: 统计指纹的相位窗数量
+        """
+        self.capacity = capacity
+        self.stats_window = stats_window
+        self.bins = bins
+        self.stats = {}  # 主题 -> PRPDStatistics
+        self.buffers = {}  # 主题 -> PulseBuffer
+        self.cycle_counts = {}  # 主题 -> 已处理的周期数（下一个周期的序号）
+        self.pending = {}  # 主题 -> [(mV数据, Unix时间, 帧序号)]，等待批量提取的周期
+
+    @perf_monitor.timed("detect_pulses")
+    def add_cycles(self, topic, values, timestamps=None, sequences=None):
+        """提取一批周期中的脉冲
+
+        Args:
+            values: 形状为(周期数, 采样点数)的mV数组
+            timestamps: 每个周期的Unix时间（帧到达时间），为None时使用当前时间
+            sequences: 每个周期的帧序号（固件未填写时为None或-1），为None时全部为-1
+        Returns:
+            提取出的脉冲数
+        """
+        topic = topic or ""
+        values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+        first_cycle = self.cycle_counts.get(topic, 0)
+        self.cycle_counts[topic] = first_cycle + len(values)
+        cycle_index, sample_index, amplitudes = detect_pulses(values)
+        if timestamps is None:
+            times = np.full(len(cycle_index), time.time())
+        else:
+            times = np.asarray(timestamps, dtype=np.float64)[cycle_index]
+        if sequences is not None:
+            sequences = np.array([-1 if sequence is None else sequence for sequence in sequences],
+                                 dtype=np.int64)[cycle_index]
+        buffer = self.buffers.get(topic)
+        if buffer is None:
+            buffer = self.buffers[topic] = PulseBuffer(self.capacity)
+        phases = sample_index * (360.0 / values.shape[1])
+        buffer.append(phases, amplitudes, first_cycle + cycle_index, times, sequences)
+        stats = self.stats.get(topic)
+        if stats is None:
+            stats = self.stats[topic] = PRPDStatistics(self.bins, self.stats_window)
+        stats.add_pulses(cycle_index, phases, amplitudes, len(values))
+        return len(cycle_index)
+
+    def add_cycle(self, topic, data, timestamp=None, sequence=None):
+        """加入一个周期，攒够PENDING_BATCH个周期后批量提取
+
+        timestamp为帧到达的Unix时间（为None时使用当前时间），sequence为帧序号（固件未填写时为None），
+        用于多传感器关联时对齐周期（见gis_pd_correlation）。
+        """
+        topic = topic or ""
+        pending = self.pending.setdefault(topic, [])
+        pending.append((data, time.time() if timestamp is None else timestamp, sequence))
+        if len(pending) >= PENDING_BATCH:
+            self.process(topic)
+
+    def process(self, topic):
+        """批量提取主题的待处理周期（长度相同的连续周期为一批）"""
+        pending = self.pending.pop(topic, None)
+        start = 0
+        while pending and start < len(pending):
+            end = start + 1
+            while end < len(pending) and len(pending[end][0]) == len(pending[start][0]):
+                end += 1
+            self.add_cycles(topic, np.array([item[0] for item in pending[start:end]], dtype=np.float64),
+                            [item[1] for item in pending[start:end]], [item[2] for item in pending[start:end]])
+            start = end
+
+    def recent(self, topic, cycles):
+        """返回传感器最近cycles个周期中的脉冲（各列数组，见PulseBuffer）"""
+        topic = topic or ""
+        self.process(topic)
+        buffer = self.buffers.get(topic)
+        if buffer is None:
+            return {name: np.empty(0, dtype=dtype) for name, dtype in PulseBuffer.COLUMNS}
+        return buffer.get(self.cycle_counts[topic] - cycles)
+
+    def statistics(self, topic):
+        """返回传感器的PRPD统计(PRPDStatistics)，没有数据时返回None"""
+        topic = topic or ""
+        self.process(topic)
+        return self.stats.get(topic)
+
+    def flush(self):
+        """处理所有主题的待处理周期"""
+        for topic in list(self.pending):
+            self.process(topic)
+
+    def snapshots(self):
+        """处理所有待处理的周期，返回各传感器相位分布的副本{主题: (分布, 相位窗中心, 周期数)}"""
+        self.flush()
+        return {topic: stats.snapshot() for topic, stats in self.stats.items()}
+
+    def set_stats_window(self, window):
+        """修改统计指纹的滑动窗口（已有的统计重新开始）"""
+        self.stats_window = window
+        self.stats.clear()
+
+    def clear(self):
+        self.stats.clear()
+        self.buffers.clear()
+        self.cycle_counts.clear()
+        self.pending.clear()
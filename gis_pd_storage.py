@@ -0,0 +1,1916 @@
+"""数据存储
+
+DatabaseManager: 单个SQLite数据库文件的存储和查询，写入线程独占写连接，查询使用只读连接池(WAL)；
+    可选按数据块压缩周期数据，写入时计算每个周期的特征值（峰值、均值、RMS、脉冲数、峰值相位），
+    支持按特征筛选；
+    单次写入模式下只保存二进制原始帧，周期数据在查询时解码（带LRU缓存）
+    按时间范围和主题分批流式读取周期数据（iter_cycle_batches），用于批量导出；
+    触发记录的事件（gis_pd_trigger）保存为一个压缩数据块和trigger_events表中的一行；
+    报警事件（gis_pd_alarms）保存在alarm_events表；
+    长期趋势（gis_pd_trend，每秒/每分钟/每小时的聚合）保存在trend_data表
+PartitionedDatabaseManager: 按天或按周分区的存储，每个分区一个SQLite文件，
+    带目录库(catalog)、自动滚动、保留策略和跨分区查询；趋势数据保存在不受保留策略影响的trends.db
+"""
+import os
+import sys
+import lzma
+import time
+import zlib
+import heapq
+import queue
+import shutil
+import sqlite3
+import datetime
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from urllib.request import pathname2url
+
+import numpy as np
+
+from gis_pd_perf import perf_monitor  # 性能计时
+from gis_pd_metrics import metrics  # Prometheus指标
+from gis_pd_maintenance import DatabaseMaintenance  # 后台维护
+from gis_pd_frame import FRAME_BYTES, FRAME_DAMAGED, FRAME_DUPLICATE  # 完整帧的字节数和帧标志
+
+# 时间戳格式，所有表中的timestamp列都使用该格式，可以直接按字符串比较
+TIMESTAMP_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+def get_application_path():
+    """获取应用程序根目录"""
+    try:
+        if getattr(sys, 'frozen', False):
+            # 如果是打包后的应用程序，使用可执行文件所在目录
+            # 注意：不使用sys._MEIPASS，因为那是临时目录，应用关闭后会被删除
+            return os.path.dirname(sys.executable)
+        # 如果是普通Python脚本，使用脚本所在目录
+        return os.path.dirname(os.path.abspath(__file__))
+    except Exception as e:
+        # 如果出错，回退到当前工作目录
+        print(f"获取应用路径出错，使用当前工作目录: {os.getcwd()}, 错误: {str(e)}")
+        return os.getcwd()
+
+ADC_SCALE = 3.3 / 4096  # 码值转换为mV
+
+# 周期数据块压缩方式: 名称 -> (压缩函数, 解压函数)
+CYCLE_CODECS = {
+    "zlib": (lambda data: zlib.compress(data, 6), zlib.decompress),
+    "lzma": (lambda data: lzma.compress(data, preset=6), lzma.decompress),
+}
+
+PULSE_THRESHOLD_SIGMA = 5.0  # 脉冲判定阈值: 周期中位数 + 5倍稳健标准差
+SUMMARY_COLUMNS = ("peak", "mean", "rms", "pulse_count", "peak_phase")
+
+def pulse_threshold(values):
+    """每个周期的脉冲判定阈值: 中位数 + PULSE_THRESHOLD_SIGMA倍稳健标准差(1.4826*MAD)，形状(周期数, 1)"""
+    median = np.median(values, axis=1, keepdims=True)
+    sigma = 1.4826 * np.median(np.abs(values - median), axis=1, keepdims=True)
+    return median + PULSE_THRESHOLD_SIGMA * np.maximum(sigma, 0.01)
+
+def compute_cycle_features(values):
+    """计算周期特征值
+    
+    Args:
+        values: 形状为(周期数, 采样点数)的数组
+    Returns:
+        (峰值, 均值, RMS, 脉冲数, 峰值相位)，每项为长度等于周期数的数组。
+        脉冲数为超过阈值的连续区段个数，阈值为每个周期的中位数加PULSE_THRESHOLD_SIGMA倍
+        稳健标准差(1.4826*MAD)，不受基线偏移影响；峰值相位单位为度。
+    """
+    values = np.atleast_2d(np.asarray(values, dtype=np.float64))
+    samples = values.shape[1]
+    peak_index = values.argmax(axis=1)
+    above = values > pulse_threshold(values)
+    pulse_count = above[:, 0].astype(np.int64) + (above[:, 1:] & ~above[:, :-1]).sum(axis=1)
+    return (
+        values[np.arange(len(values)), peak_index],
+        values.mean(axis=1),
+        np.sqrt((values ** 2).mean(axis=1)),
+        pulse_count,
+        peak_index * (360.0 / samples),
+    )
+
+def summary_rows(features, prefix_rows, frames=None, shifts=None):
+    """将特征数组与每个周期的前缀列(时间戳, cycle_id, block_id, block_index, raw_id)组合为插入用的行
+    
+    frames为每个周期的(帧序号, 帧标志)，没有帧信息的周期为None（见gis_pd_frame）；
+    shifts为由原始帧解码的周期相位对齐时循环移动的采样点数，其余周期为None。
+    """
+    peak, mean, rms, pulse_count, peak_phase = (column.tolist() for column in features)
+    frames = frames or [None] * len(prefix_rows)
+    shifts = shifts or [None] * len(prefix_rows)
+    return [prefix + (peak[i], mean[i], rms[i], pulse_count[i], peak_phase[i]) + (frames[i] or (None, None))
+            + (shifts[i],) for i, prefix in enumerate(prefix_rows)]
+
+def cycle_text_features(texts):
+    """计算一批cycle_data文本（逗号分隔的mV值）的特征值
+    
+    整批文本拼接后一次转换为数组，按采样点数分组，每组调用一次compute_cycle_features。
+    
+    Returns:
+        [(行下标列表, compute_cycle_features的结果)]，无法解析的行不包含在内
+    """
+    texts = [str(text) for text in texts]
+    counts = [text.count(",") + 1 for text in texts]
+    try:
+        values = np.array(",".join(texts).split(","), dtype=np.float64)
+    except ValueError:
+        # 有无法解析的行时逐行解析，跳过这些行
+        rows = []
+        for text in texts:
+            try:
+                rows.append(np.array(text.split(","), dtype=np.float64))
+            except ValueError:
+                rows.append(None)
+    else:
+        if len(set(counts)) == 1:
+            return [(list(range(len(texts))), compute_cycle_features(values.reshape(len(texts), -1)))]
+        rows = np.split(values, np.cumsum(counts)[:-1])
+    groups = {}
+    for index, row in enumerate(rows):
+        if row is not None:
+            groups.setdefault(len(row), []).append(index)
+    return [(indexes, compute_cycle_features(np.array([rows[i] for i in indexes])))
+            for indexes in groups.values()]
+
+RAW_BLOCK_SIZE = 256  # 按原始数据id分块解码和缓存
+BACKFILL_CHUNK_SIZE = 2000  # 补充计算特征值时每批的行数
+EXPORT_BATCH_SIZE = 4096  # 导出时每批的周期数
+# 查询周期数据时使用的列，与旧版本的cycle_data表结构保持一致
+CYCLE_COLUMNS = "id, timestamp, cycle_number, data"
+BLOCK_COLUMNS = "id, start_time, end_time, cycle_count, samples, codec, timestamps, cycle_numbers, data"
+# 查询原始数据时将二进制帧转换为十六进制字符串，与on_message中的格式一致
+RAW_COLUMNS = ("id, timestamp, broker, topic, "
+               "CASE WHEN typeof(raw_data) = 'blob' THEN lower(hex(raw_data)) ELSE raw_data END")
+# 不进入分析的帧（与on_message相同）：单次写入模式下只保存原始数据，不作为周期
+EXCLUDED_FRAME_FLAGS = FRAME_DAMAGED | FRAME_DUPLICATE
+
+def mv_to_codes(data):
+    """将mV值转换回ADC码值（解码时保留两位小数，四舍五入可精确还原）"""
+    codes = np.rint(np.asarray(data, dtype=np.float64) / ADC_SCALE)
+    return np.clip(codes, 0, 65535).astype(np.uint16)
+
+def codes_to_mv(codes):
+    """将ADC码值转换为mV值，与on_message的解码结果一致"""
+    return np.round(codes * ADC_SCALE, 2)
+
+def encode_cycle_block(codes, codec):
+    """压缩一个数据块
+    
+    codes为形状(周期数, 采样点数)的uint16码值。先把低字节和高字节分开排列（高字节变化很少），
+    再压缩。同时尝试差分编码（相邻周期同一相位的值相减，按uint16取模）：噪声底稳定、
+    脉冲稀疏时差分后更容易压缩，噪声较大时反而变差，因此每个数据块取两者中较小的一个。
+    
+    Returns:
+        (编码方式, 压缩数据)，编码方式为"zlib"、"zlib+delta"等
+    """
+    codes = np.ascontiguousarray(codes, dtype="<u2")
+    delta = codes.copy()
+    delta[1:] -= codes[:-1]
+    compress = CYCLE_CODECS[codec][0]
+    plain_blob = compress(codes.view(np.uint8).reshape(-1, 2).T.tobytes())
+    delta_blob = compress(delta.view(np.uint8).reshape(-1, 2).T.tobytes())
+    if len(delta_blob) < len(plain_blob):
+        return codec + "+delta", delta_blob
+    return codec, plain_blob
+
+def decode_cycle_block(blob, encoding, count, samples):
+    """解压数据块，返回形状(count, samples)的uint16码值（全部为数组运算）"""
+    codec, _, transform = encoding.partition("+")
+    shuffled = np.frombuffer(CYCLE_CODECS[codec][1](blob), dtype=np.uint8).reshape(2, -1)
+    codes = np.ascontiguousarray(shuffled.T).view("<u2").reshape(count, samples)
+    if transform == "delta":
+        return np.cumsum(codes, axis=0, dtype=np.uint16)
+    return codes
+
+def align_cycles(values, shifts):
+    """按每个周期的移动采样点数循环移动（每行与np.roll(row, shift)相同），shifts中的None为不移动"""
+    shifts = np.array([shift or 0 for shift in shifts], dtype=np.int64)
+    if not shifts.any():
+        return values
+    samples = values.shape[1]
+    index = (np.arange(samples) - shifts[:, None]) % samples
+    return values[np.arange(len(values))[:, None], index]
+
+def derived_condition(conn):
+    """单次写入模式下可以解码为周期的原始数据行的查询条件
+    
+    以二进制保存的完整帧，且写入时计算了周期特征（长度错误的帧、损坏帧和重复帧只保存原始数据）；
+    同时排除旧版本写入的带损坏或重复帧标志的周期特征。
+    """
+    flags = (f" AND NOT COALESCE(f.frame_flags, 0) & {EXCLUDED_FRAME_FLAGS}"
+             if "frame_flags" in table_columns(conn, "cycle_summary") else "")
+    return (f"typeof(raw_data.raw_data) = 'blob' AND length(raw_data.raw_data) = {FRAME_BYTES} AND EXISTS "
+            f"(SELECT 1 FROM cycle_summary f WHERE f.raw_id = raw_data.id{flags})")
+
+def summary_shift_column(conn):
+    """查询cycle_summary(别名s)中相位对齐移动采样点数的列，旧版本的数据库没有该列时为NULL"""
+    return "s.phase_shift" if "phase_shift" in table_columns(conn, "cycle_summary") else "NULL"
+
+def decode_frames(payloads):
+    """解码线上格式的帧（大端uint16，4个帧头字 + 采样点 + 1个帧尾字），返回每帧的mV数组列表
+    
+    与on_message的解码结果一致；长度相同的帧一次完成解码，奇数长度的帧忽略最后一个字节。
+    """
+    if not payloads:
+        return []
+    payloads = [payload[:len(payload) - len(payload) % 2] for payload in payloads]
+    lengths = {len(payload) for payload in payloads}
+    if len(lengths) == 1:
+        words = np.frombuffer(b"".join(payloads), dtype=">u2").reshape(len(payloads), -1)
+        return list(codes_to_mv(words[:, 4:-1]))
+    return [codes_to_mv(np.frombuffer(payload, dtype=">u2")[4:-1]) for payload in payloads]
+
+class DecodedBlockCache:
+    """解码后的原始数据块的LRU缓存（单次写入模式）
+    
+    查询线程读取和写入，写入线程在插入新的原始帧后使对应的块失效，因此需要加锁。
+    """
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self.blocks = OrderedDict()  # 块编号 -> {原始数据id: 周期行}
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+    
+    def get(self, block):
+        with self.lock:
+            rows = self.blocks.get(block)
+            if rows is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.blocks.move_to_end(block)
+            return rows
+    
+    def put(self, block, rows):
+        with self.lock:
+            self.blocks[block] = rows
+            self.blocks.move_to_end(block)
+            while len(self.blocks) > self.capacity:
+                self.blocks.popitem(last=False)
+    
+    def discard(self, block):
+        with self.lock:
+            self.blocks.pop(block, None)
+
+def decode_derived_rows(rows):
+    """解码(..., 原始帧, 相位对齐移动的采样点数)行中的帧，按保存时的相位对齐，返回mV数组列表"""
+    if not rows:
+        return []
+    return list(align_cycles(np.array(decode_frames([bytes(row[-2]) for row in rows])), [row[-1] for row in rows]))
+
+def decode_raw_block(conn, block):
+    """解码一个原始数据块中以二进制保存的帧（按保存时的相位对齐），返回{原始数据id: 周期行}"""
+    rows = conn.execute(
+        f"SELECT raw_data.id, raw_data.timestamp, raw_data, {summary_shift_column(conn)} FROM raw_data "
+        "LEFT JOIN cycle_summary s ON s.raw_id = raw_data.id "
+        f"WHERE raw_data.id BETWEEN ? AND ? AND {derived_condition(conn)}",
+        (block * RAW_BLOCK_SIZE, (block + 1) * RAW_BLOCK_SIZE - 1)
+    ).fetchall()
+    values = decode_derived_rows(rows)
+    return {row[0]: (f"R{row[0]}", row[1], row[0], ','.join(map(str, cycle.tolist())))
+            for row, cycle in zip(rows, values)}
+
+def derived_cycle_rows(conn, raw_ids, cache=None):
+    """获取由原始帧解码得到的周期行（按raw_ids的顺序），同一数据块只解码一次"""
+    decoded = {}
+    for block in sorted({raw_id // RAW_BLOCK_SIZE for raw_id in raw_ids}):
+        rows = cache.get(block) if cache is not None else None
+        if rows is None:
+            rows = decode_raw_block(conn, block)
+            if cache is not None:
+                cache.put(block, rows)
+        decoded.update(rows)
+    return [decoded[raw_id] for raw_id in raw_ids if raw_id in decoded]
+
+def decode_block(block, topics=None):
+    """解码cycle_blocks表中的一行
+    
+    Args:
+        block: 按BLOCK_COLUMNS顺序的一行
+        topics: 压缩的主题列表（旧版本的数据块没有该列）
+    Returns:
+        (时间戳列表, 周期编号列表, 形状(周期数, 采样点数)的mV数组, 主题列表)
+    """
+    _, _, _, count, samples, encoding, timestamps, cycle_numbers, data = block
+    values = codes_to_mv(decode_cycle_block(data, encoding, count, samples))
+    decompress = CYCLE_CODECS[encoding.partition("+")[0]][1]
+    timestamps = decompress(timestamps).decode("ascii").split("\n")
+    cycle_numbers = np.frombuffer(decompress(cycle_numbers), dtype="<i4").tolist()
+    topics = decompress(topics).decode("utf-8").split("\n") if topics else [""] * count
+    return timestamps, cycle_numbers, values, topics
+
+def decode_block_rows(block):
+    """将cycle_blocks表中的一行解码为与cycle_data表相同格式的行列表"""
+    timestamps, cycle_numbers, values, _ = decode_block(block)
+    return [(f"{block[0]}.{i}", timestamps[i], cycle_numbers[i], ','.join(map(str, row)))
+            for i, row in enumerate(values.tolist())]
+
+def read_cycle_rows_by_time(conn, start_time, end_time, cache=None):
+    """按时间范围读取周期数据，合并cycle_data表、压缩的cycle_blocks表和以二进制保存的原始帧"""
+    rows = conn.execute(
+        f"SELECT {CYCLE_COLUMNS} FROM cycle_data WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp",
+        (start_time, end_time)
+    ).fetchall()
+    blocks = conn.execute(
+        f"SELECT {BLOCK_COLUMNS} FROM cycle_blocks WHERE start_time <= ? AND end_time >= ? ORDER BY start_time",
+        (end_time, start_time)
+    ).fetchall()
+    for block in blocks:
+        rows.extend(row for row in decode_block_rows(block) if start_time <= row[1] <= end_time)
+    raw_ids = [row[0] for row in conn.execute(
+        f"SELECT id FROM raw_data WHERE timestamp BETWEEN ? AND ? AND {derived_condition(conn)}",
+        (start_time, end_time)
+    )]
+    rows.extend(derived_cycle_rows(conn, raw_ids, cache))
+    if blocks or raw_ids:
+        rows.sort(key=lambda row: row[1])
+    return rows
+
+def read_latest_cycle_rows(conn, limit, offset=0, cache=None):
+    """读取最新的周期数据（按时间倒序），合并cycle_data表、cycle_blocks表和以二进制保存的原始帧"""
+    needed = limit + offset
+    rows = conn.execute(
+        f"SELECT {CYCLE_COLUMNS} FROM cycle_data ORDER BY timestamp DESC LIMIT ?", (needed,)
+    ).fetchall()
+    decoded = 0
+    for block in conn.execute(f"SELECT {BLOCK_COLUMNS} FROM cycle_blocks ORDER BY end_time DESC"):
+        if decoded >= needed:
+            break
+        block_rows = decode_block_rows(block)
+        rows.extend(block_rows)
+        decoded += len(block_rows)
+    raw_ids = [row[0] for row in conn.execute(
+        f"SELECT id FROM raw_data WHERE {derived_condition(conn)} ORDER BY timestamp DESC LIMIT ?", (needed,)
+    )]
+    rows.extend(derived_cycle_rows(conn, raw_ids, cache))
+    if decoded or raw_ids:
+        rows.sort(key=lambda row: row[1], reverse=True)
+    return rows[offset:needed]
+
+def find_cycle_rows(conn, min_peak=None, min_pulses=None, start_time=None, end_time=None, limit=1000,
+                    cache=None):
+    """按特征值筛选周期数据（使用cycle_summary表的索引，只解码命中的周期）
+    
+    Returns:
+        按时间排序的行: (id, 时间戳, 周期编号, 数据, 峰值, 均值, RMS, 脉冲数, 峰值相位, 帧序号, 帧标志)
+        旧版本的数据库和没有帧信息的周期帧序号和帧标志为None
+    """
+    conditions, params = [], []
+    if min_peak is not None:
+        conditions.append("peak >= ?")
+        params.append(min_peak)
+    if min_pulses is not None:
+        conditions.append("pulse_count >= ?")
+        params.append(min_pulses)
+    if start_time is not None and end_time is not None:
+        conditions.append("timestamp BETWEEN ? AND ?")
+        params.extend([start_time, end_time])
+    if "frame_flags" in table_columns(conn, "cycle_summary"):
+        frame_columns = "sequence, frame_flags"
+        conditions.append(f"NOT COALESCE(frame_flags, 0) & {EXCLUDED_FRAME_FLAGS}")
+    else:
+        frame_columns = "NULL, NULL"
+    sql = ("SELECT cycle_id, block_id, block_index, raw_id, " + ", ".join(SUMMARY_COLUMNS)
+           + f", {frame_columns} FROM cycle_summary")
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY timestamp LIMIT ?"
+    matches = conn.execute(sql, params + [limit]).fetchall()
+    
+    # 分别读取未压缩的周期和命中的数据块（每个数据块只解码一次）
+    cycle_ids = sorted({m[0] for m in matches if m[0] is not None})
+    block_ids = sorted({m[1] for m in matches if m[1] is not None})
+    cycles, blocks = {}, {}
+    for i in range(0, len(cycle_ids), 500):
+        chunk = cycle_ids[i:i + 500]
+        for row in conn.execute(
+            f"SELECT {CYCLE_COLUMNS} FROM cycle_data WHERE id IN ({','.join('?' * len(chunk))})", chunk
+        ):
+            cycles[row[0]] = row
+    for block_id in block_ids:
+        block = conn.execute(f"SELECT {BLOCK_COLUMNS} FROM cycle_blocks WHERE id = ?", (block_id,)).fetchone()
+        if block is not None:
+            blocks[block_id] = decode_block_rows(block)
+    raw_ids = [m[3] for m in matches if m[3] is not None]
+    derived = {row[2]: row for row in derived_cycle_rows(conn, raw_ids, cache)}
+    
+    rows = []
+    for cycle_id, block_id, block_index, raw_id, *features in matches:
+        if cycle_id is not None:
+            row = cycles.get(cycle_id)
+        elif raw_id is not None:
+            row = derived.get(raw_id)
+        else:
+            block_rows = blocks.get(block_id)
+            row = block_rows[block_index] if block_rows else None
+        if row is not None:
+            rows.append(tuple(row) + tuple(features))
+    return rows
+
+TRIGGER_EVENT_COLUMNS = ("id, topic, trigger_time, start_time, end_time, reason, "
+                         "pre_cycles, post_cycles, cycle_count, peak")
+
+def read_trigger_events(conn, limit=100, start_time=None, end_time=None):
+    """读取触发事件（按触发时间倒序），旧版本的数据库没有trigger_events表时返回空列表"""
+    if not table_columns(conn, "trigger_events"):
+        return []
+    sql = f"SELECT {TRIGGER_EVENT_COLUMNS} FROM trigger_events"
+    params = []
+    if start_time is not None and end_time is not None:
+        sql += " WHERE trigger_time BETWEEN ? AND ?"
+        params = [start_time, end_time]
+    return conn.execute(sql + " ORDER BY trigger_time DESC LIMIT ?", params + [limit]).fetchall()
+
+ALARM_EVENT_COLUMNS = "id, topic, event_time, rule, kind, state, value, message"
+
+def read_alarm_events(conn, limit=100, start_time=None, end_time=None):
+    """读取报警事件（按时间倒序），旧版本的数据库没有alarm_events表时返回空列表"""
+    if not table_columns(conn, "alarm_events"):
+        return []
+    sql = f"SELECT {ALARM_EVENT_COLUMNS} FROM alarm_events"
+    params = []
+    if start_time is not None and end_time is not None:
+        sql += " WHERE event_time BETWEEN ? AND ?"
+        params = [start_time, end_time]
+    return conn.execute(sql + " ORDER BY event_time DESC, id DESC LIMIT ?", params + [limit]).fetchall()
+
+TREND_SELECT = "start_time, cycles, peak_max, peak_mean, peak_p95, pulse_count, classes"
+
+def read_trend_rows(conn, level, topic, start_time, end_time):
+    """读取一个传感器的趋势数据（按时间顺序），start_time/end_time为Unix时间；没有trend_data表时返回空列表"""
+    if not table_columns(conn, "trend_data"):
+        return []
+    return conn.execute(
+        f"SELECT {TREND_SELECT} FROM trend_data WHERE level = ? AND topic = ? AND start_time BETWEEN ? AND ? "
+        "ORDER BY start_time", (level, topic, int(start_time), int(end_time))
+    ).fetchall()
+
+def read_trend_topics(conn):
+    """有趋势数据的传感器（主题）列表"""
+    if not table_columns(conn, "trend_data"):
+        return []
+    return [row[0] for row in conn.execute(
+        "SELECT DISTINCT topic FROM trend_data WHERE level = 3600 ORDER BY topic")]
+
+def connect_readonly(db_path, check_same_thread=True):
+    """以只读方式打开数据库文件（WAL模式下读取不会阻塞写入）"""
+    uri = "file:" + pathname2url(os.path.abspath(db_path)) + "?mode=ro"
+    return sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+
+def iter_raw_rows(db_path, start_time=None, end_time=None, chunk_size=500):
+    """使用独立连接按时间顺序分块读取数据库文件中的原始数据"""
+    sql = "SELECT timestamp, topic, raw_data FROM raw_data"
+    params = []
+    if start_time is not None and end_time is not None:
+        sql += " WHERE timestamp BETWEEN ? AND ?"
+        params = [start_time, end_time]
+    sql += " ORDER BY timestamp"
+    
+    conn = None
+    try:
+        conn = connect_readonly(db_path)
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            for row in rows:
+                yield row
+    except sqlite3.Error as e:
+        print(f"读取原始数据错误: {str(e)}")
+    finally:
+        if conn is not None:
+            conn.close()
+
+def parse_cycle_texts(texts):
+    """将逗号分隔的周期数据字符串批量转换为mV数组列表（一次完成文本解析）"""
+    counts = [text.count(',') + 1 for text in texts]
+    flat = np.fromstring(','.join(texts), dtype=np.float64, sep=',')
+    if len(set(counts)) == 1:
+        return list(flat.reshape(len(texts), -1))
+    return np.split(flat, np.cumsum(counts)[:-1])
+
+def table_columns(conn, table):
+    return {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}
+
+def topic_condition(column, topics):
+    """生成按主题筛选的SQL条件，topics为空时不筛选"""
+    if not topics:
+        return "", []
+    return f" AND {column} IN ({','.join('?' * len(topics))})", list(topics)
+
+def iter_plain_cycles(conn, start_time, end_time, topics, chunk_size):
+    """按时间顺序读取cycle_data表中的周期: (时间戳, 主题, 周期编号, mV数组)"""
+    if "topic" not in table_columns(conn, "cycle_data"):
+        if topics:
+            return  # 旧版本的数据库不记录主题
+        topic_column = "''"
+    else:
+        topic_column = "topic"
+    condition, params = topic_condition("topic", topics)
+    cursor = conn.execute(
+        f"SELECT timestamp, {topic_column}, cycle_number, data FROM cycle_data "
+        f"WHERE timestamp BETWEEN ? AND ?{condition} ORDER BY timestamp",
+        [start_time, end_time] + params
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row, values in zip(rows, parse_cycle_texts([str(row[3]) for row in rows])):
+            yield row[0], row[1] or "", row[2], values
+
+def iter_block_cycles(conn, start_time, end_time, topics):
+    """按时间顺序读取压缩数据块中的周期，每次只解码一个数据块"""
+    topic_column = "topics" if "topics" in table_columns(conn, "cycle_blocks") else "NULL"
+    wanted = set(topics) if topics else None
+    cursor = conn.execute(
+        f"SELECT {BLOCK_COLUMNS}, {topic_column} FROM cycle_blocks "
+        "WHERE start_time <= ? AND end_time >= ? ORDER BY start_time",
+        (end_time, start_time)
+    )
+    for block in cursor:
+        timestamps, cycle_numbers, values, block_topics = decode_block(block[:9], block[9])
+        for i, timestamp in enumerate(timestamps):
+            if start_time <= timestamp <= end_time and (wanted is None or block_topics[i] in wanted):
+                yield timestamp, block_topics[i], cycle_numbers[i], values[i]
+
+def iter_derived_cycles(conn, start_time, end_time, topics, chunk_size):
+    """按时间顺序读取以二进制保存的原始帧并解码（周期编号为原始数据id，按保存时的相位对齐）"""
+    condition, params = topic_condition("raw_data.topic", topics)
+    cursor = conn.execute(
+        "SELECT raw_data.id, raw_data.timestamp, raw_data.topic, raw_data, "
+        f"{summary_shift_column(conn)} FROM raw_data LEFT JOIN cycle_summary s ON s.raw_id = raw_data.id "
+        f"WHERE raw_data.timestamp BETWEEN ? AND ? AND {derived_condition(conn)}{condition} "
+        "ORDER BY raw_data.timestamp",
+        [start_time, end_time] + params
+    )
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        for row, values in zip(rows, decode_derived_rows(rows)):
+            yield row[1], row[2], row[0], values
+
+def iter_cycle_records(db_path, start_time, end_time, topics=None, chunk_size=1024):
+    """使用独立连接按时间顺序读取数据库文件中的周期数据（生成器）
+    
+    合并cycle_data表、cycle_blocks表和以二进制保存的原始帧，三者都按时间顺序流式读取，
+    内存中只保留每种来源的一个分块。读取或解码错误（包括损坏的压缩数据块）直接抛出，
+    导出不会在出错时正常结束而得到不完整的文件。
+    
+    Yields:
+        (时间戳, 主题, 周期编号, mV数组) 元组
+    """
+    conn = None
+    try:
+        conn = connect_readonly(db_path)
+        yield from heapq.merge(
+            iter_plain_cycles(conn, start_time, end_time, topics, chunk_size),
+            iter_block_cycles(conn, start_time, end_time, topics),
+            iter_derived_cycles(conn, start_time, end_time, topics, chunk_size),
+            key=lambda record: record[0],
+        )
+    finally:
+        if conn is not None:
+            conn.close()
+
+def make_cycle_batch(timestamps, topics, cycle_numbers, values):
+    """导出用的周期数据批次，values为形状(周期数, 采样点数)的mV数组"""
+    return {
+        "timestamps": timestamps,
+        "topics": topics,
+        "cycle_numbers": np.asarray(cycle_numbers, dtype=np.int64),
+        "values": values,
+    }
+
+def batch_cycle_records(records, batch_size=EXPORT_BATCH_SIZE):
+    """将周期记录组合为批次（生成器），每批最多batch_size个周期且采样点数相同"""
+    batch = []
+    for record in records:
+        if batch and (len(batch) >= batch_size or len(record[3]) != len(batch[0][3])):
+            yield make_cycle_batch([r[0] for r in batch], [r[1] for r in batch],
+                                   [r[2] for r in batch], np.stack([r[3] for r in batch]))
+            batch = []
+        batch.append(record)
+    if batch:
+        yield make_cycle_batch([r[0] for r in batch], [r[1] for r in batch],
+                               [r[2] for r in batch], np.stack([r[3] for r in batch]))
+
+class DatabaseWriter(threading.Thread):
+    """数据库写入线程，独占唯一的写连接
+    
+    写操作以函数func(conn)的形式排队，写入线程每次取出队列中所有等待的操作依次执行，
+    然后只提交一次（组提交），调用线程不等待磁盘同步。func返回写入的表名，用于统计指标。
+    每个写操作在一个保存点中执行，出错时只回滚该操作的写入，同一批的其他操作照常提交。
+    需要等待完成的操作附带一个事件，在提交之后设置。
+    """
+    MAX_BATCH = 512  # 每次提交最多包含的写操作数
+    CALL_POLL_SECONDS = 0.5  # call等待时检查写入线程是否仍在运行的间隔
+    
+    def __init__(self, db_path):
+        super().__init__(name="db-writer", daemon=True)
+        self.db_path = db_path
+        self.requests = queue.Queue()  # (func, 完成事件或None)，func为None表示停止
+        self.ready = threading.Event()
+        self.error = None  # 打开写连接失败时的异常
+        self.write_count = 0  # 已执行的写操作数，用于判断写入是否繁忙
+    
+    def run(self):
+        try:
+            conn = sqlite3.connect(self.db_path)
+            # 新建的数据库启用增量清理，删除数据后可以分步回收空闲页（对已有数据库不生效）
+            conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+            # WAL模式下读连接与写连接互不阻塞；synchronous=NORMAL在WAL模式下不会损坏数据库
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            # 检查点之后把-wal文件截断到该大小以内，避免长期占用磁盘
+            conn.execute("PRAGMA journal_size_limit=67108864")
+        except sqlite3.Error as e:
+            self.error = e
+            self.ready.set()
+            return
+        self.ready.set()
+        
+        running = True
+        while running:
+            batch = [self.requests.get()]
+            while len(batch) < self.MAX_BATCH:
+                try:
+                    batch.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            tables = set()
+            for func, _ in batch:
+                if func is None:
+                    running = False
+                    continue
+                try:
+                    table = self.execute(conn, func)
+                    if table:
+                        tables.add(table)
+                except Exception as e:
+                    print(f"数据库写入错误: {str(e)}")
+            self.write_count += len(batch)
+            try:
+                conn.commit()
+                for table in tables:
+                    metrics.inc("gis_pd_db_commits_total", {"table": table})
+            except sqlite3.Error as e:
+                print(f"数据库提交错误: {str(e)}")
+            for _, done in batch:
+                if done is not None:
+                    done.set()
+        conn.close()
+    
+    def execute(self, conn, func):
+        """在保存点中执行一个写操作，出错时回滚该操作的写入并抛出异常
+        
+        保存点嵌套在整批的事务中，释放保存点不会提交；func自行提交（例如检查点）后保存点已不存在。
+        """
+        if not conn.in_transaction:
+            conn.execute("BEGIN")
+        conn.execute("SAVEPOINT write_op")
+        try:
+            result = func(conn)
+        except BaseException:
+            if conn.in_transaction:
+                try:
+                    conn.execute("ROLLBACK TO SAVEPOINT write_op")
+                    conn.execute("RELEASE SAVEPOINT write_op")
+                except sqlite3.Error:
+                    pass  # func已自行提交，保存点不存在
+            raise
+        if conn.in_transaction:
+            try:
+                conn.execute("RELEASE SAVEPOINT write_op")
+            except sqlite3.Error:
+                pass  # func自行提交后开始了新的事务
+        return result
+    
+    def submit(self, func):
+        """提交写操作，立即返回"""
+        self.requests.put((func, None))
+    
+    def call(self, func):
+        """提交写操作并等待其执行和提交，返回func的返回值
+        
+        func中的异常（其写入已回滚）在调用线程中重新抛出；写入线程已停止时抛出sqlite3.OperationalError。
+        """
+        if not self.is_alive():
+            raise sqlite3.OperationalError("数据库写入线程已停止")
+        result = {}
+        done = threading.Event()
+        
+        def wrapper(conn):
+            try:
+                result["value"] = func(conn)
+            except Exception as e:
+                result["error"] = e
+                raise
+        
+        self.requests.put((wrapper, done))
+        while not done.wait(self.CALL_POLL_SECONDS):
+            if not self.is_alive() and not done.is_set():
+                raise sqlite3.OperationalError("数据库写入线程已停止")
+        if "error" in result:
+            raise result["error"]
+        return result.get("value")
+    
+    def sync(self):
+        """等待之前提交的写操作全部执行并提交（队列按顺序执行）"""
+        if self.is_alive():
+            self.call(lambda conn: None)
+    
+    def pending_count(self):
+        return self.requests.qsize()
+    
+    def stop(self):
+        """执行完队列中剩余的写操作后关闭写连接"""
+        if self.is_alive():
+            self.requests.put((None, None))
+            self.join()
+
+class ReadConnectionPool:
+    """只读连接池
+    
+    查询从池中借用一个只读连接，用完归还；连接按需创建，最多size个。
+    同一时刻一个连接只被一个线程使用，因此可以在界面线程、导出线程等任意线程中查询。
+    """
+    def __init__(self, db_path, size=4):
+        self.db_path = db_path
+        self.size = size
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+    
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self.lock:
+                if self.created < self.size:
+                    self.created += 1
+                    create = True
+                else:
+                    create = False
+            if create:
+                try:
+                    conn = connect_readonly(self.db_path, check_same_thread=False)
+                except sqlite3.Error:
+                    with self.lock:
+                        self.created -= 1
+                    raise
+            else:
+                conn = self.idle.get()  # 所有连接都在使用中，等待归还
+        try:
+            yield conn
+        finally:
+            self.idle.put(conn)
+    
+    def close(self):
+        while True:
+            try:
+                self.idle.get_nowait().close()
+            except queue.Empty:
+                break
+        self.created = 0
+
+class DatabaseManager:
+    """数据库管理类，负责数据库的连接、创建表和数据存储
+    
+    写入由DatabaseWriter线程独占一个写连接执行，保存数据的方法只把写操作放入队列后立即返回；
+    查询使用ReadConnectionPool中的只读连接（WAL模式），较长的历史查询不会阻塞实时写入。
+    查询前会等待已提交的写操作完成，保证能读到之前保存的数据。
+    
+    codec为"zlib"或"lzma"时，周期数据先在内存中缓存，每block_size个周期（或缓存超过
+    block_seconds秒）压缩为cycle_blocks表中的一行；读取时透明解压，与cycle_data表合并。
+    
+    derive_cycles为True时为单次写入模式：原始帧以二进制保存，不再单独写入周期数据，
+    查询周期数据时从原始帧解码，解码结果按数据块保存在LRU缓存中。
+    
+    maintenance为True时启动DatabaseMaintenance，在写入空闲时执行检查点、ANALYZE等维护任务。
+    """
+    def __init__(self, db_name="gis_pd_data.db", codec=None, block_size=256, block_seconds=10.0,
+                 derive_cycles=False, read_connections=4, maintenance=True):
+        """初始化数据库连接"""
+        # 数据库文件保存在应用程序目录下（db_name为绝对路径时直接使用）
+        self.db_path = os.path.join(get_application_path(), db_name)
+        print(f"数据库路径: {self.db_path}")
+        
+        if codec is not None and codec not in CYCLE_CODECS:
+            raise ValueError(f"不支持的压缩方式: {codec}")
+        self.codec = codec
+        self.block_size = block_size
+        self.block_seconds = block_seconds
+        self.pending = []  # 等待压缩的周期: (时间戳, 周期编号, 码值数组, 主题)，只在调用线程中访问
+        self.pending_since = 0.0
+        self.derive_cycles = derive_cycles
+        self.decoded_cache = DecodedBlockCache()
+        # 周期数据和原始数据的总数：打开数据库时统计一次，之后由写入线程累加（状态栏每秒读取，不查询数据库）
+        self.cycle_count = 0
+        self.raw_count = 0
+        
+        self.writer = DatabaseWriter(self.db_path)
+        self.readers = ReadConnectionPool(self.db_path, read_connections)
+        self.maintenance = None
+        self.connected = False
+        
+        self.writer.start()
+        self.writer.ready.wait()
+        if self.writer.error is not None:
+            print(f"数据库连接错误: {str(self.writer.error)}")
+            return
+        
+        # 在写入线程中创建数据表
+        self.connected = True
+        if self.writer.call(self.create_tables):
+            print(f"数据库连接成功: {self.db_path}")
+        try:
+            self.cycle_count, self.raw_count = self.writer.call(self.count_rows)
+        except sqlite3.Error as e:
+            print(f"统计数据总数错误: {str(e)}")
+        if maintenance:
+            self.maintenance = DatabaseMaintenance(self.writer, self.db_path)
+            self.maintenance.start()
+    
+    def count_rows(self, conn):
+        """统计周期数据和原始数据的总数（在写入线程中执行，打开数据库时执行一次）
+        
+        由原始帧解码的周期只在单次写入模式下统计，周期特征表较大时COUNT需要扫描整个表。
+        """
+        sql = "SELECT (SELECT COUNT(*) FROM cycle_data) + (SELECT COALESCE(SUM(cycle_count), 0) FROM cycle_blocks)"
+        if self.derive_cycles:
+            sql += (" + (SELECT COUNT(raw_id) FROM cycle_summary "
+                    f"WHERE NOT COALESCE(frame_flags, 0) & {EXCLUDED_FRAME_FLAGS})")
+        return conn.execute(sql).fetchone()[0], conn.execute("SELECT COUNT(*) FROM raw_data").fetchone()[0]
+    
+    def create_tables(self, conn):
+        """创建必要的数据表（在写入线程中执行）"""
+        try:
+            # 创建周期数据表
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cycle_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    cycle_number INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    topic TEXT
+                )
+            ''')
+            
+            # 创建原始数据表
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS raw_data (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    broker TEXT NOT NULL,
+                    topic TEXT NOT NULL,
+                    raw_data BLOB NOT NULL
+                )
+            ''')
+            
+            # 创建压缩周期数据块表，每行保存连续的多个周期
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cycle_blocks (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    cycle_count INTEGER NOT NULL,
+                    samples INTEGER NOT NULL,
+                    codec TEXT NOT NULL,
+                    timestamps BLOB NOT NULL,
+                    cycle_numbers BLOB NOT NULL,
+                    data BLOB NOT NULL,
+                    topics BLOB
+                )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cycle_blocks_time ON cycle_blocks (start_time, end_time)"
+            )
+            
+            # 创建周期特征表，每个周期一行，指向cycle_data中的行或cycle_blocks中的数据块
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS cycle_summary (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    timestamp TEXT NOT NULL,
+                    cycle_id INTEGER,
+                    block_id INTEGER,
+                    block_index INTEGER,
+                    raw_id INTEGER,
+                    peak REAL NOT NULL,
+                    mean REAL NOT NULL,
+                    rms REAL NOT NULL,
+                    pulse_count INTEGER NOT NULL,
+                    peak_phase REAL NOT NULL,
+                    sequence INTEGER,
+                    frame_flags INTEGER,
+                    phase_shift INTEGER
+                )
+            ''')
+            # 补充计算特征值的进度（旧版本创建的数据库），补充完成后删除该行
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS summary_backfill (
+                    next_id INTEGER NOT NULL,
+                    end_id INTEGER NOT NULL
+                )
+            ''')
+            # 创建触发事件表，每个事件的周期保存在cycle_blocks中的一个数据块
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trigger_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    trigger_time TEXT NOT NULL,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    reason TEXT NOT NULL,
+                    pre_cycles INTEGER NOT NULL,
+                    post_cycles INTEGER NOT NULL,
+                    cycle_count INTEGER NOT NULL,
+                    peak REAL NOT NULL,
+                    block_id INTEGER
+                )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_trigger_events_time ON trigger_events (trigger_time)"
+            )
+            # 创建报警事件表
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS alarm_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    topic TEXT NOT NULL,
+                    event_time TEXT NOT NULL,
+                    rule TEXT NOT NULL,
+                    kind TEXT NOT NULL,
+                    state TEXT NOT NULL,
+                    value REAL,
+                    message TEXT
+                )
+            ''')
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_alarm_events_time ON alarm_events (event_time)"
+            )
+            # 创建趋势数据表（level为聚合周期秒数，按主键顺序聚簇存储，按传感器和时间范围读取只扫描连续的页）
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS trend_data (
+                    level INTEGER NOT NULL,
+                    topic TEXT NOT NULL,
+                    start_time INTEGER NOT NULL,
+                    cycles INTEGER NOT NULL,
+                    peak_max REAL,
+                    peak_mean REAL,
+                    peak_p95 REAL,
+                    pulse_count INTEGER,
+                    classes TEXT,
+                    PRIMARY KEY (level, topic, start_time)
+                ) WITHOUT ROWID
+            ''')
+            
+            # 旧版本创建的数据库补充新增的列
+            for table, column, column_type in (("cycle_summary", "raw_id", "INTEGER"),
+                                               ("cycle_summary", "sequence", "INTEGER"),
+                                               ("cycle_summary", "frame_flags", "INTEGER"),
+                                               ("cycle_summary", "phase_shift", "INTEGER"),
+                                               ("cycle_data", "topic", "TEXT"),
+                                               ("cycle_blocks", "topics", "BLOB")):
+                if column not in table_columns(conn, table):
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            for column in ("timestamp", "peak", "pulse_count", "raw_id"):
+                conn.execute(
+                    f"CREATE INDEX IF NOT EXISTS idx_cycle_summary_{column} ON cycle_summary ({column})"
+                )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_raw_data_timestamp ON raw_data (timestamp)")
+            
+            conn.commit()
+            self.start_summary_backfill(conn)
+            return True
+        except sqlite3.Error as e:
+            print(f"创建数据表错误: {str(e)}")
+            return False
+    
+    @perf_monitor.timed("db.save_cycle_data")
+    def save_cycle_data(self, cycle_number, data, timestamp=None, topic=None, frame=None):
+        """保存周期数据，topic为数据来源的MQTT主题（用于按传感器导出）
+        
+        frame为(帧序号, 帧标志)，与周期特征一起保存在cycle_summary中。
+        写操作在写入线程中执行，返回True表示已加入写入队列。
+        """
+        if not self.connected:
+            return
+            
+        if self.derive_cycles:
+            return True  # 周期数据由原始帧解码得到，不重复保存
+        if timestamp is None:
+            timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+        if self.codec is not None:
+            return self.add_to_block(timestamp, cycle_number, data, topic, frame)
+        
+        def write(conn):
+            # 将数据列表转换为字符串存储
+            data_str = ','.join(map(str, data))
+            cursor = conn.execute(
+                "INSERT INTO cycle_data (timestamp, cycle_number, data, topic) VALUES (?, ?, ?, ?)",
+                (timestamp, cycle_number, data_str, topic)
+            )
+            self.insert_summaries(conn, compute_cycle_features(data),
+                                  [(timestamp, cursor.lastrowid, None, None, None)], [frame])
+            self.cycle_count += 1
+            metrics.inc("gis_pd_db_rows_written_total", {"table": "cycle_data"})
+            return "cycle_data"
+        
+        self.writer.submit(write)
+        return True
+    
+    def add_to_block(self, timestamp, cycle_number, data, topic=None, frame=None):
+        """将周期加入待压缩缓存，缓存满或超时后压缩写入"""
+        codes = mv_to_codes(data)
+        if self.pending and len(codes) != len(self.pending[0][2]):
+            self.flush_block()  # 同一数据块中的周期长度必须相同
+        if not self.pending:
+            self.pending_since = time.time()
+        self.pending.append((timestamp, cycle_number, codes, topic or "", frame))
+        if len(self.pending) >= self.block_size or time.time() - self.pending_since >= self.block_seconds:
+            return self.flush_block()
+        return True
+    
+    @perf_monitor.timed("db.flush_block")
+    def flush_block(self):
+        """将缓存的周期交给写入线程，压缩为一个数据块写入数据库"""
+        if not self.pending or not self.connected:
+            return True
+        pending, self.pending = self.pending, []
+        codec = self.codec
+        
+        def write(conn):
+            self.insert_cycle_block(conn, pending, codec)
+            return "cycle_blocks"
+        
+        self.writer.submit(write)
+        return True
+    
+    def flush_expired(self):
+        """缓存的周期超过block_seconds秒时写入（界面每秒调用，数据中断时缓存的周期不会一直留在内存中）"""
+        if self.pending and time.time() - self.pending_since >= self.block_seconds:
+            self.flush_block()
+    
+    def insert_cycle_block(self, conn, cycles, codec):
+        """压缩写入一个数据块及其周期特征（在写入线程中执行），返回数据块id
+        
+        Args:
+            cycles: [(时间戳, 周期编号, 码值数组, 主题[, (帧序号, 帧标志)])]，码值数组长度相同
+        """
+        compress = CYCLE_CODECS[codec][0]
+        timestamps = [item[0] for item in cycles]
+        codes = np.stack([item[2] for item in cycles])
+        encoding, data = encode_cycle_block(codes, codec)
+        cursor = conn.execute(
+            "INSERT INTO cycle_blocks (start_time, end_time, cycle_count, samples, codec, "
+            "timestamps, cycle_numbers, data, topics) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (timestamps[0], timestamps[-1], len(cycles), codes.shape[1], encoding,
+             compress("\n".join(timestamps).encode("ascii")),
+             compress(np.array([item[1] for item in cycles], dtype="<i4").tobytes()), data,
+             compress("\n".join(item[3] for item in cycles).encode("utf-8")))
+        )
+        block_id = cursor.lastrowid
+        self.insert_summaries(conn, compute_cycle_features(codes_to_mv(codes)),
+                              [(timestamp, None, block_id, i, None) for i, timestamp in enumerate(timestamps)],
+                              [item[4] if len(item) > 4 else None for item in cycles])
+        self.cycle_count += len(cycles)
+        metrics.inc("gis_pd_db_rows_written_total", {"table": "cycle_blocks"})
+        return block_id
+    
+    @perf_monitor.timed("db.save_event")
+    def save_event(self, event, store_cycles=True):
+        """保存一个触发事件（gis_pd_trigger.TriggeredRecorder生成）
+        
+        事件的全部周期（触发前、事件期间和触发后）压缩为cycle_blocks中的一个数据块，
+        与普通周期数据一样可以按时间、按特征查询和导出；事件信息写入trigger_events表。
+        未设置压缩方式时使用zlib。单次写入模式下同样保存（触发记录模式不保存原始帧）。
+        store_cycles为False时只保存事件信息（周期由调用者保存，例如周期日志）。
+        """
+        if not self.connected:
+            return
+        codec = self.codec or "zlib"
+        cycles = [(timestamp, cycle_number, codes, event["topic"]) for timestamp, cycle_number, codes
+                  in zip(event["timestamps"], event["cycle_numbers"], mv_to_codes(event["values"]))]
+        
+        def write(conn):
+            block_id = self.insert_cycle_block(conn, cycles, codec) if store_cycles else None
+            conn.execute(
+                "INSERT INTO trigger_events (topic, trigger_time, start_time, end_time, reason, "
+                "pre_cycles, post_cycles, cycle_count, peak, block_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (event["topic"], event["trigger_time"], cycles[0][0], cycles[-1][0], event["reason"],
+                 event["pre_cycles"], event["post_cycles"], len(cycles), event["peak"], block_id)
+            )
+            metrics.inc("gis_pd_db_rows_written_total", {"table": "trigger_events"})
+            return "trigger_events"
+        
+        self.writer.submit(write)
+        return True
+    
+    def get_trigger_events(self, limit=100, start_time=None, end_time=None):
+        """获取触发事件（按触发时间倒序）: (id, 主题, 触发时间, 开始时间, 结束时间, 触发条件,
+        触发前周期数, 触发后周期数, 周期数, 峰值)"""
+        if not self.connected:
+            return []
+        try:
+            self.writer.sync()
+            with self.readers.connection() as conn:
+                return read_trigger_events(conn, limit, start_time, end_time)
+        except sqlite3.Error as e:
+            print(f"获取触发事件错误: {str(e)}")
+            return []
+    
+    def save_alarm_event(self, event):
+        """保存一个报警事件（gis_pd_alarms.AlarmEngine生成）"""
+        if not self.connected:
+            return
+        
+        def write(conn):
+            conn.execute(
+                "INSERT INTO alarm_events (topic, event_time, rule, kind, state, value, message) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (event["topic"], event["time"], event["rule"], event["kind"], event["state"],
+                 event["value"], event["message"])
+            )
+            metrics.inc("gis_pd_db_rows_written_total", {"table": "alarm_events"})
+            return "alarm_events"
+        
+        self.writer.submit(write)
+        return True
+    
+    def get_alarm_events(self, limit=100, start_time=None, end_time=None):
+        """获取报警事件（按时间倒序）: (id, 主题, 时间, 规则, 类型, 状态, 数值, 说明)"""
+        if not self.connected:
+            return []
+        try:
+            self.writer.sync()
+            with self.readers.connection() as conn:
+                return read_alarm_events(conn, limit, start_time, end_time)
+        except sqlite3.Error as e:
+            print(f"获取报警事件错误: {str(e)}")
+            return []
+    
+    def save_trend_rows(self, rows):
+        """保存趋势数据行（gis_pd_trend.TrendBucket.row），同一时间段已有数据时合并（重新启动程序时）
+        
+        合并时95%分位数取两者中的较大值，类别直方图保留已有的值。
+        """
+        if not self.connected or not rows:
+            return
+        
+        def write(conn):
+            conn.executemany(
+                "INSERT INTO trend_data (level, topic, start_time, cycles, peak_max, peak_mean, peak_p95, "
+                "pulse_count, classes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (level, topic, start_time) DO UPDATE SET "
+                "peak_mean = (IFNULL(peak_mean * cycles, 0) + IFNULL(excluded.peak_mean * excluded.cycles, 0)) "
+                "/ NULLIF(cycles + excluded.cycles, 0), "
+                "cycles = cycles + excluded.cycles, "
+                "peak_max = MAX(IFNULL(peak_max, 0), IFNULL(excluded.peak_max, 0)), "
+                "peak_p95 = MAX(IFNULL(peak_p95, 0), IFNULL(excluded.peak_p95, 0)), "
+                "pulse_count = pulse_count + excluded.pulse_count, "
+                "classes = CASE WHEN classes = '' THEN excluded.classes ELSE classes END",
+                rows
+            )
+            metrics.inc("gis_pd_db_rows_written_total", {"table": "trend_data"}, len(rows))
+            return "trend_data"
+        
+        self.writer.submit(write)
+        return True
+    
+    def prune_trend_rows(self, before):
+        """删除过期的趋势数据，before为{聚合周期秒数: Unix时间}，删除该级别开始时间早于该时间的行"""
+        if not self.connected:
+            return
+        
+        def write(conn):
+            for level, start_time in before.items():
+                conn.execute("DELETE FROM trend_data WHERE level = ? AND start_time < ?", (level, int(start_time)))
+            return "trend_data"
+        
+        self.writer.submit(write)
+        return True
+    
+    def get_trend_rows(self, level, topic, start_time, end_time):
+        """获取趋势数据: (开始时间, 周期数, 峰值最大值, 峰值平均值, 峰值95%分位数, 脉冲数, 类别直方图)"""
+        if not self.connected:
+            return []
+        try:
+            self.writer.sync()
+            with self.readers.connection() as conn:
+                return read_trend_rows(conn, level, topic, start_time, end_time)
+        except sqlite3.Error as e:
+            print(f"获取趋势数据错误: {str(e)}")
+            return []
+    
+    def get_trend_topics(self):
+        """获取有趋势数据的传感器列表"""
+        if not self.connected:
+            return []
+        try:
+            self.writer.sync()
+            with self.readers.connection() as conn:
+                return read_trend_topics(conn)
+        except sqlite3.Error as e:
+            print(f"获取趋势传感器列表错误: {str(e)}")
+            return []
+    
+    def sync(self):
+        """写入缓存的数据块并等待写入线程完成所有写操作（查询前调用）"""
+        self.flush_block()
+        self.writer.sync()
+    
+    def insert_summaries(self, conn, features, prefix_rows, frames=None, shifts=None):
+        """写入周期特征、帧信息和相位对齐移动的采样点数（在写入线程中执行，由写入线程提交事务）"""
+        conn.executemany(
+            "INSERT INTO cycle_summary (timestamp, cycle_id, block_id, block_index, raw_id, "
+            + ", ".join(SUMMARY_COLUMNS) + ", sequence, frame_flags, phase_shift) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            summary_rows(features, prefix_rows, frames, shifts)
+        )
+    
+    def start_summary_backfill(self, conn):
+        """检查没有特征值的cycle_data行（旧版本创建的数据库），在写入线程中分批补充计算
+        
+        打开数据库时只记录需要补充的id范围，补充计算作为普通写操作分批执行，实时数据的写入
+        可以插在两批之间，不需要等待补充完成。进度保存在summary_backfill表中，程序中途关闭时
+        下次打开继续（之后写入的周期已有特征值，不能再用MAX(cycle_id)判断）。
+        """
+        try:
+            if conn.execute("SELECT 1 FROM summary_backfill").fetchone() is None:
+                start_id = conn.execute("SELECT COALESCE(MAX(cycle_id), 0) FROM cycle_summary").fetchone()[0]
+                end_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM cycle_data").fetchone()[0]
+                if end_id <= start_id:
+                    return
+                conn.execute("INSERT INTO summary_backfill (next_id, end_id) VALUES (?, ?)", (start_id, end_id))
+                conn.commit()
+        except sqlite3.Error as e:
+            print(f"计算周期特征值错误: {str(e)}")
+            return
+        print("正在后台为周期数据补充计算特征值")
+        self.writer.submit(self.backfill_cycle_summary)
+    
+    def backfill_cycle_summary(self, conn, chunk_size=BACKFILL_CHUNK_SIZE):
+        """补充计算一批cycle_data行的特征值（在写入线程中执行），未完成时把下一批放入写入队列"""
+        try:
+            progress = conn.execute("SELECT next_id, end_id FROM summary_backfill").fetchone()
+            if progress is None:
+                return None
+            next_id, end_id = progress
+            rows = conn.execute(
+                "SELECT id, timestamp, data FROM cycle_data WHERE id > ? AND id <= ? ORDER BY id LIMIT ?",
+                (next_id, end_id, chunk_size)
+            ).fetchall()
+            for indexes, features in cycle_text_features([row[2] for row in rows]):
+                self.insert_summaries(conn, features, [(rows[i][1], rows[i][0], None, None, None) for i in indexes])
+            # 进度与这一批特征值在同一个事务中提交
+            if len(rows) < chunk_size or rows[-1][0] >= end_id:
+                conn.execute("DELETE FROM summary_backfill")
+                print("周期特征值补充计算完成")
+            else:
+                conn.execute("UPDATE summary_backfill SET next_id = ?", (rows[-1][0],))
+                self.writer.submit(self.backfill_cycle_summary)
+        except sqlite3.Error as e:
+            print(f"计算周期特征值错误: {str(e)}")
+            return None
+        return "cycle_summary"
+    
+    @perf_monitor.timed("db.find_cycles")
+    def find_cycles(self, min_peak=None, min_pulses=None, start_time=None, end_time=None, limit=1000):
+        """按特征值筛选周期数据，例如峰值超过min_peak或脉冲数不少于min_pulses的周期"""
+        if not self.connected:
+            return []
+        try:
+            self.sync()
+            with self.readers.connection() as conn:
+                return find_cycle_rows(conn, min_peak, min_pulses, start_time, end_time, limit,
+                                       self.decoded_cache)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"按特征筛选周期数据错误: {str(e)}")
+            return []
+    
+    @perf_monitor.timed("db.save_raw_data")
+    def save_raw_data(self, broker, topic, raw_data, timestamp=None, frame=None, shift=0):
+        """保存原始数据（在写入线程中执行，返回True表示已加入写入队列）
+        
+        单次写入模式下frame(帧序号, 帧标志)与由原始帧计算的周期特征一起保存，
+        shift为该帧相位对齐时循环移动的采样点数（见gis_pd_frame.PhaseAligner）。
+        """
+        if not self.connected:
+            return
+            
+        if timestamp is None:
+            timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+        if self.derive_cycles:
+            try:
+                payload = bytes.fromhex(raw_data) if isinstance(raw_data, str) else bytes(raw_data)
+            except ValueError as e:
+                print(f"保存原始数据错误: {str(e)}")
+                return False
+            
+            def write(conn):
+                # 单次写入模式：以二进制保存（大小为十六进制文本的一半），同时计算周期特征
+                cursor = conn.execute(
+                    "INSERT INTO raw_data (timestamp, broker, topic, raw_data) VALUES (?, ?, ?, ?)",
+                    (timestamp, broker, topic, payload)
+                )
+                raw_id = cursor.lastrowid
+                # 长度错误的帧不能解码为周期，损坏帧和重复帧不进入分析，只保存原始数据；
+                # 特征按相位对齐后的周期计算，并记录移动的采样点数，解码时按相同的移动对齐
+                if len(payload) == FRAME_BYTES and not (frame and frame[1] & EXCLUDED_FRAME_FLAGS):
+                    cycle = align_cycles(np.array(decode_frames([payload])), [shift])[0]
+                    self.insert_summaries(conn, compute_cycle_features(cycle),
+                                          [(timestamp, None, None, None, raw_id)], [frame], [shift])
+                    self.decoded_cache.discard(raw_id // RAW_BLOCK_SIZE)
+                    self.cycle_count += 1
+                self.raw_count += 1
+                metrics.inc("gis_pd_db_rows_written_total", {"table": "raw_data"})
+                return "raw_data"
+        else:
+            def write(conn):
+                conn.execute(
+                    "INSERT INTO raw_data (timestamp, broker, topic, raw_data) VALUES (?, ?, ?, ?)",
+                    (timestamp, broker, topic, raw_data)
+                )
+                self.raw_count += 1
+                metrics.inc("gis_pd_db_rows_written_total", {"table": "raw_data"})
+                return "raw_data"
+        
+        self.writer.submit(write)
+        return True
+    
+    @perf_monitor.timed("db.get_cycle_data")
+    def get_cycle_data(self, limit=100, offset=0):
+        """获取周期数据"""
+        if not self.connected:
+            return []
+            
+        try:
+            self.sync()
+            with self.readers.connection() as conn:
+                return read_latest_cycle_rows(conn, limit, offset, self.decoded_cache)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"获取周期数据错误: {str(e)}")
+            return []
+    
+    @perf_monitor.timed("db.get_raw_data")
+    def get_raw_data(self, limit=100, offset=0):
+        """获取原始数据"""
+        if not self.connected:
+            return []
+            
+        try:
+            self.writer.sync()
+            with self.readers.connection() as conn:
+                return conn.execute(
+                    f"SELECT {RAW_COLUMNS} FROM raw_data ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                    (limit, offset)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"获取原始数据错误: {str(e)}")
+            return []
+    
+    @perf_monitor.timed("db.get_cycle_count")
+    def get_cycle_count(self):
+        """获取周期数据总数（不等待写入队列，不查询数据库，用于状态栏定时刷新）"""
+        if not self.connected:
+            return 0
+        return self.cycle_count + len(self.pending)
+    
+    @perf_monitor.timed("db.get_raw_count")
+    def get_raw_count(self):
+        """获取原始数据总数（不等待写入队列，不查询数据库）"""
+        if not self.connected:
+            return 0
+        return self.raw_count
+    
+    @perf_monitor.timed("db.get_latest_cycle_data")
+    def get_latest_cycle_data(self, count=1):
+        """获取最新的周期数据"""
+        if not self.connected:
+            return []
+            
+        try:
+            self.sync()
+            with self.readers.connection() as conn:
+                return read_latest_cycle_rows(conn, count, cache=self.decoded_cache)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"获取最新周期数据错误: {str(e)}")
+            return []
+    
+    @perf_monitor.timed("db.get_cycle_data_by_time")
+    def get_cycle_data_by_time(self, start_time, end_time):
+        """根据时间范围获取周期数据"""
+        if not self.connected:
+            return []
+            
+        try:
+            self.sync()
+            with self.readers.connection() as conn:
+                return read_cycle_rows_by_time(conn, start_time, end_time, self.decoded_cache)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"根据时间范围获取周期数据错误: {str(e)}")
+            return []
+    
+    @perf_monitor.timed("db.get_raw_data_by_time")
+    def get_raw_data_by_time(self, start_time, end_time):
+        """根据时间范围获取原始数据"""
+        if not self.connected:
+            return []
+            
+        try:
+            self.writer.sync()
+            with self.readers.connection() as conn:
+                return conn.execute(
+                    f"SELECT {RAW_COLUMNS} FROM raw_data WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp",
+                    (start_time, end_time)
+                ).fetchall()
+        except sqlite3.Error as e:
+            print(f"根据时间范围获取原始数据错误: {str(e)}")
+            return []
+    
+    def iter_raw_data(self, start_time=None, end_time=None, chunk_size=500):
+        """按时间顺序分块读取原始数据（生成器）
+        
+        使用独立的只读连接，可以在回放线程中安全调用，
+        并且每次只在内存中保留chunk_size条记录。
+        
+        Yields:
+            (timestamp, topic, raw_data) 元组
+        """
+        if not self.connected:
+            return
+            
+        yield from iter_raw_rows(self.db_path, start_time, end_time, chunk_size)
+    
+    def iter_cycle_batches(self, start_time, end_time, topics=None, batch_size=EXPORT_BATCH_SIZE):
+        """按时间顺序分批读取周期数据，用于导出等后台任务
+        
+        在调用线程中先写入缓存的数据块，返回的生成器使用独立的只读连接，
+        可以在其他线程中迭代，内存占用与数据量无关。
+        
+        Args:
+            topics: 只读取这些主题的周期，为空时读取全部
+        Yields:
+            make_cycle_batch生成的批次
+        """
+        if not self.connected:
+            return iter(())
+        self.sync()
+        return batch_cycle_records(iter_cycle_records(self.db_path, start_time, end_time, topics), batch_size)
+    
+    def maintenance_status(self):
+        """后台维护的状态文本，未启用维护时为空"""
+        return self.maintenance.status_text() if self.maintenance is not None else ""
+    
+    def run_maintenance(self):
+        """请求立即执行一次数据库维护（在后台线程中执行）"""
+        if self.maintenance is not None:
+            self.maintenance.run_now()
+    
+    def close(self):
+        """写入剩余数据后关闭写入线程和只读连接"""
+        if self.connected:
+            if self.maintenance is not None:
+                self.maintenance.stop()
+            self.flush_block()
+            # 先关闭只读连接，写连接最后关闭时执行检查点并删除-wal文件
+            self.readers.close()
+            self.writer.stop()
+            self.connected = False
+            print("数据库连接已关闭")
+
+class PartitionedDatabaseManager:
+    """按时间分区的数据库管理类
+    
+    每个分区（一天或一周）是分区目录下的一个独立SQLite文件，表结构与DatabaseManager相同。
+    目录库catalog.db记录每个分区的时间范围、文件名、状态和记录数。
+    写入总是进入当前时间所在的分区（热分区文件很小），跨越分区边界时自动滚动；
+    超出保留数量的旧分区直接删除文件或移动到archive目录，无需DELETE和VACUUM。
+    查询接口与DatabaseManager一致，按时间范围查询时只打开相关的分区。
+    长期趋势数据需要保存数月，不放在分区中，而是保存在分区目录下单独的trends.db。
+    """
+    PERIODS = ("day", "week")
+    RETENTION_ACTIONS = ("delete", "archive")
+    
+    def __init__(self, dir_name="gis_pd_data", period="day", retention=30, retention_action="delete",
+                 codec=None, derive_cycles=False):
+        """
+        Args:
+            dir_name: 分区目录（相对路径时位于应用程序目录下）
+            period: 分区周期，"day"或"week"
+            retention: 保留的分区数量（包括当前分区），0表示不限制
+            retention_action: 超出保留数量的分区的处理方式，"delete"或"archive"
+            codec: 周期数据压缩方式，None、"zlib"或"lzma"
+            derive_cycles: 单次写入模式，只保存原始帧，周期数据在查询时解码
+        """
+        if period not in self.PERIODS:
+            raise ValueError(f"不支持的分区周期: {period}")
+        if retention_action not in self.RETENTION_ACTIONS:
+            raise ValueError(f"不支持的保留策略: {retention_action}")
+        
+        self.period = period
+        self.retention = retention
+        self.retention_action = retention_action
+        self.codec = codec
+        self.derive_cycles = derive_cycles
+        self.partition_dir = os.path.join(get_application_path(), dir_name)
+        self.archive_dir = os.path.join(self.partition_dir, "archive")
+        self.db_path = self.partition_dir  # 用于界面显示
+        print(f"分区数据库目录: {self.partition_dir}")
+        
+        self.catalog = None
+        self.connected = False
+        self.active_key = None  # 当前分区的键，例如"20250626"或"2025W26"
+        self.active_end = None  # 当前分区的结束时间（不含）
+        self.active_db = None  # 当前分区的DatabaseManager
+        self.trend_db = None  # 趋势数据的DatabaseManager（trends.db）
+        
+        try:
+            os.makedirs(self.partition_dir, exist_ok=True)
+            self.catalog = sqlite3.connect(os.path.join(self.partition_dir, "catalog.db"),
+                                           check_same_thread=False)
+            self.catalog.execute('''
+                CREATE TABLE IF NOT EXISTS partitions (
+                    period_key TEXT PRIMARY KEY,
+                    start_time TEXT NOT NULL,
+                    end_time TEXT NOT NULL,
+                    file_name TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'active',
+                    cycle_count INTEGER NOT NULL DEFAULT 0,
+                    raw_count INTEGER NOT NULL DEFAULT 0,
+                    created_at TEXT NOT NULL
+                )
+            ''')
+            self.catalog.commit()
+            self.trend_db = DatabaseManager(os.path.join(self.partition_dir, "trends.db"))
+            self.connected = True
+            self.rollover(datetime.datetime.now())
+        except (sqlite3.Error, OSError) as e:
+            print(f"分区数据库初始化错误: {str(e)}")
+    
+    def period_bounds(self, moment):
+        """计算moment所在分区的键、开始时间和结束时间（不含）"""
+        day_start = datetime.datetime(moment.year, moment.month, moment.day)
+        if self.period == "day":
+            return day_start.strftime("%Y%m%d"), day_start, day_start + datetime.timedelta(days=1)
+        week_start = day_start - datetime.timedelta(days=day_start.weekday())
+        iso_year, iso_week, _ = week_start.isocalendar()
+        return f"{iso_year}W{iso_week:02d}", week_start, week_start + datetime.timedelta(days=7)
+    
+    def rollover(self, moment):
+        """切换到moment所在的分区，必要时创建新分区文件并执行保留策略"""
+        key, start, end = self.period_bounds(moment)
+        if key == self.active_key and self.active_db is not None:
+            return
+        
+        # 关闭旧分区并记录最终的记录数
+        if self.active_db is not None:
+            self.update_partition_counts(self.active_key, self.active_db)
+            self.active_db.close()
+            self.active_db = None
+        
+        file_name = f"gis_pd_{key}.db"
+        self.catalog.execute(
+            "INSERT OR IGNORE INTO partitions (period_key, start_time, end_time, file_name, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (key, start.strftime(TIMESTAMP_FORMAT), end.strftime(TIMESTAMP_FORMAT), file_name,
+             datetime.datetime.now().strftime(TIMESTAMP_FORMAT))
+        )
+        self.catalog.commit()
+        
+        self.active_db = DatabaseManager(os.path.join(self.partition_dir, file_name), codec=self.codec,
+                                         derive_cycles=self.derive_cycles)
+        self.active_key = key
+        self.active_end = end
+        self.apply_retention()
+    
+    def update_partition_counts(self, key, db):
+        """将分区的记录数写入目录库，避免统计时打开所有分区"""
+        try:
+            db.sync()
+            self.catalog.execute(
+                "UPDATE partitions SET cycle_count = ?, raw_count = ? WHERE period_key = ?",
+                (db.get_cycle_count(), db.get_raw_count(), key)
+            )
+            self.catalog.commit()
+        except sqlite3.Error as e:
+            print(f"更新分区目录错误: {str(e)}")
+    
+    def apply_retention(self):
+        """删除或归档超出保留数量的旧分区"""
+        if self.retention <= 0:
+            return
+        rows = self.catalog.execute(
+            "SELECT period_key, file_name FROM partitions WHERE status = 'active' "
+            "ORDER BY start_time DESC"
+        ).fetchall()
+        for key, file_name in rows[self.retention:]:
+            if key == self.active_key:
+                continue
+            path = os.path.join(self.partition_dir, file_name)
+            try:
+                if self.retention_action == "archive":
+                    os.makedirs(self.archive_dir, exist_ok=True)
+                    if os.path.exists(path):
+                        shutil.move(path, os.path.join(self.archive_dir, file_name))
+                    self.catalog.execute("UPDATE partitions SET status = 'archived' WHERE period_key = ?", (key,))
+                    print(f"已归档分区: {file_name}")
+                else:
+                    for suffix in ("", "-wal", "-shm", "-journal"):
+                        if os.path.exists(path + suffix):
+                            os.remove(path + suffix)
+                    self.catalog.execute("DELETE FROM partitions WHERE period_key = ?", (key,))
+                    print(f"已删除分区: {file_name}")
+                self.catalog.commit()
+            except (OSError, sqlite3.Error) as e:
+                print(f"处理过期分区错误: {str(e)}")
+    
+    def list_partitions(self):
+        """获取目录库中的所有分区信息"""
+        if not self.connected:
+            return []
+        return self.catalog.execute(
+            "SELECT period_key, start_time, end_time, file_name, status, cycle_count, raw_count "
+            "FROM partitions ORDER BY start_time"
+        ).fetchall()
+    
+    def partitions_for_range(self, start_time=None, end_time=None, newest_first=False):
+        """获取与时间范围重叠的在线分区文件路径"""
+        sql = "SELECT period_key, file_name FROM partitions WHERE status = 'active'"
+        params = []
+        if start_time is not None and end_time is not None:
+            sql += " AND start_time <= ? AND end_time > ?"
+            params = [end_time, start_time]
+        sql += " ORDER BY start_time DESC" if newest_first else " ORDER BY start_time"
+        rows = self.catalog.execute(sql, params).fetchall()
+        return [(key, os.path.join(self.partition_dir, file_name)) for key, file_name in rows]
+    
+    def query_partition(self, path, reader):
+        """在指定分区上执行只读查询，reader接收数据库连接并返回结果行"""
+        if not os.path.exists(path):
+            return []
+        try:
+            conn = connect_readonly(path)
+        except sqlite3.Error as e:
+            print(f"打开分区错误 {os.path.basename(path)}: {str(e)}")
+            return []
+        try:
+            return reader(conn)
+        except (sqlite3.Error, ValueError) as e:
+            print(f"查询分区错误 {os.path.basename(path)}: {str(e)}")
+            return []
+        finally:
+            conn.close()
+    
+    def query_latest(self, reader, limit, offset=0):
+        """从最新的分区开始，依次读取直到满足limit条
+        
+        reader(conn, n)返回该分区中最新的n条记录（按时间倒序）
+        """
+        results = []
+        skip = offset
+        self.active_db.sync()
+        for _, path in self.partitions_for_range(newest_first=True):
+            if len(results) >= limit:
+                break
+            needed = limit - len(results) + skip
+            rows = self.query_partition(path, lambda conn: reader(conn, needed))
+            if skip:
+                dropped = min(skip, len(rows))
+                rows = rows[dropped:]
+                skip -= dropped
+            results.extend(rows[:limit - len(results)])
+        return results
+    
+    def query_range(self, reader, start_time, end_time):
+        """查询时间范围内的数据，按时间顺序合并各分区的结果
+        
+        reader(conn, start_time, end_time)返回该分区中时间范围内的记录
+        """
+        results = []
+        self.active_db.sync()
+        for _, path in self.partitions_for_range(start_time, end_time):
+            results.extend(self.query_partition(path, lambda conn: reader(conn, start_time, end_time)))
+        return results
+    
+    @staticmethod
+    def read_latest_raw_rows(conn, limit):
+        return conn.execute(f"SELECT {RAW_COLUMNS} FROM raw_data ORDER BY timestamp DESC LIMIT ?",
+                            (limit,)).fetchall()
+    
+    @staticmethod
+    def read_raw_rows_by_time(conn, start_time, end_time):
+        return conn.execute(
+            f"SELECT {RAW_COLUMNS} FROM raw_data WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp",
+            (start_time, end_time)
+        ).fetchall()
+    
+    def ensure_partition(self):
+        """写入前检查是否需要滚动到新分区，返回当前时间戳"""
+        now = datetime.datetime.now()
+        if self.active_end is None or now >= self.active_end:
+            self.rollover(now)
+        return now.strftime(TIMESTAMP_FORMAT)
+    
+    def save_cycle_data(self, cycle_number, data, topic=None, frame=None):
+        """保存周期数据到当前分区"""
+        if not self.connected:
+            return
+        timestamp = self.ensure_partition()
+        return self.active_db.save_cycle_data(cycle_number, data, timestamp=timestamp, topic=topic, frame=frame)
+    
+    def save_raw_data(self, broker, topic, raw_data, frame=None, shift=0):
+        """保存原始数据到当前分区"""
+        if not self.connected:
+            return
+        timestamp = self.ensure_partition()
+        return self.active_db.save_raw_data(broker, topic, raw_data, timestamp=timestamp, frame=frame, shift=shift)
+    
+    def save_event(self, event):
+        """保存触发事件到当前分区（跨越分区边界的事件整体保存在新分区）"""
+        if not self.connected:
+            return
+        self.ensure_partition()
+        return self.active_db.save_event(event)
+    
+    def get_trigger_events(self, limit=100, start_time=None, end_time=None):
+        """获取触发事件（跨分区，按触发时间倒序）"""
+        if not self.connected:
+            return []
+        results = []
+        self.active_db.sync()
+        for _, path in self.partitions_for_range(start_time, end_time, newest_first=True):
+            if len(results) >= limit:
+                break
+            remaining = limit - len(results)
+            results.extend(self.query_partition(
+                path, lambda conn: read_trigger_events(conn, remaining, start_time, end_time)))
+        return results
+    
+    def save_alarm_event(self, event):
+        """保存报警事件到当前分区"""
+        if not self.connected:
+            return
+        self.ensure_partition()
+        return self.active_db.save_alarm_event(event)
+    
+    def get_alarm_events(self, limit=100, start_time=None, end_time=None):
+        """获取报警事件（跨分区，按时间倒序）"""
+        if not self.connected:
+            return []
+        results = []
+        self.active_db.sync()
+        for _, path in self.partitions_for_range(start_time, end_time, newest_first=True):
+            if len(results) >= limit:
+                break
+            remaining = limit - len(results)
+            results.extend(self.query_partition(
+                path, lambda conn: read_alarm_events(conn, remaining, start_time, end_time)))
+        return results
+    
+    def save_trend_rows(self, rows):
+        """保存趋势数据（trends.db，不受分区保留策略影响）"""
+        if not self.connected:
+            return
+        return self.trend_db.save_trend_rows(rows)
+    
+    def prune_trend_rows(self, before):
+        if not self.connected:
+            return
+        return self.trend_db.prune_trend_rows(before)
+    
+    def get_trend_rows(self, level, topic, start_time, end_time):
+        """获取趋势数据（trends.db）"""
+        if not self.connected:
+            return []
+        return self.trend_db.get_trend_rows(level, topic, start_time, end_time)
+    
+    def get_trend_topics(self):
+        if not self.connected:
+            return []
+        return self.trend_db.get_trend_topics()
+    
+    @perf_monitor.timed("db.get_cycle_data")
+    def get_cycle_data(self, limit=100, offset=0):
+        """获取周期数据（跨分区）"""
+        if not self.connected:
+            return []
+        return self.query_latest(read_latest_cycle_rows, limit, offset)
+    
+    @perf_monitor.timed("db.get_raw_data")
+    def get_raw_data(self, limit=100, offset=0):
+        """获取原始数据（跨分区）"""
+        if not self.connected:
+            return []
+        return self.query_latest(self.read_latest_raw_rows, limit, offset)
+    
+    def get_total_count(self, column, active_count):
+        """已关闭分区的记录数来自目录库，当前分区实时统计"""
+        row = self.catalog.execute(
+            f"SELECT COALESCE(SUM({column}), 0) FROM partitions WHERE status = 'active' AND period_key != ?",
+            (self.active_key,)
+        ).fetchone()
+        return row[0] + active_count
+    
+    def get_cycle_count(self):
+        """获取周期数据总数（在线分区）"""
+        if not self.connected:
+            return 0
+        return self.get_total_count("cycle_count", self.active_db.get_cycle_count())
+    
+    def get_raw_count(self):
+        """获取原始数据总数（在线分区）"""
+        if not self.connected:
+            return 0
+        return self.get_total_count("raw_count", self.active_db.get_raw_count())
+    
+    @perf_monitor.timed("db.get_latest_cycle_data")
+    def get_latest_cycle_data(self, count=1):
+        """获取最新的周期数据（跨分区）"""
+        if not self.connected:
+            return []
+        return self.query_latest(read_latest_cycle_rows, count)
+    
+    @perf_monitor.timed("db.get_cycle_data_by_time")
+    def get_cycle_data_by_time(self, start_time, end_time):
+        """根据时间范围获取周期数据（只打开相关分区）"""
+        if not self.connected:
+            return []
+        return self.query_range(read_cycle_rows_by_time, start_time, end_time)
+    
+    @perf_monitor.timed("db.get_raw_data_by_time")
+    def get_raw_data_by_time(self, start_time, end_time):
+        """根据时间范围获取原始数据（只打开相关分区）"""
+        if not self.connected:
+            return []
+        return self.query_range(self.read_raw_rows_by_time, start_time, end_time)
+    
+    @perf_monitor.timed("db.find_cycles")
+    def find_cycles(self, min_peak=None, min_pulses=None, start_time=None, end_time=None, limit=1000):
+        """按特征值筛选周期数据（跨分区，按时间顺序）"""
+        if not self.connected:
+            return []
+        results = []
+        self.active_db.sync()
+        for _, path in self.partitions_for_range(start_time, end_time):
+            if len(results) >= limit:
+                break
+            remaining = limit - len(results)
+            results.extend(self.query_partition(
+                path, lambda conn: find_cycle_rows(conn, min_peak, min_pulses, start_time, end_time, remaining)))
+        return results
+    
+    def iter_raw_data(self, start_time=None, end_time=None, chunk_size=500):
+        """按时间顺序分块读取原始数据（跨分区）
+        
+        在调用线程中查询目录库得到分区文件，返回的生成器只使用各分区的独立只读连接，
+        可以在回放线程中迭代。
+        """
+        if not self.connected:
+            return iter(())
+        paths = [path for _, path in self.partitions_for_range(start_time, end_time)]
+        return (row for path in paths for row in iter_raw_rows(path, start_time, end_time, chunk_size))
+    
+    def iter_cycle_batches(self, start_time, end_time, topics=None, batch_size=EXPORT_BATCH_SIZE):
+        """按时间顺序分批读取周期数据（跨分区，依次读取各分区文件）"""
+        if not self.connected:
+            return iter(())
+        self.active_db.sync()
+        paths = [path for _, path in self.partitions_for_range(start_time, end_time)]
+        records = (record for path in paths if os.path.exists(path)
+                   for record in iter_cycle_records(path, start_time, end_time, topics))
+        return batch_cycle_records(records, batch_size)
+    
+    def maintenance_status(self):
+        """当前分区的后台维护状态（已关闭的分区不再写入，无需维护）"""
+        return self.active_db.maintenance_status() if self.active_db is not None else ""
+    
+    def run_maintenance(self):
+        if self.active_db is not None:
+            self.active_db.run_maintenance()
+    
+    def flush_expired(self):
+        if self.active_db is not None:
+            self.active_db.flush_expired()
+    
+    def close(self):
+        """关闭当前分区和目录库"""
+        if not self.connected:
+            return
+        try:
+            if self.active_db is not None:
+                self.update_partition_counts(self.active_key, self.active_db)
+                self.active_db.close()
+                self.active_db = None
+            self.trend_db.close()
+            self.catalog.close()
+            self.connected = False
+            print("分区数据库已关闭")
+        except sqlite3.Error as e:
+            print(f"关闭分区数据库错误: {str(e)}")
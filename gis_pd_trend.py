@@ -0,0 +1,202 @@
+"""长期趋势
+
+TrendAggregator把实时周期按传感器聚合为每秒、每分钟和每小时一行的趋势数据:
+    cycles       周期数
+    peak_max     周期峰值的最大值(mV)
+    peak_mean    周期峰值的平均值(mV)
+    peak_p95     周期峰值的95%分位数(mV)
+    pulse_count  脉冲数之和（与cycle_summary中每个周期的pulse_count相同的判定方法）
+    classes      放电类型识别结果的直方图（各类别的识别次数，约每秒一次），JSON文本
+周期只在内存中暂存到当前秒结束，然后一次向量化计算特征并累加到三个聚合级别；
+95%分位数由0.01mV分辨率的幅值直方图计算（与解码后保留两位小数的精度相同），
+分钟和小时的直方图是每秒直方图之和，不需要保存周期数据。
+
+聚合结果保存在数据库的trend_data表中（见gis_pd_storage），趋势图只读取聚合行，
+不读取周期数据。按时间范围自动选择聚合级别，显示数月的数据也只需读取几千行。
+"""
+import json
+import time
+
+import numpy as np
+
+from gis_pd_storage import compute_cycle_features
+
+# 聚合级别名称 -> 聚合周期(秒)
+TREND_LEVELS = {"second": 1, "minute": 60, "hour": 3600}
+TREND_LEVEL_NAMES = {"second": "每秒", "minute": "每分钟", "hour": "每小时"}
+# 各级别趋势数据的保留时间(秒)，None表示一直保留
+TREND_RETENTION = {"second": 7 * 86400, "minute": 400 * 86400, "hour": None}
+TREND_COLUMNS = ("start_time", "cycles", "peak_max", "peak_mean", "peak_p95", "pulse_count", "classes")
+
+AMPLITUDE_RESOLUTION = 0.01  # 分位数直方图的分辨率(mV)
+AMPLITUDE_BINS = 331  # 0~3.3mV（12位ADC的满量程），更大的值计入最后一个区间
+TREND_PERCENTILE = 0.95
+MAX_CHART_POINTS = 5000  # 自动选择聚合级别时每条曲线的最大点数
+
+
+def amplitude_histogram(peaks):
+    """周期峰值的直方图（AMPLITUDE_RESOLUTION分辨率）"""
+    index = np.clip(np.rint(np.asarray(peaks) / AMPLITUDE_RESOLUTION).astype(np.int64), 0, AMPLITUDE_BINS - 1)
+    return np.bincount(index, minlength=AMPLITUDE_BINS)
+
+
+def histogram_percentile(histogram, fraction=TREND_PERCENTILE):
+    """由直方图计算分位数（不小于该比例的样本不超过返回值）"""
+    cumulative = np.cumsum(histogram)
+    if not cumulative[-1]:
+        return None
+    index = int(np.searchsorted(cumulative, fraction * cumulative[-1], side="left"))
+    return index * AMPLITUDE_RESOLUTION
+
+
+def choose_level(span):
+    """按显示的时间范围(秒)选择聚合级别，使点数不超过MAX_CHART_POINTS"""
+    for name, seconds in TREND_LEVELS.items():
+        if span / seconds <= MAX_CHART_POINTS:
+            return name
+    return "hour"
+
+
+class TrendBucket:
+    """一个聚合级别当前时间段的累加值"""
+    def __init__(self, level):
+        self.level = level
+        self.start = None  # 时间段开始的Unix时间（整秒）
+        self.reset(None)
+
+    def reset(self, start):
+        self.start = start
+        self.cycles = 0
+        self.peak_max = 0.0
+        self.peak_sum = 0.0
+        self.pulse_count = 0
+        self.histogram = np.zeros(AMPLITUDE_BINS, dtype=np.int64)
+        self.classes = {}
+
+    def add(self, peaks, pulse_count, histogram, classes):
+        if len(peaks):
+            self.peak_max = max(self.peak_max, float(peaks.max()))
+            self.peak_sum += float(peaks.sum())
+            self.cycles += len(peaks)
+            self.pulse_count += int(pulse_count.sum())
+            self.histogram += histogram
+        for label, count in classes.items():
+            self.classes[label] = self.classes.get(label, 0) + count
+
+    def row(self, topic):
+        """数据库行(级别, 主题, 开始时间, 周期数, 峰值最大值, 峰值平均值, 峰值95%分位数, 脉冲数, 类别直方图)"""
+        return (self.level, topic, self.start, self.cycles, self.peak_max,
+                self.peak_sum / self.cycles if self.cycles else None,
+                histogram_percentile(self.histogram), self.pulse_count,
+                json.dumps(self.classes, ensure_ascii=False) if self.classes else "")
+
+
+class TopicTrend:
+    """单个传感器的待聚合数据和各级别的当前时间段"""
+    def __init__(self):
+        self.second = None  # 待聚合周期所在的秒
+        self.pending = []  # 当前秒的周期数据
+        self.pending_classes = {}  # 上次聚合以来的识别结果 {类别: 次数}
+        self.buckets = {name: TrendBucket(seconds) for name, seconds in TREND_LEVELS.items()}
+
+
+class TrendAggregator:
+    """按传感器（MQTT主题）聚合趋势数据，在调用线程中使用
+
+    add_cycle只把周期加入当前秒的待处理列表；take_rows（约每秒调用一次）返回已经结束的时间段的行。
+    """
+    def __init__(self):
+        self.topics = {}  # 主题 -> TopicTrend
+        self.rows = []  # 已结束、等待保存的行
+
+    def topic_trend(self, topic):
+        topic = topic or ""
+        trend = self.topics.get(topic)
+        if trend is None:
+            trend = self.topics[topic] = TopicTrend()
+        return trend
+
+    def add_cycle(self, topic, data, now=None):
+        """加入一个周期（mV数据）"""
+        now = time.time() if now is None else now
+        second = int(now)
+        trend = self.topic_trend(topic)
+        if trend.second != second:
+            self.fold(topic or "", trend)
+            trend.second = second
+        trend.pending.append(data)
+
+    def add_classification(self, results):
+        """加入放电类型识别结果{主题: (类别, 置信度)}，类别为None（脉冲数不足）的不计入"""
+        for topic, (label, _) in results.items():
+            if label is not None:
+                classes = self.topic_trend(topic).pending_classes
+                classes[label] = classes.get(label, 0) + 1
+
+    def fold(self, topic, trend):
+        """把待处理的周期和识别结果累加到各级别，时间段变化时先结束旧的时间段"""
+        if trend.second is None:
+            return
+        if trend.pending:
+            peaks, _, _, pulse_count, _ = compute_cycle_features(self.pending_matrix(trend.pending))
+        else:
+            peaks = pulse_count = np.empty(0)
+        histogram = amplitude_histogram(peaks)
+        for bucket in trend.buckets.values():
+            start = trend.second - trend.second % bucket.level
+            if bucket.start != start:
+                self.finish(topic, bucket)
+                bucket.reset(start)
+            bucket.add(peaks, pulse_count, histogram, trend.pending_classes)
+        trend.pending = []
+        trend.pending_classes = {}
+
+    @staticmethod
+    def pending_matrix(pending):
+        """待处理周期组成的矩阵，长度不同的周期补齐到最短的长度（同一传感器的周期长度通常相同）"""
+        length = min(len(data) for data in pending)
+        return np.array([data[:length] for data in pending], dtype=np.float64)
+
+    def finish(self, topic, bucket):
+        if bucket.start is not None and (bucket.cycles or bucket.classes):
+            self.rows.append(bucket.row(topic))
+
+    def take_rows(self, now=None):
+        """结束当前秒之前的待处理数据，返回所有已结束的时间段的行并清空"""
+        now = time.time() if now is None else now
+        second = int(now)
+        for topic, trend in self.topics.items():
+            if trend.second is not None and trend.second < second:
+                self.fold(topic, trend)
+                trend.second = None
+            for bucket in trend.buckets.values():
+                if bucket.start is not None and bucket.start + bucket.level <= second:
+                    self.finish(topic, bucket)
+                    bucket.reset(None)
+        rows, self.rows = self.rows, []
+        return rows
+
+    def flush(self):
+        """结束所有时间段（包括未结束的），返回所有行（关闭程序时调用）"""
+        for topic, trend in self.topics.items():
+            self.fold(topic, trend)
+            trend.second = None
+            for bucket in trend.buckets.values():
+                self.finish(topic, bucket)
+                bucket.reset(None)
+        rows, self.rows = self.rows, []
+        return rows
+
+    def clear(self):
+        self.topics.clear()
+        self.rows = []
+
+
+def trend_arrays(rows):
+    """把查询到的趋势行(TREND_COLUMNS顺序)转换为各列的数组，classes为{类别: 次数}的列表"""
+    if not rows:
+        return {name: np.empty(0) for name in TREND_COLUMNS}
+    columns = list(zip(*rows))
+    result = {name: np.array(column, dtype=np.float64) for name, column in zip(TREND_COLUMNS[:-1], columns)}
+    result["classes"] = [json.loads(text) if text else {} for text in columns[-1]]
+    return result
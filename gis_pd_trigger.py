@@ -0,0 +1,154 @@
+"""触发记录
+
+只保存局部放电发生前后的数据：每个传感器（MQTT主题）在内存中保留最近pre_cycles个周期，
+某个周期满足触发条件时开始记录事件，之后的周期都加入事件，直到连续post_cycles个周期
+不再满足触发条件（期间再次触发时重新计数）。事件结束后，触发前的周期、事件期间和触发后的
+周期作为一个事件记录交给sink（数据库管理器的save_event），全部为完整分辨率的周期数据。
+
+触发条件（任一满足即触发，阈值为None的条件不使用）：
+    峰值      周期峰值 >= peak_threshold (mV)
+    脉冲数    周期脉冲数 >= min_pulses（脉冲判定与compute_cycle_features相同）
+    变化率    峰值比同一传感器上一周期增加 >= max_rise (mV/周期)
+
+事件记录为dict：
+    topic, trigger_time(触发周期的时间戳), reason(首次触发的条件), pre_cycles, post_cycles,
+    peak(事件期间的最大峰值), timestamps, cycle_numbers, values(形状(周期数, 采样点数)的mV数组)
+"""
+import datetime
+from collections import deque
+
+import numpy as np
+
+from gis_pd_metrics import metrics  # Prometheus指标
+from gis_pd_storage import TIMESTAMP_FORMAT, compute_cycle_features
+
+# 触发条件 -> 显示名称
+TRIGGER_REASONS = {"peak": "峰值", "pulses": "脉冲数", "rise": "变化率"}
+MAX_EVENT_CYCLES = 3000  # 持续放电时单个事件的最大周期数，达到后保存并开始新的事件
+
+
+class SensorTrigger:
+    """单个传感器的触发状态"""
+    def __init__(self, pre_cycles):
+        self.history = deque(maxlen=pre_cycles)  # 触发前的周期: (时间戳, 周期编号, mV数组)
+        self.event = None  # 正在记录的事件，未触发时为None
+        self.quiet = 0  # 事件中连续未满足触发条件的周期数
+        self.last_peak = None
+
+
+class TriggeredRecorder:
+    """触发记录器，在调用线程（界面主线程）中使用"""
+    def __init__(self, sink, pre_cycles=50, post_cycles=50, peak_threshold=None, min_pulses=None,
+                 max_rise=None, max_event_cycles=MAX_EVENT_CYCLES):
+        """
+        Args:
+            sink: 保存事件的函数，参数为事件记录
+            pre_cycles: 触发前保留的周期数
+            post_cycles: 连续多少个周期不满足触发条件后结束事件
+            peak_threshold: 峰值阈值(mV)
+            min_pulses: 脉冲数阈值
+            max_rise: 峰值变化率阈值(mV/周期)
+        """
+        self.sink = sink
+        self.pre_cycles = pre_cycles
+        self.post_cycles = post_cycles
+        self.peak_threshold = peak_threshold
+        self.min_pulses = min_pulses
+        self.max_rise = max_rise
+        self.max_event_cycles = max(max_event_cycles, pre_cycles + 1)
+        self.sensors = {}  # 主题 -> SensorTrigger
+        self.cycle_count = 0  # 收到的周期数
+        self.saved_cycles = 0  # 已保存的周期数
+        self.event_count = 0
+
+    def check(self, peak, pulse_count, last_peak):
+        """返回满足的触发条件，不满足时返回None"""
+        if self.peak_threshold is not None and peak >= self.peak_threshold:
+            return "peak"
+        if self.min_pulses is not None and pulse_count >= self.min_pulses:
+            return "pulses"
+        if self.max_rise is not None and last_peak is not None and peak - last_peak >= self.max_rise:
+            return "rise"
+        return None
+
+    def add_cycle(self, topic, cycle_number, data, timestamp=None):
+        """加入一个周期，事件结束时保存事件并返回事件记录，否则返回None"""
+        topic = topic or ""
+        if timestamp is None:
+            timestamp = datetime.datetime.now().strftime(TIMESTAMP_FORMAT)
+        values = np.asarray(data, dtype=np.float64)
+        peak, _, _, pulse_count, _ = (column[0] for column in compute_cycle_features(values))
+        self.cycle_count += 1
+
+        sensor = self.sensors.get(topic)
+        if sensor is None:
+            sensor = self.sensors[topic] = SensorTrigger(self.pre_cycles)
+        reason = self.check(peak, pulse_count, sensor.last_peak)
+        sensor.last_peak = peak
+
+        finished = None
+        # 同一事件中的周期长度必须相同（保存为一个数据块）
+        if sensor.event is not None and len(values) != len(sensor.event["cycles"][0][2]):
+            finished = self.finish(topic, sensor)
+        if sensor.history and len(values) != len(sensor.history[0][2]):
+            sensor.history.clear()
+
+        cycle = (timestamp, cycle_number, values)
+        if sensor.event is None:
+            if reason is None:
+                sensor.history.append(cycle)
+                return finished
+            sensor.event = {
+                "topic": topic,
+                "trigger_time": timestamp,
+                "reason": reason,
+                "pre_cycles": len(sensor.history),
+                "peak": peak,
+                "cycles": list(sensor.history) + [cycle],
+            }
+            sensor.history.clear()
+            sensor.quiet = 0
+        else:
+            sensor.event["cycles"].append(cycle)
+            sensor.event["peak"] = max(sensor.event["peak"], peak)
+            sensor.quiet = 0 if reason is not None else sensor.quiet + 1
+
+        if sensor.quiet >= self.post_cycles or len(sensor.event["cycles"]) >= self.max_event_cycles:
+            return self.finish(topic, sensor)
+        return finished
+
+    def finish(self, topic, sensor):
+        """结束传感器当前的事件并交给sink保存"""
+        pending, sensor.event = sensor.event, None
+        cycles = pending.pop("cycles")
+        pending["post_cycles"] = sensor.quiet
+        pending["timestamps"] = [cycle[0] for cycle in cycles]
+        pending["cycle_numbers"] = [cycle[1] for cycle in cycles]
+        pending["values"] = np.stack([cycle[2] for cycle in cycles])
+        sensor.quiet = 0
+
+        self.event_count += 1
+        self.saved_cycles += len(cycles)
+        metrics.inc("gis_pd_trigger_events_total", {"topic": topic, "reason": pending["reason"]})
+        try:
+            self.sink(pending)
+        except Exception as e:
+            print(f"保存触发事件错误: {str(e)}")
+        return pending
+
+    def flush(self):
+        """保存所有正在记录的事件（停止保存、切换存储或关闭程序前调用），返回保存的事件数"""
+        count = 0
+        for topic, sensor in self.sensors.items():
+            if sensor.event is not None:
+                self.finish(topic, sensor)
+                count += 1
+        return count
+
+    def status_text(self):
+        """状态栏显示的触发记录统计"""
+        recording = sum(1 for sensor in self.sensors.values() if sensor.event is not None)
+        text = f"触发记录: {self.event_count}个事件, 已保存{self.saved_cycles}/{self.cycle_count}个周期"
+        if recording:
+            text += f", {recording}个传感器记录中"
+        return text